@@ -0,0 +1,134 @@
+"""Benchmark the /api/analyze result serialization path.
+
+Compares the legacy ``sanitize_for_json`` + ``json.dumps`` path with
+:func:`services.serialization.dumps` on a payload shaped like a real analysis
+result (50 performance-trend rows, a 35-minute timeline series and a full
+10-player heatmap).
+
+Run from ``apps/api``::
+
+    python -m benchmarks.serialization
+"""
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.serialization import dumps, orjson, sanitize_for_json
+
+FRAMES = 35
+MATCHES = 50
+
+
+def build_payload(seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+
+    trends = pd.DataFrame({
+        "kda": rng.gamma(2.0, 1.5, MATCHES),
+        "visionScore": rng.integers(5, 80, MATCHES),
+        "killParticipation": rng.random(MATCHES),
+        "win": rng.integers(0, 2, MATCHES),
+        "gameCreation": rng.integers(1_700_000_000_000, 1_710_000_000_000, MATCHES),
+        "aggressionScore": rng.random(MATCHES) * 100,
+        "visionDominance": rng.random(MATCHES) * 150,
+        "jungleInvasionPressure": rng.random(MATCHES) * 40,
+        "goldPerMinute": rng.normal(400, 60, MATCHES),
+        "damagePerMinute": rng.normal(600, 150, MATCHES),
+    })
+    trends.loc[::7, "killParticipation"] = np.nan
+
+    timeline = [
+        {
+            "minute": m,
+            "goldDelta": float(rng.normal(0, 500)),
+            "xpDelta": float(rng.normal(0, 400)),
+            "myGold": int(500 + 400 * m),
+            "avgGold": 500.0 + 390.0 * m,
+            "myXp": int(300 * m),
+            "avgXp": 290.0 * m,
+            "enemyGold": int(500 + 380 * m),
+            "enemyXp": int(280 * m),
+            "laneGoldDelta": int(20 * m),
+            "laneXpDelta": int(10 * m),
+        }
+        for m in range(FRAMES)
+    ]
+
+    heatmap = {
+        "participants": [
+            {
+                "participantId": pid,
+                "championName": f"Champion{pid}",
+                "teamId": 100 if pid <= 5 else 200,
+                "positions": [
+                    {
+                        "x": int(rng.integers(0, 14800)),
+                        "y": int(rng.integers(0, 14800)),
+                        "timestamp": f * 60000,
+                        "totalGold": 500 + 350 * f,
+                        "goldDelta": int(rng.integers(0, 600)),
+                    }
+                    for f in range(FRAMES)
+                ],
+            }
+            for pid in range(1, 11)
+        ],
+        "kill_events": [
+            {"x": 7000, "y": 7000, "killerId": 1, "victimId": 6,
+             "assistingParticipantIds": [2, 3], "timestamp": 60000 * k}
+            for k in range(30)
+        ],
+        "ward_events": [
+            {"x": 5000, "y": 9000, "wardType": "YELLOW_TRINKET", "creatorId": 4, "timestamp": 30000 * w}
+            for w in range(120)
+        ],
+    }
+
+    weighted = {f"feature_{i}": np.float64(rng.random()) for i in range(70)}
+    weighted["missing"] = np.float64("nan")
+
+    return {
+        "type": "result",
+        "data": {
+            "status": "success",
+            "weighted_averages": weighted,
+            "last_match_stats": {f"stat_{i}": np.float64(rng.random() * 100) for i in range(120)},
+            "match_timeline_series": {"timeline": timeline},
+            "performance_trends": trends.to_dict(orient="records"),
+            "win_probability": np.float64(57.3),
+            "heatmap_data": heatmap,
+        },
+    }
+
+
+def legacy_dumps(obj) -> bytes:
+    return (json.dumps(sanitize_for_json(obj)) + "\n").encode("utf-8")
+
+
+def fast_dumps(obj) -> bytes:
+    return dumps(obj) + b"\n"
+
+
+def bench(fn, payload, seconds: float = 2.0) -> tuple[int, float]:
+    size = len(fn(payload))
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn(payload)
+        n += 1
+    elapsed = time.perf_counter() - start
+    return size, (size * n) / elapsed
+
+
+def main() -> None:
+    payload = build_payload()
+    backend = "orjson" if orjson is not None else "stdlib fallback"
+    print(f"serializer backend: {backend}")
+    for name, fn in (("sanitize+json.dumps", legacy_dumps), ("services.serialization", fast_dumps)):
+        size, rate = bench(fn, payload)
+        print(f"{name:>24}: {size / 1024:8.1f} KiB/payload  {rate / 1e6:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Benchmark match ingestion on SQLite with and without performance mode.
+
+Runs :meth:`services.ingestion.IngestionService.save_matches` from several
+concurrent writers (one session each, like parallel analyses) while readers
+run the match-history query, against a fresh database file per variant:
+
+* ``default``: SQLite's own settings (rollback journal, synchronous=FULL);
+* ``performance``: :data:`database.SQLITE_PRAGMAS` (WAL, synchronous=NORMAL,
+  mmap, larger page cache, busy_timeout).
+
+Run from ``apps/api``::
+
+    python -m benchmarks.sqlite_ingest
+"""
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.future import select
+
+from database import SQLITE_PRAGMAS, Base, enable_sqlite_performance_mode
+from models import Match, Participant
+from services.ingestion import INGEST_BATCH_SIZE, IngestionService
+
+WRITERS = 4
+READERS = 2
+BATCHES_PER_WRITER = 40
+
+
+def build_match(match_id: str, creation: int):
+    participants = [
+        SimpleNamespace(
+            puuid=f"puuid-{pid}", championId=pid, teamId=100 if pid <= 5 else 200, win=pid <= 5,
+            kills=5, deaths=3, assists=7, challenges=SimpleNamespace(goldPerMinute=410.0),
+            totalMinionsKilled=180, visionScore=24.0, totalDamageDealtToChampions=21000,
+            model_dump=lambda pid=pid: {"participantId": pid, "stats": list(range(150))},
+        )
+        for pid in range(1, 11)
+    ]
+    info = SimpleNamespace(
+        platformId="EUW1", gameCreation=creation, gameDuration=1800, gameVersion="14.1.1",
+        queueId=420, participants=participants,
+    )
+    return SimpleNamespace(
+        info=info,
+        metadata=SimpleNamespace(matchId=match_id),
+        model_dump=lambda: {"metadata": {"matchId": match_id}, "frames": list(range(2000))},
+    )
+
+
+async def writer(factory, worker: int, errors: list) -> int:
+    saved = 0
+    for b in range(BATCHES_PER_WRITER):
+        batch = [
+            build_match(f"EUW1_{worker}_{b}_{i}", 1_700_000_000_000 + b * 1000 + i)
+            for i in range(INGEST_BATCH_SIZE)
+        ]
+        async with factory() as db:
+            try:
+                saved += len(await IngestionService(db).save_matches(batch))
+            except OperationalError as e:  # "database is locked" without busy_timeout
+                errors.append(e)
+    return saved
+
+
+async def reader(factory, stop: asyncio.Event) -> int:
+    queries = 0
+    while not stop.is_set():
+        async with factory() as db:
+            try:
+                await db.execute(
+                    select(Match.match_id)
+                    .join(Participant)
+                    .where(Participant.puuid == "puuid-1")
+                    .order_by(Match.game_creation.desc())
+                    .limit(20)
+                )
+                await db.execute(select(func.count()).select_from(Match))
+                queries += 1
+            except OperationalError:
+                pass
+        await asyncio.sleep(0)
+    return queries
+
+
+async def run(performance: bool) -> tuple[int, int, int, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        if performance:
+            enable_sqlite_performance_mode(engine, SQLITE_PRAGMAS)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+
+        errors: list = []
+        stop = asyncio.Event()
+        readers = [asyncio.create_task(reader(factory, stop)) for _ in range(READERS)]
+        start = time.perf_counter()
+        saved = sum(await asyncio.gather(*(writer(factory, w, errors) for w in range(WRITERS))))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        queries = sum(await asyncio.gather(*readers))
+        await engine.dispose()
+    return saved, queries, len(errors), elapsed
+
+
+def main() -> None:
+    total = WRITERS * BATCHES_PER_WRITER * INGEST_BATCH_SIZE
+    print(f"{WRITERS} writers x {BATCHES_PER_WRITER} batches x {INGEST_BATCH_SIZE} matches, {READERS} readers")
+    for name, performance in (("default", False), ("performance", True)):
+        saved, queries, errors, elapsed = asyncio.run(run(performance))
+        print(
+            f"{name:>12}: {saved:5d}/{total} matches  {saved / elapsed:8.1f} matches/s  "
+            f"{queries / elapsed:8.1f} reads/s  {errors} lock errors"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # Try to load .env files for local development (optional)
 try:
     from dotenv import load_dotenv
@@ -32,6 +36,59 @@ elif DATABASE_URL.startswith("postgresql://") and "+asyncpg" not in DATABASE_URL
 
 is_sqlite = DATABASE_URL.startswith("sqlite")
 
+
+
+def _env_int(name: str, default: int, minimum: int) -> int:
+    raw = os.getenv(name, str(default))
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {raw!r}") from None
+    if value < minimum:
+        raise ValueError(f"{name} must be >= {minimum}, got {value}")
+    return value
+
+
+DB_POOL_SIZE = _env_int("DB_POOL_SIZE", 5, 1)            # Base pool connections
+DB_MAX_OVERFLOW = _env_int("DB_MAX_OVERFLOW", 20, 0)     # Extra connections when pool is full
+DB_POOL_RECYCLE = _env_int("DB_POOL_RECYCLE", 300, -1)   # Seconds; -1 disables recycling
+DB_POOL_TIMEOUT = _env_int("DB_POOL_TIMEOUT", 30, 1)     # Seconds to wait for a free connection
+
+# Analyses run at once (the /analyze queue in routers.analysis).  Read here so
+# the pool can be sized for them; an invalid value falls back to the default.
+try:
+    MAX_CONCURRENT_ANALYSES = max(1, int(os.getenv("MAX_CONCURRENT_ANALYSES", "3")))
+except ValueError:
+    MAX_CONCURRENT_ANALYSES = 3
+
+# Sessions one analysis can hold at the same time.  Stages open short-lived
+# sessions around their DB work, so the peak comes after ingestion, when the
+# ranked lookup stores its answer (1) while up to 3 timeline prefetches from
+# ingestion's 3-wide request pool are still storing, the lane-lead stage loads
+# up to 3 timelines and the last-match stage loads 1.  During ingestion it is
+# lower: ingestion itself, the ranked lookup and the prefetch stores.
+SESSIONS_PER_ANALYSIS = 1 + 3 + 3 + 1
+
+
+def check_pool_capacity(pool_size: int, max_overflow: int, max_concurrent_analyses: int) -> int:
+    """``max_overflow``, raised if needed so the pool covers *max_concurrent_analyses*.
+
+    An undersized pool makes analyses wait on each other for connections (up
+    to ``DB_POOL_TIMEOUT`` and then fail), so the overflow is clamped up to
+    the required size with a warning rather than left as configured.
+    """
+    required = max_concurrent_analyses * SESSIONS_PER_ANALYSIS
+    if pool_size + max_overflow >= required:
+        return max_overflow
+    clamped = required - pool_size
+    logger.warning(
+        "DB pool (DB_POOL_SIZE=%d + DB_MAX_OVERFLOW=%d) is smaller than the %d connections "
+        "MAX_CONCURRENT_ANALYSES=%d can hold; raising DB_MAX_OVERFLOW to %d",
+        pool_size, max_overflow, required, max_concurrent_analyses, clamped,
+    )
+    return clamped
+
+
 # Configure engine with connection pooling for PostgreSQL
 engine_kwargs = {
     "echo": os.getenv("SQL_ECHO", "false").lower() == "true",
@@ -41,14 +98,50 @@ engine_kwargs = {
 # Add connection pooling for PostgreSQL (SQLite doesn't support it)
 if not is_sqlite:
     engine_kwargs.update({
-        "pool_size": 5,           # Base pool connections
-        "max_overflow": 10,       # Extra connections when pool is full
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
         "pool_pre_ping": True,    # Health check connections before use
-        "pool_recycle": 300,      # Recycle connections after 5 minutes
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
     })
+    engine_kwargs["max_overflow"] = check_pool_capacity(DB_POOL_SIZE, DB_MAX_OVERFLOW, MAX_CONCURRENT_ANALYSES)
 
 engine = create_async_engine(DATABASE_URL, **engine_kwargs)
 
+
+# SQLite defaults (rollback journal, synchronous=FULL, 2 MB page cache) make
+# concurrent analyses serialize on the database lock.  WAL lets readers run
+# alongside the single writer, NORMAL sync is still crash-safe under WAL, and
+# busy_timeout makes a blocked writer wait instead of failing with
+# "database is locked".  Set SQLITE_PERFORMANCE_MODE=false to keep the defaults.
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("mmap_size", str(_env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024, 0))),
+    ("cache_size", str(-_env_int("SQLITE_CACHE_SIZE_KB", 64 * 1024, 0))),  # negative = KiB
+    ("busy_timeout", str(_env_int("SQLITE_BUSY_TIMEOUT_MS", 5000, 0))),
+    ("temp_store", "MEMORY"),
+)
+
+
+def enable_sqlite_performance_mode(async_engine, pragmas=SQLITE_PRAGMAS) -> None:
+    """Apply *pragmas* to every new DBAPI connection of a SQLite engine.
+
+    Pooled connections are reused, so the pragmas run once per connection.
+    """
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):  # noqa: ANN001
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+if is_sqlite and os.getenv("SQLITE_PERFORMANCE_MODE", "true").lower() != "false":
+    enable_sqlite_performance_mode(engine)
+
 AsyncSessionLocal = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -62,3 +155,12 @@ class Base(DeclarativeBase):
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+
+def get_session_factory():
+    """Dependency for handlers that open short-lived sessions themselves.
+
+    Long streaming requests should not hold one session (and, once a
+    transaction has started, a pooled connection) across Riot API waits.
+    """
+    return AsyncSessionLocal
@@ -1,12 +1,64 @@
+"""Bring the database schema up to date with the Alembic revisions in ``migrations/``.
+
+``main.py`` calls :func:`run_migrations` from its lifespan; by hand, from
+``apps/api``::
+
+    python init_db.py        # or: alembic upgrade head
+
+Revisions are idempotent, so databases created by the old ``create_all``
+start-up path are upgraded in place.  New tables, columns and indexes need a
+new revision (``alembic revision -m "..."``); changing ``models.py`` alone no
+longer alters an existing database.
+"""
 import asyncio
-from database import engine, Base
-from models import User, Match, Participant
+import logging
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import text
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = Path(__file__).with_name("alembic.ini")
+
+# pg_advisory_lock key: workers starting together migrate one at a time, and
+# every worker after the first finds nothing left to do.
+MIGRATION_LOCK_ID = 7_240_512_048
+
+
+def alembic_config(connection=None) -> Config:
+    config = Config(str(ALEMBIC_INI))
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def _upgrade(connection, revision: str) -> None:
+    locked = connection.dialect.name == "postgresql"
+    if locked:
+        connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        # Session-level lock: survives the per-revision commits.
+        connection.commit()
+    try:
+        command.upgrade(alembic_config(connection), revision)
+        connection.commit()
+    finally:
+        if locked:
+            connection.rollback()  # no-op unless the upgrade failed
+            connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+            connection.commit()
+
+
+async def run_migrations(revision: str = "head") -> None:
+    async with engine.connect() as conn:
+        await conn.run_sync(_upgrade, revision)
+        await conn.commit()
+    logger.info("Database schema is at %s.", revision)
 
-async def init_models():
-    async with engine.begin() as conn:
-        # await conn.run_sync(Base.metadata.drop_all) # Disabled for auto-init
-        await conn.run_sync(Base.metadata.create_all)
-    print("Database tables created.")
 
 if __name__ == "__main__":
-    asyncio.run(init_models())
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_migrations())
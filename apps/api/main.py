@@ -1,17 +1,22 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from routers import analysis, draft
+from database import engine
+from services.metrics import instrument_engine, registry
 import os
 import asyncio
 import logging
 from contextlib import asynccontextmanager
-from init_db import init_models
+from init_db import run_migrations
 
 logger = logging.getLogger(__name__)
 
+instrument_engine(engine)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_models()
+    await run_migrations()
     # Eager-load the draft model in a thread so the event loop stays free
     # and the very first /draft request is not slow for users.
     from ml.draft_inference import draft_analyzer
@@ -20,7 +25,11 @@ async def lifespan(app: FastAPI):
         logger.info("Draft model loaded at startup.")
     except Exception as exc:
         logger.warning("Draft model could not be pre-loaded at startup: %s", exc)
+    from services.retention import start_retention_task
+    retention_task = start_retention_task()
     yield
+    if retention_task is not None:
+        retention_task.cancel()
     # Gracefully close the Riot API client on shutdown
     from services.riot import riot_service
     await riot_service.close()
@@ -49,6 +58,11 @@ app.include_router(draft.router)
 async def health_check():
     return {"status": "ok", "version": "0.1.0"}
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of this worker's in-process metrics."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1 @@
+"""Alembic migration environment and revisions (see ``init_db``)."""
@@ -0,0 +1,47 @@
+"""Alembic environment.
+
+``init_db.run_migrations`` passes an open connection in
+``config.attributes["connection"]``; the ``alembic`` command line connects
+through :data:`database.engine` instead.  Every revision runs in its own
+transaction so that revisions with an autocommit block (online index builds,
+batched backfills) do not leave earlier ones half applied.
+"""
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+
+import models  # noqa: F401  (registers every table on Base.metadata)
+from database import Base, engine
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def do_run_migrations(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        transaction_per_migration=True,
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+        await connection.commit()
+
+
+if context.is_offline_mode():
+    raise RuntimeError("Offline (--sql) migrations are not supported: revisions inspect the live schema.")
+
+connection = config.attributes.get("connection")
+if connection is not None:
+    do_run_migrations(connection)
+else:
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    asyncio.run(run_async_migrations())
@@ -0,0 +1,139 @@
+"""Helpers for revisions that must be safe on a live, existing database.
+
+* Schema checks (:func:`has_table`, :func:`add_column_if_missing`) make
+  revisions idempotent, so databases created by the old ``create_all``
+  start-up path can be adopted without stamping by hand.
+* :func:`create_index_online` builds indexes with ``CREATE INDEX
+  CONCURRENTLY`` on PostgreSQL, so writes to the table are not blocked.
+* :func:`backfill` fills derived columns in keyset-paginated batches; on
+  PostgreSQL each batch commits on its own, so row locks are held for one
+  batch rather than the whole table.
+"""
+import logging
+import os
+from typing import Optional, Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+BACKFILL_BATCH_SIZE = int(os.getenv("MIGRATION_BACKFILL_BATCH_SIZE", "5000"))
+
+
+def _is_postgres() -> bool:
+    return op.get_bind().dialect.name == "postgresql"
+
+
+def has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def column_names(table: str) -> set:
+    return {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def is_partitioned(table: str) -> bool:
+    """Whether *table* is a PostgreSQL partitioned table (see ``services.retention``)."""
+    if not _is_postgres():
+        return False
+    return op.get_bind().execute(
+        sa.text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :table"
+        ),
+        {"table": table},
+    ).first() is not None
+
+
+def add_column_if_missing(table: str, column: sa.Column) -> None:
+    if column.name not in column_names(table):
+        op.add_column(table, column)
+
+
+def create_index_online(
+    name: str,
+    table: str,
+    columns: Sequence[Union[str, sa.TextClause]],
+    unique: bool = False,
+) -> None:
+    """``CREATE [UNIQUE] INDEX IF NOT EXISTS``, concurrently on PostgreSQL.
+
+    A concurrent build that failed earlier leaves an INVALID index that
+    ``IF NOT EXISTS`` would keep, so it is dropped and rebuilt first.
+    """
+    if not _is_postgres() or is_partitioned(table):
+        # PostgreSQL cannot build an index on a partitioned parent concurrently.
+        op.create_index(name, table, list(columns), unique=unique, if_not_exists=True)
+        return
+
+    with op.get_context().autocommit_block():
+        invalid = op.get_bind().execute(
+            sa.text(
+                "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ),
+            {"name": name},
+        ).first()
+        if invalid is not None:
+            logger.warning("Rebuilding invalid index %s", name)
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+        op.create_index(
+            name, table, list(columns), unique=unique,
+            if_not_exists=True, postgresql_concurrently=True,
+        )
+
+
+def drop_index_online(name: str, table: str) -> None:
+    if not _is_postgres():
+        op.drop_index(name, table_name=table, if_exists=True)
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def backfill(
+    table: str,
+    key: str,
+    assignments: str,
+    pending: str,
+    batch_size: Optional[int] = None,
+) -> int:
+    """``UPDATE table SET assignments WHERE pending``, *batch_size* rows at a time.
+
+    Batches walk *key* (a unique, orderable column) upwards, so rows the
+    assignment leaves pending (e.g. no source row) are passed over rather
+    than retried forever.  Returns the number of rows visited.
+    """
+    size = batch_size or BACKFILL_BATCH_SIZE
+    select_first = sa.text(f"SELECT {key} FROM {table} WHERE {pending} ORDER BY {key} LIMIT :n")
+    select_next = sa.text(
+        f"SELECT {key} FROM {table} WHERE ({pending}) AND {key} > :last ORDER BY {key} LIMIT :n"
+    )
+    update = sa.text(f"UPDATE {table} SET {assignments} WHERE {key} IN :keys").bindparams(
+        sa.bindparam("keys", expanding=True)
+    )
+
+    def run() -> int:
+        bind = op.get_bind()
+        visited = 0
+        last = None
+        while True:
+            if last is None:
+                rows = bind.execute(select_first, {"n": size})
+            else:
+                rows = bind.execute(select_next, {"n": size, "last": last})
+            keys = [r[0] for r in rows]
+            if not keys:
+                return visited
+            bind.execute(update, {"keys": keys})
+            visited += len(keys)
+            last = keys[-1]
+            logger.info("Backfilled %d %s rows", visited, table)
+
+    if _is_postgres():
+        # Autocommit: every UPDATE is its own short transaction.
+        with op.get_context().autocommit_block():
+            return run()
+    # SQLite has a single writer either way; keep the revision atomic.
+    return run()
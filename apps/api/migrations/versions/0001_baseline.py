@@ -0,0 +1,114 @@
+"""Baseline: the tables ``init_db`` used to create with ``create_all``.
+
+Only missing tables and indexes are created, so databases created by the
+old start-up path are adopted as they are; the column and index changes
+made since then follow in later revisions.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from migrations.ops import has_table
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if not has_table("users"):
+        op.create_table(
+            "users",
+            sa.Column("puuid", sa.String(), primary_key=True),
+            sa.Column("game_name", sa.String()),
+            sa.Column("tag_line", sa.String()),
+            sa.Column("region", sa.String()),
+            sa.Column("profile_icon_id", sa.Integer()),
+            sa.Column("summoner_level", sa.Integer()),
+            sa.Column("last_updated", sa.DateTime()),
+        )
+    op.create_index("ix_users_puuid", "users", ["puuid"], if_not_exists=True)
+    op.create_index("ix_users_game_name", "users", ["game_name"], if_not_exists=True)
+    op.create_index("ix_users_tag_line", "users", ["tag_line"], if_not_exists=True)
+
+    if not has_table("matches"):
+        op.create_table(
+            "matches",
+            sa.Column("match_id", sa.String(), primary_key=True),
+            sa.Column("platform_id", sa.String()),
+            sa.Column("game_creation", sa.BigInteger()),
+            sa.Column("game_duration", sa.Integer()),
+            sa.Column("game_version", sa.String()),
+            sa.Column("queue_id", sa.Integer()),
+            sa.Column("data", sa.JSON()),
+        )
+    op.create_index("ix_matches_match_id", "matches", ["match_id"], if_not_exists=True)
+    op.create_index("ix_matches_game_creation", "matches", ["game_creation"], if_not_exists=True)
+
+    if not has_table("participants"):
+        op.create_table(
+            "participants",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("match_id", sa.String(), sa.ForeignKey("matches.match_id")),
+            sa.Column("puuid", sa.String()),
+            sa.Column("champion_id", sa.Integer()),
+            sa.Column("team_id", sa.Integer()),
+            sa.Column("win", sa.Boolean()),
+            sa.Column("kills", sa.Integer()),
+            sa.Column("deaths", sa.Integer()),
+            sa.Column("assists", sa.Integer()),
+            sa.Column("gold_per_minute", sa.Float()),
+            sa.Column("total_minions_killed", sa.Integer()),
+            sa.Column("vision_score", sa.Float()),
+            sa.Column("damage_dealt_to_champions", sa.Integer()),
+            sa.Column("stats_json", sa.JSON()),
+        )
+    op.create_index("ix_participants_puuid", "participants", ["puuid"], if_not_exists=True)
+    op.create_index("idx_participant_puuid_match", "participants", ["puuid", "match_id"], if_not_exists=True)
+
+    if not has_table("match_position_grids"):
+        op.create_table(
+            "match_position_grids",
+            sa.Column("match_id", sa.String(), sa.ForeignKey("matches.match_id"), primary_key=True),
+            sa.Column("bins", sa.Integer(), primary_key=True),
+            sa.Column("version", sa.Integer()),
+            sa.Column("entries", sa.LargeBinary()),
+            sa.Column("created_at", sa.DateTime()),
+        )
+
+    if not has_table("match_timelines"):
+        op.create_table(
+            "match_timelines",
+            sa.Column("match_id", sa.String(), sa.ForeignKey("matches.match_id"), primary_key=True),
+            sa.Column("data", sa.LargeBinary()),
+            sa.Column("created_at", sa.DateTime()),
+        )
+
+    if not has_table("league_snapshots"):
+        op.create_table(
+            "league_snapshots",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+            sa.Column("puuid", sa.String(), nullable=False),
+            sa.Column("queue_type", sa.String(), nullable=False),
+            sa.Column("tier", sa.String()),
+            sa.Column("rank", sa.String()),
+            sa.Column("league_points", sa.Integer()),
+            sa.Column("wins", sa.Integer()),
+            sa.Column("losses", sa.Integer()),
+            sa.Column("data", sa.JSON()),
+            sa.Column("captured_at", sa.DateTime()),
+            sa.Column("checked_at", sa.DateTime()),
+        )
+    op.create_index(
+        "idx_league_snapshot_puuid_queue", "league_snapshots",
+        ["puuid", "queue_type", "captured_at"], if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    for table in ("league_snapshots", "match_timelines", "match_position_grids", "participants", "matches", "users"):
+        op.drop_table(table)
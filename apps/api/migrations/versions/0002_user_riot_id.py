@@ -0,0 +1,65 @@
+"""Normalized Riot ID columns on ``users`` and their unique lookup index.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from migrations.ops import add_column_if_missing, create_index_online, drop_index_online
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def _normalize(value: str) -> str:
+    # Frozen copy of models.normalize_riot_id as of this revision, so later
+    # model changes don't alter what this migration writes.
+    return (value or "").strip().casefold()
+
+
+def upgrade() -> None:
+    add_column_if_missing("users", sa.Column("normalized_name", sa.String()))
+    add_column_if_missing("users", sa.Column("normalized_tag", sa.String()))
+
+    conn = op.get_bind()
+    # Backfilled in Python: SQL lower() is ASCII-only on SQLite.
+    rows = conn.execute(sa.text(
+        "SELECT puuid, game_name, tag_line, region, last_updated FROM users "
+        "WHERE normalized_name IS NULL OR normalized_tag IS NULL"
+    )).fetchall()
+    if rows:
+        # Case-variant duplicates of one Riot ID predate the unique index; the
+        # most recently updated row keeps the key, the others stay NULL
+        # (NULLs never collide in a unique index) and are no longer matched.
+        taken = {
+            (r.region, r.normalized_name, r.normalized_tag)
+            for r in conn.execute(sa.text(
+                "SELECT region, normalized_name, normalized_tag FROM users "
+                "WHERE normalized_name IS NOT NULL AND normalized_tag IS NOT NULL"
+            ))
+        }
+        updates = []
+        for r in sorted(rows, key=lambda r: str(r.last_updated or ""), reverse=True):
+            key = (r.region, _normalize(r.game_name), _normalize(r.tag_line))
+            if key in taken:
+                continue
+            taken.add(key)
+            updates.append({"puuid": r.puuid, "name": key[1], "tag": key[2]})
+        if updates:
+            conn.execute(
+                sa.text("UPDATE users SET normalized_name = :name, normalized_tag = :tag WHERE puuid = :puuid"),
+                updates,
+            )
+
+    create_index_online("uq_users_riot_id", "users", ["region", "normalized_name", "normalized_tag"], unique=True)
+
+
+def downgrade() -> None:
+    drop_index_online("uq_users_riot_id", "users")
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("normalized_tag")
+        batch.drop_column("normalized_name")
@@ -0,0 +1,41 @@
+"""Denormalized ``game_creation``/``queue_id`` on ``participants`` for recent-N scans.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from migrations.ops import add_column_if_missing, backfill, create_index_online, drop_index_online
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    add_column_if_missing("participants", sa.Column("game_creation", sa.BigInteger()))
+    add_column_if_missing("participants", sa.Column("queue_id", sa.Integer()))
+
+    backfill(
+        "participants",
+        key="id",
+        assignments=(
+            "game_creation = (SELECT m.game_creation FROM matches m WHERE m.match_id = participants.match_id), "
+            "queue_id = (SELECT m.queue_id FROM matches m WHERE m.match_id = participants.match_id)"
+        ),
+        pending="game_creation IS NULL",
+    )
+
+    create_index_online(
+        "idx_participant_puuid_creation", "participants", ["puuid", sa.text("game_creation DESC")],
+    )
+
+
+def downgrade() -> None:
+    drop_index_online("idx_participant_puuid_creation", "participants")
+    with op.batch_alter_table("participants") as batch:
+        batch.drop_column("queue_id")
+        batch.drop_column("game_creation")
@@ -0,0 +1,60 @@
+"""Archive tables for ``services.retention``.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from migrations.ops import has_table
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if not has_table("matches_archive"):
+        op.create_table(
+            "matches_archive",
+            sa.Column("match_id", sa.String(), primary_key=True),
+            sa.Column("platform_id", sa.String()),
+            sa.Column("game_creation", sa.BigInteger()),
+            sa.Column("game_duration", sa.Integer()),
+            sa.Column("game_version", sa.String()),
+            sa.Column("queue_id", sa.Integer()),
+            sa.Column("data", sa.JSON()),
+            sa.Column("archived_at", sa.DateTime()),
+        )
+
+    if not has_table("participants_archive"):
+        op.create_table(
+            "participants_archive",
+            sa.Column("id", sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column("match_id", sa.String()),
+            sa.Column("puuid", sa.String()),
+            sa.Column("game_creation", sa.BigInteger()),
+            sa.Column("queue_id", sa.Integer()),
+            sa.Column("champion_id", sa.Integer()),
+            sa.Column("team_id", sa.Integer()),
+            sa.Column("win", sa.Boolean()),
+            sa.Column("kills", sa.Integer()),
+            sa.Column("deaths", sa.Integer()),
+            sa.Column("assists", sa.Integer()),
+            sa.Column("gold_per_minute", sa.Float()),
+            sa.Column("total_minions_killed", sa.Integer()),
+            sa.Column("vision_score", sa.Float()),
+            sa.Column("damage_dealt_to_champions", sa.Integer()),
+            sa.Column("stats_json", sa.JSON()),
+            sa.Column("archived_at", sa.DateTime()),
+        )
+    op.create_index(
+        "ix_participants_archive_match_id", "participants_archive", ["match_id"], if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("participants_archive")
+    op.drop_table("matches_archive")
@@ -0,0 +1,344 @@
+"""Compact encodings for heatmap payloads.
+
+``extract_heatmap_data`` returns one dict per participant per frame, which is
+convenient to build but expensive to serialize and ship.  The columnar format
+produced here stores every numeric column as a little-endian typed array
+(base64 encoded) that is optionally delta-encoded, so the browser can decode
+it with a single ``Int16Array``/``Int32Array`` view and a prefix sum.
+"""
+import base64
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ml.timeline_parsing import (
+    EVENT_CHAMPION_KILL,
+    EVENT_WARD_PLACED,
+    PARTICIPANTS,
+    ParsedTimeline,
+    event_positions,
+    parse_timeline,
+)
+
+COLUMNAR_VERSION = 1
+GRID_VERSION = 1
+
+# Summoner's Rift coordinates fall inside [0, MAP_EXTENT) on both axes.
+MAP_EXTENT = 15000
+DEFAULT_GRID_BINS = 64
+# 256 x 256 cells is the most a uint16 sparse cell index can address.
+MAX_GRID_BINS = 256
+_UINT16_MAX = np.iinfo(np.uint16).max
+
+_DTYPES = {
+    "int16": np.dtype("<i2"),
+    "int32": np.dtype("<i4"),
+}
+
+
+def encode_column(values: Sequence[float], dtype: str = "int16", delta: bool = True) -> Dict[str, Any]:
+    """Encode a numeric column as a base64 typed array.
+
+    Values are rounded to integers.  With *delta* the first element is stored
+    verbatim and every following element as the difference to its predecessor;
+    columns whose deltas do not fit *dtype* are widened to ``int32``.
+    """
+    arr = np.rint(np.asarray(values, dtype=np.float64)).astype(np.int64)
+    if delta and arr.size:
+        arr = np.diff(arr, prepend=0)
+
+    if dtype == "int16" and arr.size and (arr.min() < -32768 or arr.max() > 32767):
+        dtype = "int32"
+
+    raw = arr.astype(_DTYPES[dtype]).tobytes()
+    return {
+        "dtype": dtype,
+        "delta": bool(delta),
+        "length": int(arr.size),
+        "data": base64.b64encode(raw).decode("ascii"),
+    }
+
+
+def decode_column(column: Dict[str, Any]) -> np.ndarray:
+    """Inverse of :func:`encode_column`; returns an ``int64`` array."""
+    raw = base64.b64decode(column.get("data", ""))
+    arr = np.frombuffer(raw, dtype=_DTYPES[column.get("dtype", "int16")]).astype(np.int64)
+    if column.get("delta"):
+        arr = np.cumsum(arr)
+    return arr
+
+
+def occupancy_grids(
+    parsed: ParsedTimeline,
+    bins: int = DEFAULT_GRID_BINS,
+    frame_mask: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Bin every participant's frame positions into ``bins x bins`` counts.
+
+    Returns a ``(10, bins, bins)`` ``uint32`` array indexed
+    ``[participant_id - 1, y_bin, x_bin]`` (row 0 is the bottom of the map).
+    Frames without a position or at ``(0, 0)`` are ignored; *frame_mask*
+    optionally restricts the frames (e.g. to a minute range).
+    """
+    valid = parsed.has_position & ~((parsed.x == 0) & (parsed.y == 0))
+    if frame_mask is not None:
+        valid &= np.asarray(frame_mask, dtype=bool)[:, None]
+
+    cell = MAP_EXTENT / bins
+    ix = np.clip((parsed.x / cell).astype(np.int64), 0, bins - 1)
+    iy = np.clip((parsed.y / cell).astype(np.int64), 0, bins - 1)
+    participant = np.broadcast_to(np.arange(PARTICIPANTS), valid.shape)
+    flat = (participant * bins + iy) * bins + ix
+    counts = np.bincount(flat[valid], minlength=PARTICIPANTS * bins * bins)
+    return counts.astype(np.uint32).reshape(PARTICIPANTS, bins, bins)
+
+
+def encode_grid(grid: np.ndarray) -> Dict[str, Any]:
+    """Encode a square count grid as little-endian ``uint16`` (counts saturate).
+
+    Single-match grids are mostly empty (one position per minute), so they
+    are stored sparsely as flat cell indices + counts whenever that is
+    smaller than the dense array; aggregated grids usually come out dense.
+    """
+    flat = np.minimum(np.asarray(grid).ravel(), _UINT16_MAX).astype("<u2")
+    cells = np.flatnonzero(flat)
+    if cells.size * 2 < flat.size:
+        return {
+            "encoding": "sparse",
+            "cells": base64.b64encode(cells.astype("<u2").tobytes()).decode("ascii"),
+            "counts": base64.b64encode(flat[cells].tobytes()).decode("ascii"),
+        }
+    return {
+        "encoding": "dense",
+        "data": base64.b64encode(flat.tobytes()).decode("ascii"),
+    }
+
+
+def decode_grid(encoded: Dict[str, Any], bins: int) -> np.ndarray:
+    """Inverse of :func:`encode_grid`; returns a ``(bins, bins)`` array."""
+    if encoded.get("encoding") == "sparse":
+        flat = np.zeros(bins * bins, dtype=np.uint16)
+        cells = np.frombuffer(base64.b64decode(encoded["cells"]), dtype="<u2")
+        flat[cells] = np.frombuffer(base64.b64decode(encoded["counts"]), dtype="<u2")
+        return flat.reshape(bins, bins)
+    return np.frombuffer(base64.b64decode(encoded["data"]), dtype="<u2").reshape(bins, bins)
+
+
+def _event_grid(x: np.ndarray, y: np.ndarray, bins: int) -> np.ndarray:
+    keep = ~((x == 0) & (y == 0))
+    cell = MAP_EXTENT / bins
+    ix = np.clip((x[keep] / cell).astype(np.int64), 0, bins - 1)
+    iy = np.clip((y[keep] / cell).astype(np.int64), 0, bins - 1)
+    return np.bincount(iy * bins + ix, minlength=bins * bins).reshape(bins, bins)
+
+
+def encode_heatmap_grid(
+    timeline_data: Any,
+    match_data: Dict[str, Any],
+    bins: int = DEFAULT_GRID_BINS,
+) -> Dict[str, Any]:
+    """Pre-binned occupancy grids instead of raw positions.
+
+    One ``bins x bins`` ``uint16`` grid per participant and per team, plus kill
+    and ward-placement grids per team (by killer / ward creator).  Cells
+    count frames (positions) or events; row-major, row 0 at the bottom of
+    the map.  Each grid is encoded with :func:`encode_grid`.
+    """
+    if not match_data:
+        return {}
+    parsed = parse_timeline(timeline_data)
+    if parsed is None:
+        return {}
+    bins = int(min(max(bins, 8), MAX_GRID_BINS))
+
+    info = match_data.get('info', {}) if isinstance(match_data, dict) else {}
+    lookup = {p.get('participantId'): p for p in info.get('participants', []) if p.get('participantId')}
+    team_of = np.array([lookup.get(pid, {}).get('teamId') or (100 if pid <= 5 else 200) for pid in range(1, PARTICIPANTS + 1)])
+
+    grids = occupancy_grids(parsed, bins)
+    participants = []
+    for i in range(PARTICIPANTS):
+        p = lookup.get(i + 1, {})
+        participants.append({
+            'participantId': i + 1,
+            'championName': p.get('championName', 'Unknown'),
+            'teamId': int(team_of[i]),
+            'count': int(grids[i].sum()),
+            'grid': encode_grid(grids[i]),
+        })
+
+    events = parsed.events
+    ex, ey = event_positions(parsed)
+    actor = np.where(events.type == EVENT_CHAMPION_KILL, events.killer_id, events.creator_id).astype(np.int64)
+    actor_team = np.where((actor >= 1) & (actor <= PARTICIPANTS), team_of[np.clip(actor - 1, 0, PARTICIPANTS - 1)], 0)
+
+    teams = {}
+    for team in sorted(set(team_of.tolist())):
+        kills = (events.type == EVENT_CHAMPION_KILL) & (actor_team == team)
+        wards = (events.type == EVENT_WARD_PLACED) & (actor_team == team)
+        teams[str(team)] = {
+            'positions': encode_grid(grids[team_of == team].sum(axis=0)),
+            'kills': encode_grid(_event_grid(ex[kills], ey[kills], bins)),
+            'wards': encode_grid(_event_grid(ex[wards], ey[wards], bins)),
+        }
+
+    return {
+        'format': 'grid',
+        'version': GRID_VERSION,
+        'bins': bins,
+        'extent': MAP_EXTENT,
+        'dtype': 'uint16',
+        'participants': participants,
+        'teams': teams,
+    }
+
+
+def encode_heatmap_columnar(heatmap_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert :func:`extract_heatmap_data` output into the columnar format."""
+    if not heatmap_data:
+        return {}
+
+    participants = []
+    for p in heatmap_data.get("participants", []):
+        positions: List[Dict[str, Any]] = p.get("positions", [])
+        participants.append({
+            "participantId": p.get("participantId"),
+            "championName": p.get("championName", "Unknown"),
+            "teamId": p.get("teamId", 0),
+            "count": len(positions),
+            "columns": {
+                "timestamp": encode_column([pos["timestamp"] for pos in positions], "int32"),
+                "x": encode_column([pos["x"] for pos in positions]),
+                "y": encode_column([pos["y"] for pos in positions]),
+                "totalGold": encode_column([pos["totalGold"] for pos in positions]),
+                "goldDelta": encode_column([pos["goldDelta"] for pos in positions], delta=False),
+            },
+        })
+
+    kills = heatmap_data.get("kill_events", [])
+    kill_table = {
+        "count": len(kills),
+        "columns": {
+            "timestamp": encode_column([k["timestamp"] for k in kills], "int32"),
+            "x": encode_column([k["x"] for k in kills], delta=False),
+            "y": encode_column([k["y"] for k in kills], delta=False),
+            "killerId": encode_column([k["killerId"] for k in kills], delta=False),
+            "victimId": encode_column([k["victimId"] for k in kills], delta=False),
+        },
+        # Ragged lists stay as plain JSON; they are tiny compared to positions.
+        "assistingParticipantIds": [k.get("assistingParticipantIds") or [] for k in kills],
+    }
+
+    wards = heatmap_data.get("ward_events", [])
+    ward_types: List[str] = sorted({w.get("wardType", "UNDEFINED") for w in wards})
+    ward_type_index = {name: i for i, name in enumerate(ward_types)}
+    ward_table = {
+        "count": len(wards),
+        "wardTypes": ward_types,
+        "columns": {
+            "timestamp": encode_column([w["timestamp"] for w in wards], "int32"),
+            "x": encode_column([w["x"] for w in wards], delta=False),
+            "y": encode_column([w["y"] for w in wards], delta=False),
+            "creatorId": encode_column([w["creatorId"] for w in wards], delta=False),
+            "wardType": encode_column(
+                [ward_type_index[w.get("wardType", "UNDEFINED")] for w in wards], delta=False
+            ),
+        },
+    }
+
+    return {
+        "format": "columnar",
+        "version": COLUMNAR_VERSION,
+        "participants": participants,
+        "kill_events": kill_table,
+        "ward_events": ward_table,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Per-match grid entries for multi-match aggregation.
+# ---------------------------------------------------------------------------
+
+# (name, first minute, end minute or None).  Changing these requires bumping
+# GRID_ENTRIES_VERSION so stored entries are rebuilt.
+MINUTE_RANGES = (
+    ("early", 0, 14),
+    ("mid", 14, 25),
+    ("late", 25, None),
+)
+GRID_ENTRIES_VERSION = 1
+
+# One row per non-empty (minute range, participant, cell).
+GRID_ENTRY_DTYPE = np.dtype([
+    ("range", "u1"),
+    ("participant", "u1"),   # participant_id - 1
+    ("cell", "<u2"),         # y_bin * bins + x_bin
+    ("count", "<u2"),
+])
+
+
+def match_grid_entries(timeline_data: Any, bins: int = DEFAULT_GRID_BINS) -> Optional[bytes]:
+    """Sparse occupancy entries for every participant and minute range.
+
+    This is what gets stored per match: a packed :data:`GRID_ENTRY_DTYPE`
+    array, typically a few hundred rows (one position per minute per
+    player), so summing 100+ matches never touches a timeline again.
+    """
+    parsed = parse_timeline(timeline_data)
+    if parsed is None:
+        return None
+
+    minutes = parsed.timestamps / 60000
+    chunks = []
+    for r, (_, start, end) in enumerate(MINUTE_RANGES):
+        mask = minutes >= start
+        if end is not None:
+            mask &= minutes < end
+        grids = occupancy_grids(parsed, bins, mask).reshape(PARTICIPANTS, -1)
+        participant, cell = np.nonzero(grids)
+        chunk = np.empty(participant.size, dtype=GRID_ENTRY_DTYPE)
+        chunk["range"] = r
+        chunk["participant"] = participant
+        chunk["cell"] = cell
+        chunk["count"] = np.minimum(grids[participant, cell], _UINT16_MAX)
+        chunks.append(chunk)
+    return np.concatenate(chunks).tobytes()
+
+
+def aggregate_grid_entries(
+    matches: Sequence[tuple],
+    bins: int = DEFAULT_GRID_BINS,
+) -> Dict[str, np.ndarray]:
+    """Sum stored entries across matches into per-range grids.
+
+    *matches* holds ``(entries, player_ids, opponent_ids, flip)`` tuples:
+    packed entries from :func:`match_grid_entries`, the 1-based participant
+    ids to count as "player" and "opponents", and whether to rotate the map
+    180 degrees (used to show red-side games from the blue side).  Returns
+    ``{"player": grids, "opponents": grids}`` with ``(len(MINUTE_RANGES),
+    bins, bins)`` ``uint32`` arrays.
+    """
+    cells_total = bins * bins
+    size = len(MINUTE_RANGES) * cells_total
+    totals = {"player": np.zeros(size, dtype=np.uint64), "opponents": np.zeros(size, dtype=np.uint64)}
+
+    for entries, player_ids, opponent_ids, flip in matches:
+        rows = np.frombuffer(entries, dtype=GRID_ENTRY_DTYPE)
+        if rows.size == 0:
+            continue
+        cell = rows["cell"].astype(np.int64)
+        if flip:
+            cell = cells_total - 1 - cell
+        flat = rows["range"].astype(np.int64) * cells_total + cell
+        participant = rows["participant"].astype(np.int64) + 1
+        for key, ids in (("player", player_ids), ("opponents", opponent_ids)):
+            selected = np.isin(participant, list(ids))
+            if selected.any():
+                totals[key] += np.bincount(
+                    flat[selected], weights=rows["count"][selected], minlength=size
+                ).astype(np.uint64)
+
+    return {
+        key: np.minimum(total, np.iinfo(np.uint32).max).astype(np.uint32).reshape(len(MINUTE_RANGES), bins, bins)
+        for key, total in totals.items()
+    }
@@ -0,0 +1,214 @@
+"""Export participant feature rows to Parquet for offline training and analytics.
+
+Stored matches are streamed through a server-side cursor, ``batch_size`` at a
+time, oldest first.  Each batch's participants are loaded and turned into
+:func:`ml.pipeline.build_feature_row` rows, the same features the per-player
+model is trained on.  The rows are written as Hive-partitioned Parquet::
+
+    <out>/patch=14.1/queue=420/part-00000.parquet
+
+Rows are buffered per (patch, queue) and a file is written every
+``rows_per_file`` rows.  When more than ``max_buffered_rows`` rows are
+pending in total, the largest buffer is flushed early.  Memory therefore
+stays bounded however many matches are stored.
+
+Requires ``pyarrow`` (``pip install ".[export]"``).  Run from ``apps/api``::
+
+    python -m ml.parquet_export --out ./export [--since 2024-01-01] [--queue 420 --queue 440]
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.future import select
+
+from database import AsyncSessionLocal
+from ml.pipeline import build_feature_row
+from models import Match, Participant
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 500
+ROWS_PER_FILE = 50_000
+MAX_BUFFERED_ROWS = 200_000
+
+_INT_COLUMNS = {"gameCreation", "gameDuration", "queueId", "win"}
+_STRING_COLUMNS = {"match_id", "puuid", "championName", "skillshotConfig"}
+_LIST_COLUMNS = {"championSkillshots"}
+
+
+@dataclass
+class ExportSummary:
+    """Outcome of :func:`export_features`."""
+
+    matches: int = 0
+    rows: int = 0
+    skipped: int = 0  # participants without stored stats
+    files: List[str] = field(default_factory=list)
+
+
+def patch_of(game_version: Optional[str]) -> str:
+    """``"14.1.553.1234"`` -> ``"14.1"``."""
+    parts = (game_version or "").split(".")
+    if len(parts) < 2 or not parts[0] or not parts[1]:
+        return "unknown"
+    return f"{parts[0]}.{parts[1]}"
+
+
+def _field(name: str) -> "pa.Field":
+    if name in _INT_COLUMNS:
+        return pa.field(name, pa.int64())
+    if name in _STRING_COLUMNS:
+        return pa.field(name, pa.string())
+    if name in _LIST_COLUMNS:
+        return pa.field(name, pa.list_(pa.string()))
+    return pa.field(name, pa.float64())
+
+
+def _convert(name: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if name in _STRING_COLUMNS:
+        return str(value)
+    if name in _LIST_COLUMNS:
+        return [str(v) for v in value]
+    try:
+        return int(value) if name in _INT_COLUMNS else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _PartitionedWriter:
+    def __init__(self, root: Path, rows_per_file: int, max_buffered_rows: int):
+        self.root = root
+        self.rows_per_file = rows_per_file
+        self.max_buffered_rows = max_buffered_rows
+        self.buffers: Dict[Tuple[str, Any], List[dict]] = defaultdict(list)
+        self.buffered = 0
+        self.file_counts: Dict[Tuple[str, Any], int] = defaultdict(int)
+        self.schema: Optional["pa.Schema"] = None
+        self.files: List[str] = []
+
+    def add(self, key: Tuple[str, Any], row: dict) -> None:
+        buffer = self.buffers[key]
+        buffer.append(row)
+        self.buffered += 1
+        if len(buffer) >= self.rows_per_file:
+            self._flush(key)
+        elif self.buffered > self.max_buffered_rows:
+            self._flush(max(self.buffers, key=lambda k: len(self.buffers[k])))
+
+    def _flush(self, key: Tuple[str, Any]) -> None:
+        rows = self.buffers.pop(key, [])
+        if not rows:
+            return
+        self.buffered -= len(rows)
+        if self.schema is None:
+            # Every file gets the first row's columns so the dataset reads as one table.
+            self.schema = pa.schema([_field(name) for name in rows[0]])
+        table = pa.table(
+            {name: [_convert(name, row.get(name)) for row in rows] for name in self.schema.names},
+            schema=self.schema,
+        )
+        patch, queue = key
+        directory = self.root / f"patch={patch}" / f"queue={queue}"
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"part-{self.file_counts[key]:05d}.parquet"
+        self.file_counts[key] += 1
+        pq.write_table(table, path, compression="zstd")
+        self.files.append(str(path))
+
+    def close(self) -> None:
+        for key in list(self.buffers):
+            self._flush(key)
+
+
+async def export_features(
+    out_dir: str,
+    session_factory=AsyncSessionLocal,
+    since_ms: Optional[int] = None,
+    queues: Optional[Iterable[int]] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    rows_per_file: int = ROWS_PER_FILE,
+    max_buffered_rows: int = MAX_BUFFERED_ROWS,
+) -> ExportSummary:
+    """Write feature rows of every stored participant under *out_dir*.
+
+    *out_dir* must be empty or missing, so files of an older export never
+    mix with this one.  *since_ms* and *queues* restrict the matches.
+    """
+    if pa is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    root = Path(out_dir)
+    if root.exists() and any(root.iterdir()):
+        raise FileExistsError(f"Export directory {root} is not empty")
+    root.mkdir(parents=True, exist_ok=True)
+
+    query = select(Match).order_by(Match.game_creation, Match.match_id)
+    if since_ms is not None:
+        query = query.where(Match.game_creation >= since_ms)
+    if queues:
+        query = query.where(Match.queue_id.in_(list(queues)))
+
+    summary = ExportSummary()
+    writer = _PartitionedWriter(root, rows_per_file, max_buffered_rows)
+    # Participants are looked up on a second connection while the cursor is open.
+    async with session_factory() as stream_session, session_factory() as lookup_session:
+        result = await stream_session.stream(query.execution_options(yield_per=batch_size))
+        async for matches in result.scalars().partitions():
+            by_id = {m.match_id: m for m in matches}
+            participants = await lookup_session.execute(
+                select(Participant).where(Participant.match_id.in_(list(by_id)))
+            )
+            for participant in participants.scalars():
+                if not participant.stats_json:
+                    summary.skipped += 1
+                    continue
+                match = by_id[participant.match_id]
+                row = build_feature_row(participant, match)
+                row["puuid"] = participant.puuid
+                writer.add((patch_of(match.game_version), match.queue_id), row)
+                summary.rows += 1
+            summary.matches += len(matches)
+            # The identity maps hold loaded rows weakly; nothing keeps a
+            # batch alive once it has been written to the buffers.
+            await lookup_session.commit()
+    writer.close()
+    summary.files = writer.files
+    logger.info(
+        "Exported %d rows from %d matches into %d files (%d participants skipped)",
+        summary.rows, summary.matches, len(summary.files), summary.skipped,
+    )
+    return summary
+
+
+def _parse_date_ms(value: str) -> int:
+    day = datetime.datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc)
+    return int(day.timestamp() * 1000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export participant features to partitioned Parquet.")
+    parser.add_argument("--out", required=True, help="output directory (must be empty)")
+    parser.add_argument("--since", type=_parse_date_ms, help="only matches created on or after YYYY-MM-DD (UTC)")
+    parser.add_argument("--queue", type=int, action="append", help="queue id to include (repeatable)")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    parser.add_argument("--rows-per-file", type=int, default=ROWS_PER_FILE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(export_features(
+        args.out, since_ms=args.since, queues=args.queue,
+        batch_size=args.batch_size, rows_per_file=args.rows_per_file,
+    ))
@@ -1,23 +1,73 @@
-"""Timeline analysis for territorial control metrics using Riot match timelines."""
-from typing import Dict, Any, Optional, List
+"""Timeline analysis for territorial control metrics using Riot match timelines.
+
+Every function accepts either a raw timeline (DTO or dict) or the
+:class:`~ml.timeline_parsing.ParsedTimeline` returned by
+:func:`~ml.timeline_parsing.parse_timeline`; parse once and pass the parsed
+form around when several metrics are needed for the same match.
+"""
+from typing import Dict, Any, Optional, List, Sequence
+
+import numpy as np
+
+from ml.timeline_parsing import (
+    EVENT_CHAMPION_KILL,
+    MAP_CENTER_X,
+    MAP_CENTER_Y,
+    PARTICIPANTS,
+    ParsedTimeline,
+    event_positions,
+    frame_indices,
+    parse_timeline,
+    participant_index,
+)
 
 
 # Summoner's Rift map constants (map is ~14500x14500 units)
-MAP_CENTER_X = 7250
-MAP_CENTER_Y = 7250
 ENEMY_JUNGLE_X_BLUE = 9500
 ENEMY_JUNGLE_X_RED = 5000
 
 
-def _get_attr_or_key(obj, key, default=None):
-    """Safely get attribute or dictionary key from object (handles Pydantic models and dicts)."""
-    if obj is None:
-        return default
-    if hasattr(obj, key):
-        return getattr(obj, key, default)
-    if isinstance(obj, dict):
-        return obj.get(key, default)
-    return default
+# Riot assigns participant ids 1-5 to the blue side and 6-10 to the red side.
+DEFAULT_TEAM_IDS = (100,) * 5 + (200,) * 5
+
+
+def _territory_for_columns(parsed: ParsedTimeline, columns: np.ndarray, blue: np.ndarray) -> List[Dict[str, float]]:
+    """Territory metrics for the given participant columns in one NumPy pass."""
+    x = parsed.x[:, columns]
+    y = parsed.y[:, columns]
+    valid = parsed.has_position[:, columns] & ~((x == 0) & (y == 0))
+    center = MAP_CENTER_X + MAP_CENTER_Y
+
+    diagonal = x + y
+    in_enemy_territory = np.where(blue, diagonal > center + 1000, diagonal < center - 1000) & valid
+    in_enemy_jungle = np.where(
+        blue,
+        (x > ENEMY_JUNGLE_X_BLUE) & (y > MAP_CENTER_Y),
+        (x < ENEMY_JUNGLE_X_RED) & (y < MAP_CENTER_Y),
+    ) & valid
+    forward_distance = np.where(valid, np.maximum(0, np.where(blue, diagonal - center, center - diagonal)) / 100, 0)
+    river_center_dist = np.abs(x - y) / 1.414
+    in_river = (river_center_dist < 2500) & (2500 < x) & (x < 12000) & (2500 < y) & (y < 12000) & valid
+
+    counts = valid.sum(axis=0)
+    safe = np.maximum(counts, 1)
+    territory_pct = in_enemy_territory.sum(axis=0) / safe * 100
+    forward_score = np.minimum(100, forward_distance.sum(axis=0) / safe / 1.45)
+    jungle_pct = in_enemy_jungle.sum(axis=0) / safe * 100
+    river_pct = in_river.sum(axis=0) / safe * 100
+
+    results = []
+    for i in range(len(columns)):
+        if counts[i] == 0:
+            results.append(_empty_metrics())
+            continue
+        results.append({
+            'time_in_enemy_territory_pct': float(territory_pct[i]),
+            'forward_positioning_score': float(forward_score[i]),
+            'jungle_invasion_pct': float(jungle_pct[i]),
+            'river_control_pct': float(river_pct[i]),
+        })
+    return results
 
 
 def calculate_territory_metrics(
@@ -26,81 +76,40 @@ def calculate_territory_metrics(
     team_id: int
 ) -> Dict[str, float]:
     """Calculate territorial control metrics from timeline data."""
-    if not timeline_data:
-        return _empty_metrics()
-    
-    try:
-        info = _get_attr_or_key(timeline_data, 'info', {})
-        frames = _get_attr_or_key(info, 'frames', [])
-        if not frames:
-            return _empty_metrics()
-    except Exception:
+    parsed = parse_timeline(timeline_data)
+    idx = participant_index(participant_id)
+    if parsed is None or idx is None:
         return _empty_metrics()
+    return _territory_for_columns(parsed, np.array([idx]), np.array([team_id == 100]))[0]
 
-    is_blue_side = team_id == 100
-    
-    total_frames = 0
-    enemy_territory_frames = 0
-    river_frames = 0
-    enemy_jungle_frames = 0
-    forward_distances = []
-    
-    for frame in frames:
-        try:
-            participant_frames = _get_attr_or_key(frame, 'participantFrames', {})
-            
-            if not participant_frames:
-                continue
-            
-            # participantFrames is keyed by string "1", "2", etc.
-            participant_data = _get_attr_or_key(participant_frames, str(participant_id))
-            if not participant_data:
-                continue
-
-            position = _get_attr_or_key(participant_data, 'position', {})
-            if not position:
-                continue
-                
-            x = _get_attr_or_key(position, 'x', MAP_CENTER_X)
-            y = _get_attr_or_key(position, 'y', MAP_CENTER_Y)
-
-            if x == 0 and y == 0:
-                continue
-                
-            total_frames += 1
-
-            if is_blue_side:
-                in_enemy_territory = (x + y) > (MAP_CENTER_X + MAP_CENTER_Y + 1000)
-                in_enemy_jungle = x > ENEMY_JUNGLE_X_BLUE and y > MAP_CENTER_Y
-                forward_distance = max(0, (x + y) - (MAP_CENTER_X + MAP_CENTER_Y)) / 100
-            else:
-                in_enemy_territory = (x + y) < (MAP_CENTER_X + MAP_CENTER_Y - 1000)
-                in_enemy_jungle = x < ENEMY_JUNGLE_X_RED and y < MAP_CENTER_Y
-                forward_distance = max(0, (MAP_CENTER_X + MAP_CENTER_Y) - (x + y)) / 100
-
-            river_center_dist = abs((x - y)) / 1.414
-            in_river = river_center_dist < 2500 and 2500 < x < 12000 and 2500 < y < 12000
-            
-            if in_enemy_territory:
-                enemy_territory_frames += 1
-            if in_river:
-                river_frames += 1
-            if in_enemy_jungle:
-                enemy_jungle_frames += 1
-            
-            forward_distances.append(forward_distance)
-            
-        except Exception as e:
-            continue
-    
-    if total_frames == 0:
-        return _empty_metrics()
-    
+
+def calculate_territory_metrics_all(
+    timeline_data: Any,
+    team_ids: Optional[Sequence[int]] = None,
+) -> List[Dict[str, float]]:
+    """Territorial metrics for all 10 participants, indexed by ``participant_id - 1``.
+
+    *team_ids* gives each participant's team (defaults to Riot's 1-5 blue,
+    6-10 red layout).
+    """
+    parsed = parse_timeline(timeline_data)
+    if parsed is None:
+        return [_empty_metrics() for _ in range(PARTICIPANTS)]
+    teams = np.asarray(team_ids or DEFAULT_TEAM_IDS)
+    return _territory_for_columns(parsed, np.arange(PARTICIPANTS), teams == 100)
+
+
+def team_territory_metrics(
+    participant_metrics: List[Dict[str, float]],
+    team_ids: Optional[Sequence[int]] = None,
+) -> Dict[int, Dict[str, float]]:
+    """Average :func:`calculate_territory_metrics_all` output per team."""
+    teams = list(team_ids or DEFAULT_TEAM_IDS)
     return {
-        'time_in_enemy_territory_pct': (enemy_territory_frames / total_frames) * 100,
-        'forward_positioning_score': min(100, (sum(forward_distances) / len(forward_distances) / 1.45)) if forward_distances else 0,
-        'jungle_invasion_pct': (enemy_jungle_frames / total_frames) * 100,
-        'river_control_pct': (river_frames / total_frames) * 100,
+        team: aggregate_territory_metrics(
+            [m for m, t in zip(participant_metrics, teams) if t == team]
+        )
+        for team in sorted(set(teams))
     }
 
 
@@ -150,6 +159,36 @@ def aggregate_territory_metrics(metrics_list: List[Dict[str, float]]) -> Dict[st
     return aggregated
 
 
+LANE_LEAD_CHECKPOINTS = (5, 8, 10, 14, 20)
+
+
+def extract_lane_leads_at_minutes(
+    timeline_data: Any,
+    participant_id: int,
+    enemy_participant_id: int,
+    minutes: Sequence[int] = LANE_LEAD_CHECKPOINTS,
+) -> Dict[int, Optional[tuple]]:
+    """Gold/xp lead vs lane opponent at several minutes in one lookup.
+
+    Returns ``{minute: (gold_lead, xp_lead) or None}``, using the frame
+    closest to each minute.
+    """
+    parsed = parse_timeline(timeline_data)
+    me = participant_index(participant_id)
+    enemy = participant_index(enemy_participant_id)
+    if parsed is None or me is None or enemy is None:
+        return {int(m): None for m in minutes}
+
+    frames = frame_indices(parsed, [int(m) * 60000 for m in minutes])
+    ok = parsed.present[frames, me] & parsed.present[frames, enemy]
+    gold = (parsed.total_gold[frames, me] - parsed.total_gold[frames, enemy]).tolist()
+    xp = (parsed.xp[frames, me] - parsed.xp[frames, enemy]).tolist()
+    return {
+        int(m): ((g, x) if present else None)
+        for m, present, g, x in zip(minutes, ok.tolist(), gold, xp)
+    }
+
+
 def extract_lane_lead_at_minute(
     timeline_data: Any,
     participant_id: int,
@@ -163,47 +202,89 @@ def extract_lane_lead_at_minute(
 
     Returns ``(gold_lead, xp_lead)`` or ``None``.
     """
-    if not timeline_data:
-        return None
-
-    try:
-        info = _get_attr_or_key(timeline_data, 'info', {})
-        frames = _get_attr_or_key(info, 'frames', [])
-        if not frames:
-            return None
-
-        target_ms = target_minute * 60000
-        best_frame = None
-        best_diff = float('inf')
+    return extract_lane_leads_at_minutes(
+        timeline_data, participant_id, enemy_participant_id, (target_minute,)
+    )[int(target_minute)]
 
-        for frame in frames:
-            timestamp = _get_attr_or_key(frame, 'timestamp', 0)
-            diff = abs(timestamp - target_ms)
-            if diff < best_diff:
-                best_diff = diff
-                best_frame = frame
 
-        if not best_frame:
-            return None
+def _series_matrices(parsed: ParsedTimeline, team_ids: Optional[Sequence[int]] = None) -> Dict[str, np.ndarray]:
+    """Per-frame averages every series point is measured against.
 
-        participant_frames = _get_attr_or_key(best_frame, 'participantFrames', {})
-        if not participant_frames:
-            return None
-
-        my_data = _get_attr_or_key(participant_frames, str(participant_id))
-        enemy_data = _get_attr_or_key(participant_frames, str(enemy_participant_id))
+    Computed once for the whole match: the match average (``(F,)``) and the
+    average of each participant's own team (``(F, 10)``), over the
+    participants present in each frame.
+    """
+    present = parsed.present
+    gold = parsed.total_gold * present
+    xp = parsed.xp * present
+    counts = np.maximum(present.sum(axis=1), 1)
+
+    teams = np.asarray(team_ids or DEFAULT_TEAM_IDS)
+    team_gold = np.zeros(gold.shape, dtype=np.float64)
+    team_xp = np.zeros(xp.shape, dtype=np.float64)
+    for team in np.unique(teams):
+        cols = teams == team
+        team_counts = np.maximum(present[:, cols].sum(axis=1), 1)
+        team_gold[:, cols] = (gold[:, cols].sum(axis=1) / team_counts)[:, None]
+        team_xp[:, cols] = (xp[:, cols].sum(axis=1) / team_counts)[:, None]
 
-        if not my_data or not enemy_data:
-            return None
+    return {
+        'avg_gold': gold.sum(axis=1) / counts,
+        'avg_xp': xp.sum(axis=1) / counts,
+        'team_gold': team_gold,
+        'team_xp': team_xp,
+        'minutes': np.round(parsed.timestamps / 60000).astype(np.int64),
+    }
 
-        my_gold = _get_attr_or_key(my_data, 'totalGold', 0)
-        my_xp = _get_attr_or_key(my_data, 'xp', 0)
-        enemy_gold = _get_attr_or_key(enemy_data, 'totalGold', 0)
-        enemy_xp = _get_attr_or_key(enemy_data, 'xp', 0)
 
-        return (my_gold - enemy_gold, my_xp - enemy_xp)
-    except Exception:
-        return None
+def _series_for(
+    parsed: ParsedTimeline,
+    matrices: Dict[str, np.ndarray],
+    me: int,
+    enemy: Optional[int],
+) -> Dict[str, List[Dict[str, Any]]]:
+    frames = parsed.present[:, me]
+    my_gold = parsed.total_gold[frames, me]
+    my_xp = parsed.xp[frames, me]
+    avg_gold = matrices['avg_gold'][frames]
+    avg_xp = matrices['avg_xp'][frames]
+    team_gold = matrices['team_gold'][frames, me]
+    team_xp = matrices['team_xp'][frames, me]
+
+    series_data = [
+        {
+            "minute": minute,
+            "goldDelta": g - ag,
+            "xpDelta": x - ax,
+            "myGold": g,
+            "avgGold": ag,
+            "myXp": x,
+            "avgXp": ax,
+            "teamAvgGold": tg,
+            "teamAvgXp": tx,
+            "teamGoldDelta": g - tg,
+            "teamXpDelta": x - tx,
+        }
+        for minute, g, ag, x, ax, tg, tx in zip(
+            matrices['minutes'][frames].tolist(),
+            my_gold.tolist(), avg_gold.tolist(),
+            my_xp.tolist(), avg_xp.tolist(),
+            team_gold.tolist(), team_xp.tolist(),
+        )
+    ]
+
+    if enemy is not None:
+        has_enemy = parsed.present[frames, enemy].tolist()
+        enemy_gold = parsed.total_gold[frames, enemy].tolist()
+        enemy_xp = parsed.xp[frames, enemy].tolist()
+        for point, ok, eg, ex in zip(series_data, has_enemy, enemy_gold, enemy_xp):
+            if ok:
+                point["enemyGold"] = eg
+                point["enemyXp"] = ex
+                point["laneGoldDelta"] = point["myGold"] - eg
+                point["laneXpDelta"] = point["myXp"] - ex
+
+    return {"timeline": series_data}
 
 
 def analyze_match_timeline_series(
@@ -211,79 +292,63 @@ def analyze_match_timeline_series(
     participant_id: int,
     enemy_participant_id: Optional[int] = None
 ) -> Dict[str, List[Dict[str, Any]]]:
-    """Extract time-series gold/XP data for a participant vs match average and enemy laner."""
-    if not timeline_data:
+    """Extract time-series gold/XP data for a participant vs match average, team average and enemy laner."""
+    parsed = parse_timeline(timeline_data)
+    me = participant_index(participant_id)
+    if parsed is None or me is None:
         return {}
+    enemy = participant_index(enemy_participant_id) if enemy_participant_id else None
+    return _series_for(parsed, _series_matrices(parsed), me, enemy)
 
-    try:
-        info = _get_attr_or_key(timeline_data, 'info', {})
-        frames = _get_attr_or_key(info, 'frames', [])
-        if not frames:
-            return {}
-
-        series_data = []
-        
-        for i, frame in enumerate(frames):
-            participant_frames = _get_attr_or_key(frame, 'participantFrames', {})
-            if not participant_frames:
-                continue
-
-            my_data = _get_attr_or_key(participant_frames, str(participant_id))
-            if not my_data:
-                continue
-                
-            my_gold = _get_attr_or_key(my_data, 'totalGold', 0)
-            my_xp = _get_attr_or_key(my_data, 'xp', 0)
-
-            enemy_gold = 0
-            enemy_xp = 0
-            has_enemy = False
-            
-            if enemy_participant_id:
-                enemy_data = _get_attr_or_key(participant_frames, str(enemy_participant_id))
-                if enemy_data:
-                    enemy_gold = _get_attr_or_key(enemy_data, 'totalGold', 0)
-                    enemy_xp = _get_attr_or_key(enemy_data, 'xp', 0)
-                    has_enemy = True
-
-            total_gold = 0
-            total_xp = 0
-            count = 0
-            for p_id in range(1, 11):
-                p_data = _get_attr_or_key(participant_frames, str(p_id))
-                if p_data:
-                    total_gold += _get_attr_or_key(p_data, 'totalGold', 0)
-                    total_xp += _get_attr_or_key(p_data, 'xp', 0)
-                    count += 1
-            
-            avg_gold = total_gold / max(count, 1)
-            avg_xp = total_xp / max(count, 1)
-
-            timestamp = _get_attr_or_key(frame, 'timestamp', 0)
-            minute = round(timestamp / 60000)
-            
-            data_point = {
-                "minute": minute,
-                "goldDelta": my_gold - avg_gold,
-                "xpDelta": my_xp - avg_xp,
-                "myGold": my_gold,
-                "avgGold": avg_gold,
-                "myXp": my_xp,
-                "avgXp": avg_xp
-            }
-            
-            if has_enemy:
-                data_point["enemyGold"] = enemy_gold
-                data_point["enemyXp"] = enemy_xp
-                data_point["laneGoldDelta"] = my_gold - enemy_gold
-                data_point["laneXpDelta"] = my_xp - enemy_xp
-            
-            series_data.append(data_point)
-            
-        return {"timeline": series_data}
-        
-    except Exception:
+
+def lane_opponents_from_match(match_data: Optional[Dict[str, Any]]) -> Dict[int, int]:
+    """Map each participant id to its lane opponent's id using ``teamPosition``."""
+    participants = ((match_data or {}).get('info') or {}).get('participants', [])
+    by_slot = {
+        (p.get('teamId'), p.get('teamPosition')): p.get('participantId')
+        for p in participants
+        if p.get('teamPosition')
+    }
+    opponents = {}
+    for p in participants:
+        pid, team, role = p.get('participantId'), p.get('teamId'), p.get('teamPosition')
+        if not pid or not role:
+            continue
+        enemy = next((v for (t, r), v in by_slot.items() if r == role and t != team), None)
+        if enemy:
+            opponents[pid] = enemy
+    return opponents
+
+
+def team_ids_from_match(match_data: Optional[Dict[str, Any]]) -> List[int]:
+    """Team id per participant (index ``participant_id - 1``), Riot's layout as fallback."""
+    teams = list(DEFAULT_TEAM_IDS)
+    for p in ((match_data or {}).get('info') or {}).get('participants', []):
+        idx = participant_index(p.get('participantId'))
+        if idx is not None and p.get('teamId'):
+            teams[idx] = p['teamId']
+    return teams
+
+
+def analyze_match_timeline_series_all(
+    timeline_data: Any,
+    match_data: Optional[Dict[str, Any]] = None,
+) -> Dict[int, Dict[str, List[Dict[str, Any]]]]:
+    """:func:`analyze_match_timeline_series` for all ten participants.
+
+    The match and team averages are computed once as frame x participant
+    matrices and shared by every player; lane opponents and teams come from
+    *match_data* when given.  Returns ``{participant_id: series}``.
+    """
+    parsed = parse_timeline(timeline_data)
+    if parsed is None:
         return {}
+    matrices = _series_matrices(parsed, team_ids_from_match(match_data))
+    opponents = lane_opponents_from_match(match_data)
+    return {
+        i + 1: _series_for(parsed, matrices, i, participant_index(opponents.get(i + 1)))
+        for i in range(PARTICIPANTS)
+    }
 
 
 def extract_heatmap_data(
@@ -291,113 +356,141 @@ def extract_heatmap_data(
     match_data: Dict[str, Any]
 ) -> Dict[str, Any]:
     """Extract spatial data from timeline for heatmap visualization."""
-    if not timeline_data or not match_data:
+    if not match_data:
+        return {}
+    parsed = parse_timeline(timeline_data)
+    if parsed is None:
         return {}
 
-    try:
-        info = _get_attr_or_key(timeline_data, 'info', {})
-        frames = _get_attr_or_key(info, 'frames', [])
-        if not frames:
-            return {}
-
-        match_info = match_data.get('info', {}) if isinstance(match_data, dict) else {}
-        match_participants = match_info.get('participants', [])
-        participant_lookup = {}
-        for p in match_participants:
-            pid = p.get('participantId')
-            if pid:
-                participant_lookup[pid] = {
-                    'championName': p.get('championName', 'Unknown'),
-                    'teamId': p.get('teamId', 0),
-                }
-
-        participant_positions: Dict[int, List[Dict[str, Any]]] = {pid: [] for pid in range(1, 11)}
-        prev_gold: Dict[int, int] = {}
-        kill_events = []
-        ward_events = []
-
-        for frame in frames:
-            timestamp = _get_attr_or_key(frame, 'timestamp', 0)
-            participant_frames = _get_attr_or_key(frame, 'participantFrames', {})
-            if participant_frames:
-                for pid in range(1, 11):
-                    p_data = _get_attr_or_key(participant_frames, str(pid))
-                    if not p_data:
-                        continue
-                    position = _get_attr_or_key(p_data, 'position', {})
-                    if not position:
-                        continue
-                    x = _get_attr_or_key(position, 'x', 0)
-                    y = _get_attr_or_key(position, 'y', 0)
-                    if x == 0 and y == 0:
-                        continue
-                    total_gold = _get_attr_or_key(p_data, 'totalGold', 0)
-                    gold_delta = total_gold - prev_gold.get(pid, total_gold)
-                    prev_gold[pid] = total_gold
-                    participant_positions[pid].append({
-                        'x': x, 'y': y,
-                        'timestamp': timestamp,
-                        'totalGold': total_gold,
-                        'goldDelta': max(0, gold_delta),
-                    })
-
-            events = _get_attr_or_key(frame, 'events', [])
-            if events:
-                for event in events:
-                    event_type = _get_attr_or_key(event, 'type', '')
-
-                    if event_type == 'CHAMPION_KILL':
-                        pos = _get_attr_or_key(event, 'position', {})
-                        ex = _get_attr_or_key(pos, 'x', 0)
-                        ey = _get_attr_or_key(pos, 'y', 0)
-                        if ex == 0 and ey == 0:
-                            continue
-                        kill_events.append({
-                            'x': ex, 'y': ey,
-                            'killerId': _get_attr_or_key(event, 'killerId', 0),
-                            'victimId': _get_attr_or_key(event, 'victimId', 0),
-                            'assistingParticipantIds': _get_attr_or_key(event, 'assistingParticipantIds', []),
-                            'timestamp': _get_attr_or_key(event, 'timestamp', timestamp),
-                        })
-
-                    elif event_type == 'WARD_PLACED':
-                        creator_id = _get_attr_or_key(event, 'creatorId', 0)
-                        wx, wy = 0, 0
-                        pos = _get_attr_or_key(event, 'position', {})
-                        if pos:
-                            wx = _get_attr_or_key(pos, 'x', 0)
-                            wy = _get_attr_or_key(pos, 'y', 0)
-                        if (wx == 0 and wy == 0) and creator_id and participant_frames:
-                            creator_data = _get_attr_or_key(participant_frames, str(creator_id))
-                            if creator_data:
-                                creator_pos = _get_attr_or_key(creator_data, 'position', {})
-                                if creator_pos:
-                                    wx = _get_attr_or_key(creator_pos, 'x', 0)
-                                    wy = _get_attr_or_key(creator_pos, 'y', 0)
-                        if wx == 0 and wy == 0:
-                            continue
-                        ward_events.append({
-                            'x': wx, 'y': wy,
-                            'wardType': _get_attr_or_key(event, 'wardType', 'UNDEFINED'),
-                            'creatorId': creator_id,
-                            'timestamp': _get_attr_or_key(event, 'timestamp', timestamp),
-                        })
-
-        participants = []
-        for pid in range(1, 11):
-            lookup = participant_lookup.get(pid, {})
-            participants.append({
-                'participantId': pid,
-                'championName': lookup.get('championName', 'Unknown'),
-                'teamId': lookup.get('teamId', 0),
-                'positions': participant_positions.get(pid, []),
-            })
-
-        return {
-            'participants': participants,
-            'kill_events': kill_events,
-            'ward_events': ward_events,
-        }
+    match_info = match_data.get('info', {}) if isinstance(match_data, dict) else {}
+    participant_lookup = {}
+    for p in match_info.get('participants', []):
+        pid = p.get('participantId')
+        if pid:
+            participant_lookup[pid] = {
+                'championName': p.get('championName', 'Unknown'),
+                'teamId': p.get('teamId', 0),
+            }
 
-    except Exception:
-        return {}
+    on_map = parsed.has_position & ~((parsed.x == 0) & (parsed.y == 0))
+    timestamps = parsed.timestamps
+
+    participants = []
+    for i in range(PARTICIPANTS):
+        frames = on_map[:, i]
+        gold = parsed.total_gold[frames, i]
+        # Gold gained since the previous recorded position (first one is 0).
+        gold_delta = np.maximum(0, np.diff(gold, prepend=gold[:1]))
+        positions = [
+            {'x': x, 'y': y, 'timestamp': ts, 'totalGold': g, 'goldDelta': d}
+            for x, y, ts, g, d in zip(
+                parsed.x[frames, i].tolist(),
+                parsed.y[frames, i].tolist(),
+                timestamps[frames].tolist(),
+                gold.tolist(),
+                gold_delta.tolist(),
+            )
+        ]
+        lookup = participant_lookup.get(i + 1, {})
+        participants.append({
+            'participantId': i + 1,
+            'championName': lookup.get('championName', 'Unknown'),
+            'teamId': lookup.get('teamId', 0),
+            'positions': positions,
+        })
+
+    events = parsed.events
+    kill_events = []
+    ward_events = []
+    if len(events):
+        ex, ey = event_positions(parsed)
+        keep = ~((ex == 0) & (ey == 0))
+        xs, ys = ex.tolist(), ey.tolist()
+        ts = events.timestamp.tolist()
+        killers = events.killer_id.tolist()
+        victims = events.victim_id.tolist()
+        creators = events.creator_id.tolist()
+        for e in np.flatnonzero(keep).tolist():
+            if events.type[e] == EVENT_CHAMPION_KILL:
+                kill_events.append({
+                    'x': xs[e], 'y': ys[e],
+                    'killerId': killers[e],
+                    'victimId': victims[e],
+                    'assistingParticipantIds': events.assisting[e],
+                    'timestamp': ts[e],
+                })
+            else:
+                ward_events.append({
+                    'x': xs[e], 'y': ys[e],
+                    'wardType': events.ward_type[e],
+                    'creatorId': creators[e],
+                    'timestamp': ts[e],
+                })
+
+    return {
+        'participants': participants,
+        'kill_events': kill_events,
+        'ward_events': ward_events,
+    }
+
+
+TIMELINE_OUTPUTS = ('lane_lead', 'lane_leads', 'territory', 'territory_all', 'series', 'series_all', 'heatmap')
+
+
+def extract_timeline_metrics(
+    timeline_data: Any,
+    outputs: Sequence[str],
+    *,
+    participant_id: Optional[int] = None,
+    enemy_participant_id: Optional[int] = None,
+    team_id: Optional[int] = None,
+    match_data: Optional[Dict[str, Any]] = None,
+    lane_lead_minute: int = 14,
+    lane_lead_minutes: Sequence[int] = LANE_LEAD_CHECKPOINTS,
+) -> Dict[str, Any]:
+    """Compute several timeline metrics from a single parse of the timeline.
+
+    *outputs* selects any of :data:`TIMELINE_OUTPUTS`:
+
+    - ``lane_lead``: ``(gold_lead, xp_lead)`` at *lane_lead_minute* (needs
+      *participant_id* and *enemy_participant_id*)
+    - ``lane_leads``: ``{minute: lead}`` for every *lane_lead_minutes* entry
+    - ``territory``: the player's territorial metrics (needs *participant_id*
+      and *team_id*)
+    - ``territory_all``: territorial metrics for all ten participants
+    - ``series``: :func:`analyze_match_timeline_series` output
+    - ``series_all``: :func:`analyze_match_timeline_series_all` output (uses
+      *match_data* for teams and lane opponents when given)
+    - ``heatmap``: :func:`extract_heatmap_data` output (needs *match_data*)
+
+    Frames and events are walked once by :func:`parse_timeline`; every output
+    is then derived from the shared arrays.  Returns ``{output: value}``; a
+    timeline without frames yields the same empty values as the individual
+    functions.
+    """
+    unknown = [o for o in outputs if o not in TIMELINE_OUTPUTS]
+    if unknown:
+        raise ValueError(f"Unknown timeline outputs: {unknown}")
+
+    parsed = parse_timeline(timeline_data)
+    result: Dict[str, Any] = {}
+    for output in outputs:
+        if output == 'lane_lead':
+            result[output] = extract_lane_lead_at_minute(
+                parsed, participant_id, enemy_participant_id, lane_lead_minute
+            )
+        elif output == 'lane_leads':
+            result[output] = extract_lane_leads_at_minutes(
+                parsed, participant_id, enemy_participant_id, lane_lead_minutes
+            )
+        elif output == 'territory':
+            result[output] = calculate_territory_metrics(parsed, participant_id, team_id)
+        elif output == 'territory_all':
+            result[output] = calculate_territory_metrics_all(parsed)
+        elif output == 'series':
+            result[output] = analyze_match_timeline_series(parsed, participant_id, enemy_participant_id)
+        elif output == 'series_all':
+            result[output] = analyze_match_timeline_series_all(parsed, match_data)
+        elif output == 'heatmap':
+            result[output] = extract_heatmap_data(parsed, match_data)
+    return result
@@ -0,0 +1,279 @@
+"""One-shot parser turning a Riot match timeline into NumPy arrays.
+
+Timelines arrive either as the client library's Pydantic DTOs or as plain
+dicts (cached / test data).  Walking them field by field with attribute and
+key fallbacks is slow, and every metric used to walk the same frames again.
+:func:`parse_timeline` does the walk once and returns a
+:class:`ParsedTimeline`: ``frames x 10`` arrays for position, gold and xp plus
+a compact column table of the events the metrics care about.  Every function
+in :mod:`ml.timeline_analysis` accepts either the raw timeline or this form.
+"""
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+PARTICIPANTS = 10
+# Summoner's Rift centre (map is ~14500x14500 units)
+MAP_CENTER_X = 7250
+MAP_CENTER_Y = 7250
+_PID_KEYS = tuple(str(pid) for pid in range(1, PARTICIPANTS + 1))
+
+EVENT_CHAMPION_KILL = 'CHAMPION_KILL'
+EVENT_WARD_PLACED = 'WARD_PLACED'
+# Only these event types are kept; everything else is dropped while parsing.
+_EVENT_TYPES = (EVENT_CHAMPION_KILL, EVENT_WARD_PLACED)
+
+
+@dataclass
+class EventTable:
+    """Column store for timeline events, one row per kept event.
+
+    ``x``/``y`` are the event position (0 when Riot sent none).  Participant
+    id columns are 0 when not applicable.
+    """
+
+    type: np.ndarray          # (E,) object, one of _EVENT_TYPES
+    frame: np.ndarray         # (E,) int32 index into the frame arrays
+    timestamp: np.ndarray     # (E,) int64 ms
+    x: np.ndarray             # (E,) int32
+    y: np.ndarray             # (E,) int32
+    killer_id: np.ndarray     # (E,) int16
+    victim_id: np.ndarray     # (E,) int16
+    creator_id: np.ndarray    # (E,) int16
+    ward_type: List[str]
+    assisting: List[List[int]]
+
+    def __len__(self) -> int:
+        return int(self.frame.size)
+
+
+@dataclass
+class ParsedTimeline:
+    """Typed view of a timeline.
+
+    Frame arrays are indexed ``[frame, participant_id - 1]``.  ``present``
+    marks participant frames that exist, ``has_position`` those that also
+    carried a position.  Missing numbers are stored as 0, matching what the
+    dict-walking code used to default to; a position missing one coordinate
+    takes the map centre's, as the territory metrics always assumed.
+    """
+
+    timestamps: np.ndarray    # (F,) int64 ms
+    present: np.ndarray       # (F, 10) bool
+    has_position: np.ndarray  # (F, 10) bool
+    x: np.ndarray             # (F, 10) int64
+    y: np.ndarray             # (F, 10) int64
+    total_gold: np.ndarray    # (F, 10) int64
+    xp: np.ndarray            # (F, 10) int64
+    events: EventTable
+
+    @property
+    def frame_count(self) -> int:
+        return int(self.timestamps.size)
+
+
+# Only the fields the metrics read; participant frames also carry large
+# championStats/damageStats blocks that are not worth dumping.
+_DUMP_INCLUDE = {
+    'info': {
+        'frames': {
+            '__all__': {
+                'timestamp': True,
+                'events': True,
+                'participantFrames': {'__all__': {'totalGold', 'xp', 'position'}},
+            },
+        },
+    },
+}
+
+
+def _as_dict(obj: Any) -> Any:
+    # A single pydantic-core dump is far cheaper than per-field getattr.
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump(by_alias=True, exclude_none=True, include=_DUMP_INCLUDE)
+    return obj
+
+
+def parse_timeline(timeline_data: Any) -> Optional[ParsedTimeline]:
+    """Parse a raw timeline; returns ``None`` when it has no frames or is malformed."""
+    if isinstance(timeline_data, ParsedTimeline):
+        return timeline_data
+    if not timeline_data:
+        return None
+    try:
+        return _parse(_as_dict(timeline_data))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def compact_timeline(timeline_data: Any) -> Optional[dict]:
+    """Plain-dict timeline holding only what :func:`parse_timeline` reads.
+
+    Drops unused participant-frame fields and event types, which shrinks a
+    timeline by an order of magnitude; used for persisting timelines.
+    """
+    timeline = _as_dict(timeline_data)
+    if not isinstance(timeline, dict):
+        return None
+    frames = []
+    for frame in (timeline.get('info') or {}).get('frames') or ():
+        participant_frames = {}
+        for key, p_data in (frame.get('participantFrames') or {}).items():
+            if p_data:
+                participant_frames[str(key)] = {
+                    k: p_data[k] for k in ('totalGold', 'xp', 'position') if p_data.get(k) is not None
+                }
+        frames.append({
+            'timestamp': frame.get('timestamp') or 0,
+            'participantFrames': participant_frames,
+            'events': [e for e in frame.get('events') or () if e.get('type') in _EVENT_TYPES],
+        })
+    if not frames:
+        return None
+    return {'info': {'frames': frames}}
+
+
+def _parse(timeline: Any) -> Optional[ParsedTimeline]:
+    if not isinstance(timeline, dict):
+        return None
+    frames = (timeline.get('info') or {}).get('frames') or []
+    if not frames:
+        return None
+
+    n = len(frames)
+    timestamps = np.zeros(n, dtype=np.int64)
+    # Filled through flat Python lists; one np.array() call per column is
+    # much cheaper than n*10 element assignments into ndarrays.
+    present = [False] * (n * PARTICIPANTS)
+    has_position = [False] * (n * PARTICIPANTS)
+    xs = [0] * (n * PARTICIPANTS)
+    ys = [0] * (n * PARTICIPANTS)
+    gold = [0] * (n * PARTICIPANTS)
+    xp = [0] * (n * PARTICIPANTS)
+
+    ev_type: List[str] = []
+    ev_frame: List[int] = []
+    ev_ts: List[int] = []
+    ev_x: List[int] = []
+    ev_y: List[int] = []
+    ev_killer: List[int] = []
+    ev_victim: List[int] = []
+    ev_creator: List[int] = []
+    ev_ward: List[str] = []
+    ev_assist: List[List[int]] = []
+
+    for f, frame in enumerate(frames):
+        frame_ts = frame.get('timestamp') or 0
+        timestamps[f] = frame_ts
+
+        participant_frames = frame.get('participantFrames')
+        if participant_frames:
+            base = f * PARTICIPANTS
+            for i, key in enumerate(_PID_KEYS):
+                p_data = participant_frames.get(key)
+                if p_data is None:
+                    p_data = participant_frames.get(i + 1)
+                if not p_data:
+                    continue
+                present[base + i] = True
+                gold[base + i] = p_data.get('totalGold') or 0
+                xp[base + i] = p_data.get('xp') or 0
+                position = p_data.get('position')
+                if position:
+                    has_position[base + i] = True
+                    x = position.get('x')
+                    y = position.get('y')
+                    xs[base + i] = MAP_CENTER_X if x is None else x
+                    ys[base + i] = MAP_CENTER_Y if y is None else y
+
+        for event in frame.get('events') or ():
+            event_type = event.get('type')
+            if event_type not in _EVENT_TYPES:
+                continue
+            position = event.get('position') or {}
+            ev_type.append(event_type)
+            ev_frame.append(f)
+            ev_ts.append(event.get('timestamp', frame_ts) or 0)
+            ev_x.append(position.get('x') or 0)
+            ev_y.append(position.get('y') or 0)
+            ev_killer.append(event.get('killerId') or 0)
+            ev_victim.append(event.get('victimId') or 0)
+            ev_creator.append(event.get('creatorId') or 0)
+            ev_ward.append(event.get('wardType') or 'UNDEFINED')
+            ev_assist.append(list(event.get('assistingParticipantIds') or []))
+
+    shape = (n, PARTICIPANTS)
+    events = EventTable(
+        type=np.array(ev_type, dtype=object),
+        frame=np.array(ev_frame, dtype=np.int32),
+        timestamp=np.array(ev_ts, dtype=np.int64),
+        x=np.array(ev_x, dtype=np.int32),
+        y=np.array(ev_y, dtype=np.int32),
+        killer_id=np.array(ev_killer, dtype=np.int16),
+        victim_id=np.array(ev_victim, dtype=np.int16),
+        creator_id=np.array(ev_creator, dtype=np.int16),
+        ward_type=ev_ward,
+        assisting=ev_assist,
+    )
+    return ParsedTimeline(
+        timestamps=timestamps,
+        present=np.array(present, dtype=bool).reshape(shape),
+        has_position=np.array(has_position, dtype=bool).reshape(shape),
+        x=np.array(xs, dtype=np.int64).reshape(shape),
+        y=np.array(ys, dtype=np.int64).reshape(shape),
+        total_gold=np.array(gold, dtype=np.int64).reshape(shape),
+        xp=np.array(xp, dtype=np.int64).reshape(shape),
+        events=events,
+    )
+
+
+def participant_index(participant_id: Any) -> Optional[int]:
+    """Column index for a 1-based participant id, or ``None`` if out of range."""
+    try:
+        pid = int(participant_id)
+    except (TypeError, ValueError):
+        return None
+    if 1 <= pid <= PARTICIPANTS:
+        return pid - 1
+    return None
+
+
+def frame_indices(parsed: ParsedTimeline, target_ms: Any) -> np.ndarray:
+    """Index of the frame closest to each target timestamp (ms).
+
+    Frame timestamps are sorted (Riot emits one frame per ``frameInterval``),
+    so this is a binary search per target instead of a scan over all frames.
+    Ties go to the earlier frame.
+    """
+    targets = np.atleast_1d(np.asarray(target_ms, dtype=np.int64))
+    ts = parsed.timestamps
+    right = np.clip(np.searchsorted(ts, targets, side='left'), 0, ts.size - 1)
+    left = np.maximum(right - 1, 0)
+    use_left = np.abs(targets - ts[left]) <= np.abs(ts[right] - targets)
+    return np.where(use_left, left, right)
+
+
+def event_positions(parsed: ParsedTimeline) -> Tuple[np.ndarray, np.ndarray]:
+    """Event ``(x, y)`` as int64 arrays, with the ward-position fallback.
+
+    Wards without a position fall back to the creator's position in the
+    same frame.  Events still at ``(0, 0)`` have no usable position.
+    """
+    events = parsed.events
+    ex = events.x.astype(np.int64)
+    ey = events.y.astype(np.int64)
+
+    creator_idx = events.creator_id.astype(np.int64) - 1
+    fallback = (
+        (events.type == EVENT_WARD_PLACED) & (ex == 0) & (ey == 0)
+        & (creator_idx >= 0) & (creator_idx < PARTICIPANTS)
+    )
+    if fallback.any():
+        frames = events.frame[fallback]
+        cols = creator_idx[fallback]
+        known = parsed.has_position[frames, cols]
+        rows = np.flatnonzero(fallback)[known]
+        ex[rows] = parsed.x[frames[known], cols[known]]
+        ey[rows] = parsed.y[frames[known], cols[known]]
+    return ex, ey
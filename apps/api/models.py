@@ -1,18 +1,34 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, ForeignKey, DateTime, JSON, BigInteger, Index
+from sqlalchemy import Column, String, Integer, Float, Boolean, ForeignKey, DateTime, JSON, BigInteger, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
 
+def utcnow() -> datetime.datetime:
+    """Current UTC time, naive like the ``DateTime`` columns."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def normalize_riot_id(value: str) -> str:
+    """Case-insensitive form of a Riot ID game name or tag line."""
+    return (value or "").strip().casefold()
+
+
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Riot IDs are case-insensitive; account resolution is one point lookup.
+        Index('uq_users_riot_id', 'region', 'normalized_name', 'normalized_tag', unique=True),
+    )
 
     puuid = Column(String, primary_key=True, index=True)
     game_name = Column(String, index=True)
     tag_line = Column(String, index=True)
+    normalized_name = Column(String)  # normalize_riot_id(game_name)
+    normalized_tag = Column(String)   # normalize_riot_id(tag_line)
     region = Column(String)
     profile_icon_id = Column(Integer)
     summoner_level = Column(Integer)
-    last_updated = Column(DateTime, default=datetime.datetime.utcnow)
+    last_updated = Column(DateTime, default=utcnow)
 
 class Match(Base):
     __tablename__ = "matches"
@@ -36,6 +52,11 @@ class Participant(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     match_id = Column(String, ForeignKey("matches.match_id"))
     puuid = Column(String, index=True)
+
+    # Copied from Match so "a player's last N games" is a range scan on
+    # idx_participant_puuid_creation instead of a join-then-sort.
+    game_creation = Column(BigInteger)
+    queue_id = Column(Integer)
     
     # Core stats for ML
     champion_id = Column(Integer)
@@ -57,3 +78,92 @@ class Participant(Base):
     
     match = relationship("Match", back_populates="participants")
 
+
+Index('idx_participant_puuid_creation', Participant.puuid, Participant.game_creation.desc())
+
+
+class MatchPositionGrid(Base):
+    """Binned positions of one match, stored once and summed on demand.
+
+    ``entries`` is the packed array produced by
+    ``ml.heatmap_encoding.match_grid_entries``; rows are rebuilt when
+    ``version`` no longer matches ``GRID_ENTRIES_VERSION``.
+    """
+    __tablename__ = "match_position_grids"
+
+    match_id = Column(String, ForeignKey("matches.match_id"), primary_key=True)
+    bins = Column(Integer, primary_key=True)
+    version = Column(Integer)
+    entries = Column(LargeBinary)
+    created_at = Column(DateTime, default=utcnow)
+
+
+class MatchTimeline(Base):
+    """Compact, zlib-compressed timeline JSON (see ``services.timelines``)."""
+    __tablename__ = "match_timelines"
+
+    match_id = Column(String, ForeignKey("matches.match_id"), primary_key=True)
+    data = Column(LargeBinary)
+    created_at = Column(DateTime, default=utcnow)
+
+
+class LeagueSnapshot(Base):
+    """Ranked standing of a player in one queue, as returned by league-v4.
+
+    A row is appended whenever the standing changes, so rows per
+    ``(puuid, queue_type)`` form the LP history; ``checked_at`` records the
+    last time Riot confirmed the latest row.
+    """
+    __tablename__ = "league_snapshots"
+    __table_args__ = (
+        Index('idx_league_snapshot_puuid_queue', 'puuid', 'queue_type', 'captured_at'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    puuid = Column(String, nullable=False)
+    queue_type = Column(String, nullable=False)
+    tier = Column(String)
+    rank = Column(String)
+    league_points = Column(Integer)
+    wins = Column(Integer)
+    losses = Column(Integer)
+    data = Column(JSON)  # full league entry dict
+    captured_at = Column(DateTime, default=utcnow)
+    checked_at = Column(DateTime, default=utcnow)
+
+
+class MatchArchive(Base):
+    """Matches moved out of ``matches`` by ``services.retention``."""
+    __tablename__ = "matches_archive"
+
+    match_id = Column(String, primary_key=True)
+    platform_id = Column(String)
+    game_creation = Column(BigInteger)
+    game_duration = Column(Integer)
+    game_version = Column(String)
+    queue_id = Column(Integer)
+    data = Column(JSON)
+    archived_at = Column(DateTime, default=utcnow)
+
+
+class ParticipantArchive(Base):
+    """Participants of archived matches; ``id`` is the original row id."""
+    __tablename__ = "participants_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    match_id = Column(String, index=True)
+    puuid = Column(String)
+    game_creation = Column(BigInteger)
+    queue_id = Column(Integer)
+    champion_id = Column(Integer)
+    team_id = Column(Integer)
+    win = Column(Boolean)
+    kills = Column(Integer)
+    deaths = Column(Integer)
+    assists = Column(Integer)
+    gold_per_minute = Column(Float)
+    total_minions_killed = Column(Integer)
+    vision_score = Column(Float)
+    damage_dealt_to_champions = Column(Integer)
+    stats_json = Column(JSON)
+    archived_at = Column(DateTime, default=utcnow)
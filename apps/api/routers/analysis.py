@@ -1,22 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
-from database import get_db
+from database import MAX_CONCURRENT_ANALYSES, AsyncSessionLocal, get_db, get_session_factory
 from services.ingestion import IngestionService
 from services.riot import riot_service
 from services.ddragon import get_ddragon_version
 from ml.pipeline import load_player_data
 from ml.training import model_instance
-from ml.timeline_analysis import aggregate_territory_metrics, analyze_match_timeline_series, extract_heatmap_data, extract_lane_lead_at_minute, calculate_territory_metrics
+from ml.timeline_analysis import LANE_LEAD_CHECKPOINTS, aggregate_territory_metrics, analyze_match_timeline_series_all, extract_heatmap_data, extract_timeline_metrics, team_territory_metrics
+from ml.heatmap_encoding import DEFAULT_GRID_BINS, MAX_GRID_BINS, encode_heatmap_columnar, encode_heatmap_grid
+from services.serialization import dumps, ndjson_line
+from services.metrics import (
+    ANALYSIS_QUEUE_WAIT_SECONDS,
+    ANALYSIS_TOTAL_SECONDS,
+    TIMELINE_CACHE_REQUESTS_TOTAL,
+    StageTimings,
+)
+from services.stage_graph import StageError, StageGraph
+from services.heatmaps import aggregate_player_heatmap
+from services.timelines import load_timeline, seed_timeline_cache
+from services.league import get_league_entries, league_history, league_platform
+from services.retention import match_data_from_participants
+from collections import OrderedDict
 from models import Match, Participant
 from pydantic import BaseModel
 from typing import Optional
 import asyncio
-import numpy as np
+import hashlib
 import math
-import json
 import os
 import time
 import logging
@@ -75,191 +87,217 @@ class AnalysisQueue:
         self._sem.release()
 
 
-_raw_max_analysis = os.getenv("MAX_CONCURRENT_ANALYSES", "3")
-try:
-    _max_analysis = max(1, int(_raw_max_analysis))
-except Exception:
-    _max_analysis = 3
+analysis_queue = AnalysisQueue(max_concurrent=MAX_CONCURRENT_ANALYSES)
 
-analysis_queue = AnalysisQueue(max_concurrent=_max_analysis)
+# model_instance is shared by every request: training runs in a worker
+# thread, and this lock keeps a concurrent train() from swapping the model
+# underneath another request's fit or prediction.
+_model_lock = asyncio.Lock()
 
 
 LANE_LEAD_MATCH_LIMIT_MAX = 21
 LANE_LEAD_TARGET_MINUTE = 14
 
 
-async def _compute_recent_lane_leads_at_minute(
+async def _fetch_timeline(
+    timeline_cache: dict,
+    regional_routing: str,
+    match_id: str,
+    sem: asyncio.Semaphore | None = None,
+    session_factory=AsyncSessionLocal,
+):
+    """Return a match timeline, consulting and filling *timeline_cache*.
+
+    Timelines are returned already parsed (see
+    :func:`ml.timeline_parsing.parse_timeline`), so every consumer of the
+    cache reuses the same arrays.  The cache maps match ids to fetch tasks
+    rather than timelines, so stages running concurrently share one in-flight
+    request per match.  Misses go through :func:`load_timeline`, which reads
+    ``match_timelines`` first and stores what it has to fetch.
+    """
+    task = timeline_cache.get(match_id)
+    if task is not None:
+        TIMELINE_CACHE_REQUESTS_TOTAL.inc(result="hit")
+        return await task
+
+    TIMELINE_CACHE_REQUESTS_TOTAL.inc(result="miss")
+
+    async def _get():
+        if sem is not None:
+            async with sem:
+                return await load_timeline(str(match_id), regional_routing, session_factory)
+        return await load_timeline(str(match_id), regional_routing, session_factory)
+
+    task = asyncio.ensure_future(_get())
+    timeline_cache[match_id] = task
+    return await task
+
+
+TERRITORY_MATCH_LIMIT = 5
+
+
+
+def _empty_lane_leads(minutes) -> dict:
+    leads = {"laneLeadSampleSize": 0}
+    for minute in minutes:
+        leads[f"laneGoldLeadAt{minute}"] = 0.0
+        leads[f"laneXpLeadAt{minute}"] = 0.0
+    return leads
+
+
+async def analyze_recent_timelines(
     db: AsyncSession,
     puuid: str,
     platform_region: str,
     target_minute: int = LANE_LEAD_TARGET_MINUTE,
-    limit: int = LANE_LEAD_MATCH_LIMIT_MAX,
+    lane_lead_limit: int = LANE_LEAD_MATCH_LIMIT_MAX,
+    territory_limit: int = TERRITORY_MATCH_LIMIT,
     timeline_cache: dict | None = None,
-) -> dict:
-    """Compute average lane-opponent gold/xp leads at a target minute across recent matches.
-
-    Uses the lightweight ``extract_lane_lead_at_minute`` instead of building
-    a full timeline series per match, and relies on the library's built-in
-    rate limiter instead of explicit sleeps.
-
-    *timeline_cache* is an optional ``{match_id: timeline}`` dict that is
-    both read from and written to so other consumers can reuse fetched
-    timelines.
-
-    Returns keys:
-      - laneGoldLeadAt14
-      - laneXpLeadAt14
-      - laneLeadSampleSize
+    session_factory=AsyncSessionLocal,
+) -> tuple[dict, dict]:
+    """Lane leads and territorial control from the player's recent timelines.
+
+    Each timeline is fetched once and goes through a single
+    :func:`extract_timeline_metrics` call that produces everything needed
+    for that match: the lane-opponent gold/xp lead at *target_minute* and at
+    every :data:`LANE_LEAD_CHECKPOINTS` minute for the last
+    *lane_lead_limit* matches, and territory metrics for the last
+    *territory_limit*.  Riot's ``challenges.*GoldExpAdvantage`` is unreliable,
+    so the timeline is the source of truth for lane leads.
+
+    *timeline_cache* is an optional dict shared with :func:`_fetch_timeline`
+    so other consumers can reuse fetched timelines.
+
+    Returns ``(lane_leads, territory_metrics)``.  ``lane_leads`` has
+    ``laneGoldLeadAt{m}`` / ``laneXpLeadAt{m}`` per checkpoint minute and
+    ``laneLeadSampleSize`` (matches with a lead at *target_minute*);
+    ``territory_metrics`` holds the player's averages plus ``team`` and
+    ``enemy_team`` sub-dicts with the same metrics averaged per side (empty
+    when no timeline was usable).
     """
     if timeline_cache is None:
         timeline_cache = {}
+    minutes = sorted(set(LANE_LEAD_CHECKPOINTS) | {int(target_minute)})
 
     try:
         result = await db.execute(
             select(Participant, Match)
             .join(Match)
             .where(Participant.puuid == puuid)
-            .order_by(Match.game_creation.desc())
-            .limit(limit)
+            .order_by(Participant.game_creation.desc())
+            .limit(max(lane_lead_limit, territory_limit))
         )
         rows = result.all()
-        if not rows:
-            return {"laneGoldLeadAt14": 0.0, "laneXpLeadAt14": 0.0, "laneLeadSampleSize": 0}
-
-        regional_routing = REGION_TO_ROUTING.get((platform_region or "").lower(), "europe")
-
-        # Throttle concurrent timeline API requests
-        _timeline_sem = asyncio.Semaphore(3)
-
-        async def _one(participant: Participant, match: Match):
-            if match is None:
-                return None
-
-            match_id = getattr(match, "match_id", None)
-            match_data = getattr(match, "data", None)
-            if match_id is None or match_data is None:
-                return None
-
-            if not isinstance(match_data, dict):
-                return None
-
-            info = (match_data or {}).get("info", {})
-            participants = info.get("participants", []) if isinstance(info, dict) else []
-            me = next((p for p in participants if p.get("puuid") == puuid), None)
-            if not me:
-                return None
-
-            my_team = me.get("teamId")
-            my_role = me.get("teamPosition")
-            my_pid = me.get("participantId")
-            if not my_team or not my_role or not my_pid:
-                return None
-
-            enemy = next(
-                (
-                    p
-                    for p in participants
-                    if p.get("teamId") != my_team and p.get("teamPosition") == my_role
-                ),
-                None,
-            )
-            if not enemy:
-                return None
-            enemy_pid = enemy.get("participantId")
-            if not enemy_pid:
-                return None
-
-            # Fetch timeline (cache-aware, no explicit sleep – library rate-limits)
-            if match_id in timeline_cache:
-                timeline = timeline_cache[match_id]
-            else:
-                async with _timeline_sem:
-                    timeline = await riot_service.get_match_timeline(regional_routing, str(match_id))
-                timeline_cache[match_id] = timeline
-
-            if not timeline:
-                return None
-
-            # Lightweight extraction – single frame lookup instead of full series
-            lead = extract_lane_lead_at_minute(timeline, int(my_pid), int(enemy_pid), target_minute)
-            if lead is None:
-                return None
-
-            gold_lead, xp_lead = lead
-            if not math.isfinite(gold_lead) or not math.isfinite(xp_lead):
-                return None
-            return (gold_lead, xp_lead)
-
-        # Fetch timelines concurrently; RiotClient already rate-limits internally.
-        tasks = [_one(participant, match) for participant, match in rows]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        gold_vals = []
-        xp_vals = []
-        for r in results:
-            if isinstance(r, Exception) or r is None:
-                continue
-            if not (isinstance(r, tuple) and len(r) == 2):
-                continue
-            g, x = r
-            try:
-                gold_vals.append(float(g))
-                xp_vals.append(float(x))
-            except Exception:
-                continue
-
-        sample = min(len(gold_vals), len(xp_vals))
-        if sample <= 0:
-            return {"laneGoldLeadAt14": 0.0, "laneXpLeadAt14": 0.0, "laneLeadSampleSize": 0}
-
-        return {
-            "laneGoldLeadAt14": float(sum(gold_vals) / len(gold_vals)),
-            "laneXpLeadAt14": float(sum(xp_vals) / len(xp_vals)),
-            "laneLeadSampleSize": int(sample),
-        }
-    except Exception as e:
-        logger.exception("Error computing recent lane leads")
-        return {"laneGoldLeadAt14": 0.0, "laneXpLeadAt14": 0.0, "laneLeadSampleSize": 0}
-
-router = APIRouter(prefix="/api")
+        # Matches past the retention window have no raw JSON left.
+        stripped = await match_data_from_participants(
+            db, [match.match_id for _, match in rows if not isinstance(match.data, dict)]
+        )
+        # End the read transaction so no pooled connection is held while the
+        # timelines download (expire_on_commit=False keeps the rows loaded).
+        await db.commit()
+    except Exception:
+        logger.exception("Error loading recent matches for timeline analysis")
+        return _empty_lane_leads(minutes), {}
+    if not rows:
+        return _empty_lane_leads(minutes), {}
+
+    regional_routing = REGION_TO_ROUTING.get((platform_region or "").lower(), "europe")
+
+    # Throttle concurrent timeline API requests
+    _timeline_sem = asyncio.Semaphore(3)
+
+    async def _one(index: int, participant: Participant, match: Match):
+        match_id = getattr(match, "match_id", None)
+        match_data = getattr(match, "data", None)
+        if not isinstance(match_data, dict):
+            match_data = stripped.get(match_id)
+        if match_id is None or not isinstance(match_data, dict):
+            return None
 
-class NumpyEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, np.integer):
-            return int(o)
-        if isinstance(o, np.floating):
-            if np.isnan(o) or np.isinf(o):
-                return None
-            return float(o)
-        if isinstance(o, np.bool_):
-            return bool(o)
-        if isinstance(o, np.ndarray):
-            return o.tolist()
-        if isinstance(o, float):
-            if math.isnan(o) or math.isinf(o):
-                return None
-            return o
-        return super().default(o)
-
-def sanitize_for_json(obj):
-    """Recursively sanitize a data structure for JSON serialization."""
-    if isinstance(obj, dict):
-        return {k: sanitize_for_json(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [sanitize_for_json(item) for item in obj]
-    elif isinstance(obj, float):
-        if math.isnan(obj) or math.isinf(obj):
+        me, enemy = _lane_opponent(match_data, puuid)
+        if not me:
             return None
-        return obj
-    elif isinstance(obj, (np.floating, np.integer)):
-        if isinstance(obj, np.floating) and (np.isnan(obj) or np.isinf(obj)):
+        my_pid = me.get("participantId") or (participant.stats_json or {}).get("participantId")
+        enemy_pid = (enemy or {}).get("participantId")
+
+        outputs = []
+        if index < lane_lead_limit and my_pid and enemy_pid and me.get("teamId"):
+            outputs.append("lane_leads")
+        if index < territory_limit and my_pid:
+            outputs.append("territory_all")
+        if not outputs:
+            return None
+
+        # Fetch timeline (cache-aware, no explicit sleep – library rate-limits)
+        timeline = await _fetch_timeline(timeline_cache, regional_routing, match_id, _timeline_sem, session_factory)
+        if not timeline:
             return None
-        return obj.item()
-    elif isinstance(obj, np.bool_):
-        return bool(obj)
-    elif isinstance(obj, np.ndarray):
-        return sanitize_for_json(obj.tolist())
-    return obj
+
+        metrics = extract_timeline_metrics(
+            timeline,
+            outputs,
+            participant_id=int(my_pid),
+            enemy_participant_id=int(enemy_pid) if enemy_pid else None,
+            lane_lead_minutes=minutes,
+        )
+
+        # {minute: (gold, xp)} for the checkpoints this match reached.
+        lead = {
+            minute: value
+            for minute, value in (metrics.get("lane_leads") or {}).items()
+            if value is not None and all(math.isfinite(float(v)) for v in value)
+        }
+
+        territory = None
+        if "territory_all" in metrics:
+            # All ten participants cost one vectorized pass, so the team
+            # views come for free alongside the player's own numbers.
+            everyone = metrics["territory_all"]
+            teams = team_territory_metrics(everyone)
+            team_id = participant.team_id
+            enemy_team_id = 200 if team_id == 100 else 100
+            if 1 <= int(my_pid) <= len(everyone):
+                territory = (everyone[int(my_pid) - 1], teams.get(team_id), teams.get(enemy_team_id))
+        return lead, territory
+
+    # Fetch timelines concurrently; RiotClient already rate-limits internally.
+    tasks = [_one(i, participant, match) for i, (participant, match) in enumerate(rows)]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    leads = []
+    territories = []
+    for r in results:
+        if isinstance(r, Exception):
+            logger.warning("Error analyzing recent timeline: %s", r)
+            continue
+        if r is None:
+            continue
+        lead, territory = r
+        if lead:
+            leads.append(lead)
+        if territory is not None:
+            territories.append(territory)
+
+    lane_leads = _empty_lane_leads(minutes)
+    for minute in minutes:
+        values = [lead[minute] for lead in leads if minute in lead]
+        if not values:
+            continue
+        lane_leads[f"laneGoldLeadAt{minute}"] = float(sum(g for g, _ in values) / len(values))
+        lane_leads[f"laneXpLeadAt{minute}"] = float(sum(x for _, x in values) / len(values))
+        if minute == target_minute:
+            lane_leads["laneLeadSampleSize"] = len(values)
+
+    territory_metrics = {}
+    if territories:
+        territory_metrics = {
+            **aggregate_territory_metrics([t[0] for t in territories]),
+            "team": aggregate_territory_metrics([t[1] for t in territories if t[1]]),
+            "enemy_team": aggregate_territory_metrics([t[2] for t in territories if t[2]]),
+        }
+    return lane_leads, territory_metrics
+
+router = APIRouter(prefix="/api")
 
 # Region to routing mapping
 REGION_TO_ROUTING = {
@@ -272,6 +310,165 @@ REGION_TO_ROUTING = {
 class AnalyzeRequest(BaseModel):
     riot_id: str
     region: str
+    # Heatmap extraction is the most expensive optional section; clients that
+    # render it lazily can pass false and fetch it from
+    # /matches/{match_id}/heatmap instead.
+    include_heatmap: bool = True
+    # Attach per-stage wall/CPU timings to the final result (debugging aid).
+    include_timings: bool = False
+
+
+# Sections streamed as ``partial`` events as soon as each one is ready, so the
+# UI can paint before the slowest stage (timeline + heatmap) finishes.  The
+# final ``result`` event still carries the full payload.
+PARTIAL_SECTIONS = (
+    "user",
+    "ranked_data",
+    "metrics",
+    "weighted_averages",
+    "territory_metrics",
+    "player_moods",
+    "win_probability",
+    "win_drivers",
+    "match_timeline_series",
+    "heatmap_data",
+)
+
+
+def _user_to_dict(user) -> dict:
+    return {
+        "game_name": user.game_name,
+        "tag_line": user.tag_line,
+        "region": user.region,
+        "profile_icon_id": user.profile_icon_id,
+        "summoner_level": user.summoner_level,
+        "puuid": user.puuid,
+    }
+
+
+class UserNotFoundError(Exception):
+    """The Riot ID could not be resolved to an account."""
+
+
+def _ranked_from_entries(league_entries) -> Optional[dict]:
+    for entry in league_entries:
+        if entry.get("queueType") == "RANKED_SOLO_5x5":
+            return {
+                "tier": entry.get("tier", "UNRANKED"),
+                "rank": entry.get("rank", ""),
+                "lp": entry.get("leaguePoints", 0),
+                "wins": entry.get("wins", 0),
+                "losses": entry.get("losses", 0),
+                "hotStreak": entry.get("hotStreak", False),
+                "veteran": entry.get("veteran", False),
+                "freshBlood": entry.get("freshBlood", False),
+            }
+    return None
+
+
+def _lane_opponent(match_data: Optional[dict], puuid: str) -> tuple[Optional[dict], Optional[dict]]:
+    """Return ``(me, lane_opponent)`` participant dicts from raw match data."""
+    participants = ((match_data or {}).get('info') or {}).get('participants', [])
+    me = next((p for p in participants if p.get('puuid') == puuid), None)
+    if not me or not me.get('teamPosition'):
+        return me, None
+    enemy = next(
+        (
+            p for p in participants
+            if p.get('teamId') != me.get('teamId') and p.get('teamPosition') == me.get('teamPosition')
+        ),
+        None,
+    )
+    return me, enemy
+
+
+def _extract_enemy_stats(match_data: dict, puuid: str) -> dict:
+    """Build the lane opponent's stat line used for the comparison widgets."""
+    _, enemy = _lane_opponent(match_data, puuid)
+    if not enemy:
+        return {}
+
+    info = match_data.get('info', {})
+    challenges = enemy.get('challenges', {})
+    game_duration = info.get('gameDuration', 1) / 60
+    if game_duration == 0: game_duration = 1
+
+    return {
+         'championName': enemy.get('championName', 'Opponent'),
+         'visionScore': enemy.get('visionScore', 0),
+         'goldPerMinute': enemy.get('goldEarned', 0) / game_duration,
+         'damageDealtToChampions': enemy.get('totalDamageDealtToChampions', 0),
+         'totalMinionsKilled': enemy.get('totalMinionsKilled', 0) + enemy.get('neutralMinionsKilled', 0),
+         'towerDamageDealt': enemy.get('damageDealtToTurrets', 0),
+         'xpPerMinute': enemy.get('champExperience', 0) / game_duration,
+         'soloKills': challenges.get('soloKills', 0),
+         'killParticipation': challenges.get('killParticipation', 0),
+         'skillshotHitRate': challenges.get('skillshotsHit', 0),
+         'wardsPlaced': enemy.get('wardsPlaced', 0),
+         'controlWardsPlaced': enemy.get('detectorWardsPlaced', 0),
+         'detectorWardsPlaced': enemy.get('detectorWardsPlaced', 0),
+
+         'kills': enemy.get('kills', 0),
+         'deaths': enemy.get('deaths', 0),
+         'assists': enemy.get('assists', 0),
+         'kda': (enemy.get('kills', 0) + enemy.get('assists', 0)) / (enemy.get('deaths', 0) if enemy.get('deaths', 0) > 0 else 1),
+         'damagePerMinute': enemy.get('totalDamageDealtToChampions', 0) / game_duration,
+         'damageTakenOnTeamPercentage': challenges.get('damageTakenOnTeamPercentage', 0),
+         'teamDamagePercentage': challenges.get('teamDamagePercentage', 0),
+
+         'enemyMissingPings': enemy.get('enemyMissingPings', 0),
+         'onMyWayPings': enemy.get('onMyWayPings', 0),
+         'assistMePings': enemy.get('assistMePings', 0),
+         'getBackPings': enemy.get('getBackPings', 0),
+         'allInPings': enemy.get('allInPings', 0),
+         'commandPings': enemy.get('commandPings', 0),
+         'pushPings': enemy.get('pushPings', 0),
+         'visionClearedPings': enemy.get('visionClearedPings', 0),
+         'needVisionPings': enemy.get('needVisionPings', 0),
+         'holdPings': enemy.get('holdPings', 0),
+
+         'laneMinionsFirst10Minutes': challenges.get('laneMinionsFirst10Minutes') or 0,
+         'turretPlatesTaken': challenges.get('turretPlatesTaken') or 0,
+         'skillshotsDodged': challenges.get('skillshotsDodged') or 0,
+         'skillshotsHit': challenges.get('skillshotsHit') or 0,
+
+         'earlyLaningPhaseGoldExpAdvantage': challenges.get('earlyLaningPhaseGoldExpAdvantage') or 0,
+         'laningPhaseGoldExpAdvantage': challenges.get('laningPhaseGoldExpAdvantage') or 0,
+         'maxCsAdvantageOnLaneOpponent': challenges.get('maxCsAdvantageOnLaneOpponent') or 0,
+         'maxLevelLeadLaneOpponent': challenges.get('maxLevelLeadLaneOpponent') or 0,
+         'visionScoreAdvantageLaneOpponent': challenges.get('visionScoreAdvantageLaneOpponent') or 0,
+         'controlWardTimeCoverageInRiverOrEnemyHalf': challenges.get('controlWardTimeCoverageInRiverOrEnemyHalf') or 0,
+    }
+
+
+EARLY_ADVANTAGE_STATS = (
+    (8, "earlyLaningPhaseGoldExpAdvantage"),
+    (14, "laningPhaseGoldExpAdvantage"),
+)
+
+
+def _early_advantage_fallback(lane_leads: dict, last_match_stats: dict) -> dict:
+    """Timeline-derived values for early-game advantage stats Riot left empty.
+
+    Riot's `challenges.*GoldExpAdvantage` keys are not reliably present in all queues/patches,
+    which would otherwise make these indicators always 0.  *lane_leads* is the
+    ``{minute: (gold_lead, xp_lead)}`` mapping from
+    :func:`extract_lane_leads_at_minutes`.
+    """
+    updates = {}
+    for target_minute, stat_key in EARLY_ADVANTAGE_STATS:
+        # Only overwrite when missing/zero (preserve Riot-provided value if present).
+        current_val = last_match_stats.get(stat_key, 0) if isinstance(last_match_stats, dict) else 0
+        try:
+            current_num = float(current_val) if current_val is not None else 0.0
+        except Exception:
+            current_num = 0.0
+
+        lead = (lane_leads or {}).get(target_minute)
+        if current_num == 0.0 and lead is not None:
+            # Approximate Riot's combined gold+xp advantage metric.
+            updates[stat_key] = float(lead[0]) + float(lead[1])
+    return updates
 
 
 def _clamp_percent(p: object) -> int:
@@ -290,7 +487,11 @@ async def get_queue_status():
 
 
 @router.post("/analyze")
-async def analyze_player(request: AnalyzeRequest, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+async def analyze_player(
+    request: AnalyzeRequest,
+    background_tasks: BackgroundTasks,
+    session_factory=Depends(get_session_factory),
+):
     # 1. Parse Riot ID
     if "#" not in request.riot_id:
         raise HTTPException(status_code=400, detail="Invalid Riot ID format")
@@ -299,6 +500,14 @@ async def analyze_player(request: AnalyzeRequest, background_tasks: BackgroundTa
 
     async def analysis_generator():
         slot_acquired = False
+        timings = StageTimings()
+        # Shared timeline cache: lane leads, territory, and last-match
+        # timeline all potentially fetch the same match timelines.
+        # In-flight fetches are shared too, so concurrent stages never
+        # request the same timeline twice.  Ingestion prefetches the
+        # timelines of new matches into it, LOAD_MATCH_DATA seeds it with
+        # stored ones.
+        _timeline_cache: dict = {}
         try:
             async def _progress(stage: str, message: str, percent: object):
                 payload = {
@@ -311,9 +520,13 @@ async def analyze_player(request: AnalyzeRequest, background_tasks: BackgroundTa
                     payload["queue"] = await analysis_queue.stats()
                 except Exception:
                     pass
-                return json.dumps(payload) + "\n"
+                return ndjson_line(payload)
+
+            def _partial(section: str, data: object) -> bytes:
+                return ndjson_line({"type": "partial", "section": section, "data": data})
 
             # ---- Queue gate ------------------------------------------------
+            queued_at = time.perf_counter()
             ready_event = asyncio.Event()
             acquire_task = asyncio.ensure_future(analysis_queue.acquire(ready_event))
 
@@ -321,14 +534,14 @@ async def analyze_player(request: AnalyzeRequest, background_tasks: BackgroundTa
             while not ready_event.is_set():
                 pos = await analysis_queue.queue_position(ready_event)
                 q_stats = await analysis_queue.stats()
-                yield json.dumps({
+                yield ndjson_line({
                     "type": "progress",
                     "stage": "QUEUED",
                     "message": f"In queue — position {pos} of {q_stats['queued']}",
                     "percent": 0,
                     "queue": q_stats,
                     "queuePosition": pos,
-                }) + "\n"
+                })
                 # Re-check every ~1.5s
                 try:
                     await asyncio.wait_for(asyncio.shield(acquire_task), timeout=1.5)
@@ -338,363 +551,366 @@ async def analyze_player(request: AnalyzeRequest, background_tasks: BackgroundTa
             # Ensure the acquire task is done (it should be)
             await acquire_task
             slot_acquired = True
+            started_at = time.perf_counter()
+            ANALYSIS_QUEUE_WAIT_SECONDS.observe(started_at - queued_at)
             # ---- End queue gate --------------------------------------------
 
-            yield await _progress("FIND_ACCOUNT", "Finding user account...", 5)
-
-            ddragon_version = await get_ddragon_version()
-            
-            ingestion = IngestionService(db)
-            ranked_data = None
-            try:
-                user = await ingestion.get_or_update_user("europe", request.region, game_name, tag_line)
+            # ---- Stage graph -----------------------------------------------
+            # Stages are registered in presentation order; StageGraph starts
+            # each one as soon as its dependencies are done and reports them
+            # back in this order.  Ranked info overlaps match ingestion, and
+            # lane leads / the last-match timeline fetch overlap training.
+            # Stages open their own short-lived sessions around DB work, so
+            # a stream never holds a pooled connection across Riot waits.
+            graph = StageGraph(timings)
+            history_ingested = asyncio.Event()
+
+            @graph.stage("FIND_ACCOUNT", message="Finding user account...", percent=5)
+            async def _find_account(ctx):
+                async with session_factory() as db:
+                    ddragon_version, user = await asyncio.gather(
+                        get_ddragon_version(),
+                        IngestionService(db).get_or_update_user("europe", request.region, game_name, tag_line),
+                    )
                 if not user:
-                    yield json.dumps({"type": "error", "message": "User not found"}) + "\n"
-                    return
-
-                # Fetch ranked data
-                yield await _progress("FETCH_RANKED", "Fetching ranked info...", 8)
-                league_region = request.region
-                if request.region in ['euw', 'eun', 'na', 'br', 'la', 'tr', 'jp', 'oc']:
-                     league_region = request.region + '1'
-                elif request.region == 'kr' or request.region == 'ru':
-                     league_region = request.region
-                
-                league_entries = await riot_service.get_league_entries(league_region, user.puuid)
-                for entry in league_entries:
-                    if entry.get("queueType") == "RANKED_SOLO_5x5":
-                        ranked_data = {
-                            "tier": entry.get("tier", "UNRANKED"),
-                            "rank": entry.get("rank", ""),
-                            "lp": entry.get("leaguePoints", 0),
-                            "wins": entry.get("wins", 0),
-                            "losses": entry.get("losses", 0),
-                            "hotStreak": entry.get("hotStreak", False),
-                            "veteran": entry.get("veteran", False),
-                            "freshBlood": entry.get("freshBlood", False),
-                        }
-                        break
-
-                # Stream match ingestion progress
-                match_count = 0
-                async for progress in ingestion.ingest_match_history_generator(user, count=20):
-                    current = progress["current"]
-                    total = progress["total"]
-                    if total and total > 0:
-                        percent = 10 + int((current / total) * 60)  # Map 0-100% of matches to 10-70% total progress
-                    else:
-                        percent = 10
-                    yield await _progress("MATCH_HISTORY", progress["status"], percent)
-                    match_count = total
-
-            except Exception as e:
-                logger.exception("Error during ingestion")
-                yield json.dumps({"type": "error", "message": str(e)}) + "\n"
-                return
-
-            yield await _progress("LOAD_MATCH_DATA", "Loading match data...", 72)
-
-            df = await load_player_data(db, user.puuid)
-            
-            yield await _progress("TRAIN_MODEL", "Training AI model...", 75)
-            metrics = model_instance.train(df)
-            
-            if "error" in metrics:
-                # Handle partial analysis - convert user to dict
-                user_dict = {
-                    "game_name": user.game_name,
-                    "tag_line": user.tag_line,
-                    "region": user.region,
-                    "profile_icon_id": user.profile_icon_id,
-                    "summoner_level": user.summoner_level,
-                    "puuid": user.puuid
-                }
-                partial_data = sanitize_for_json({
-                    "status": "partial", 
-                    "message": metrics["error"], 
-                    "user": user_dict, 
-                    # ... default empty structure ...
-                    "win_probability": 50.0
-                })
-                yield json.dumps({"type": "result", "data": partial_data}) + "\n"
-                return
-            
-            yield await _progress("PERFORMANCE_METRICS", "Calculating performance metrics...", 78)
-
-            weighted_averages = model_instance.calculate_weighted_averages(df)
-
-            # Shared timeline cache: lane leads, territory, and last-match
-            # timeline all potentially fetch the same match timelines.
-            # A simple dict avoids duplicate Riot API calls across stages.
-            _timeline_cache: dict = {}
-
-            # Add timeline-derived lane opponent leads (gold/xp) at ~14m.
-            # Riot's `challenges.*GoldExpAdvantage` is unreliable; timeline is the source of truth.
-            # Run lane leads + territory analysis concurrently (they're independent).
-            try:
-                lane_lead_limit = min(int(len(df)) if not df.empty else 0, LANE_LEAD_MATCH_LIMIT_MAX)
-                if lane_lead_limit <= 0:
-                    lane_lead_limit = LANE_LEAD_MATCH_LIMIT_MAX
-
-                yield await _progress("LANE_LEADS", f"Computing lane leads & territory (last {lane_lead_limit} matches)...", 79)
-
-                lane_leads_coro = _compute_recent_lane_leads_at_minute(
-                    db,
+                    raise UserNotFoundError("User not found")
+                return user, ddragon_version
+
+            @graph.stage("MATCH_HISTORY", message="Fetching match history...", percent=10,
+                         deps=("FIND_ACCOUNT",))
+            async def _match_history(ctx):
+                user, _ = ctx.results["FIND_ACCOUNT"]
+                # Ingestion ends each transaction right after its DB work, so
+                # this session holds no connection while matches download.
+                try:
+                    async with session_factory() as db:
+                        async for progress in IngestionService(db).ingest_match_history_generator(
+                            user, count=20, timeline_cache=_timeline_cache
+                        ):
+                            current = progress["current"]
+                            total = progress["total"]
+                            if total and total > 0:
+                                percent = 10 + int((current / total) * 60)  # Map 0-100% of matches to 10-70% total progress
+                            else:
+                                percent = 10
+                            ctx.report(progress["status"], percent)
+                finally:
+                    history_ingested.set()
+
+            # Reported after match history but started alongside it: only the
+            # decision to serve or store the answer waits for ingestion, so
+            # the games just downloaded count as played.
+            @graph.stage("FETCH_RANKED", message="Fetching ranked info...", percent=71,
+                         deps=("FIND_ACCOUNT",), priority=1)
+            async def _fetch_ranked(ctx):
+                user, _ = ctx.results["FIND_ACCOUNT"]
+                # Served from stored snapshots unless a game may have been
+                # played since they were last confirmed.
+                league_entries = await get_league_entries(
                     user.puuid,
-                    request.region,
-                    target_minute=LANE_LEAD_TARGET_MINUTE,
-                    limit=lane_lead_limit,
-                    timeline_cache=_timeline_cache,
-                )
-                territory_coro = analyze_territory_for_player(
-                    db, user.puuid, request.region, timeline_cache=_timeline_cache,
-                )
-
-                lane_leads, territory_metrics = await asyncio.gather(
-                    lane_leads_coro, territory_coro, return_exceptions=False,
+                    lambda: riot_service.fetch_league_entries(league_platform(request.region), user.puuid),
+                    session_factory,
+                    ingested=history_ingested,
                 )
+                return _ranked_from_entries(league_entries)
+
+            @graph.stage("LOAD_MATCH_DATA", message="Loading match data...", percent=72,
+                         deps=("MATCH_HISTORY",))
+            async def _load_match_data(ctx):
+                user, _ = ctx.results["FIND_ACCOUNT"]
+                async with session_factory() as db:
+                    df = await load_player_data(db, user.puuid)
+
+                    last_match_stats = {}
+                    last_match_obj = None
+                    if not df.empty:
+                        raw_stats = df.iloc[0].to_dict()
+                        last_match_stats = {
+                            k: (0 if (isinstance(v, float) and (math.isnan(v) or math.isinf(v))) else v)
+                            for k, v in raw_stats.items()
+                        }
 
-                if isinstance(weighted_averages, dict) and isinstance(lane_leads, dict):
-                    weighted_averages.update(lane_leads)
-            except Exception as e:
-                logger.exception("Error computing lane leads / territory")
-                territory_metrics = {}
-            
-            last_match_stats = {}
-            last_match_obj = None
-            
-            if not df.empty:
-                last_row = df.iloc[0]
-                raw_stats = last_row.to_dict()
-                last_match_stats = {
-                    k: (0 if (isinstance(v, float) and (math.isnan(v) or math.isinf(v))) else v)
-                    for k, v in raw_stats.items()
-                }
-                
-                # Fetch match object for enemy stats and timeline
+                        # Fetch match object for enemy stats and timeline
+                        try:
+                            result = await db.execute(
+                                select(Match)
+                                .join(Participant)
+                                .where(Participant.puuid == user.puuid)
+                                .order_by(Participant.game_creation.desc())
+                                .limit(1)
+                            )
+                            last_match_obj = result.scalar_one_or_none()
+                        except Exception:
+                            logger.exception("Error fetching last match obj")
+
+                    # Stored timelines for the matches LANE_LEADS / FETCH_TIMELINE
+                    # read, loaded while this stage has a session open.
+                    try:
+                        await seed_timeline_cache(db, user.puuid, _timeline_cache, LANE_LEAD_MATCH_LIMIT_MAX)
+                    except Exception:
+                        logger.exception("Error loading stored timelines")
+                    return df, last_match_stats, last_match_obj
+
+            @graph.stage("TRAIN_MODEL", message="Training AI model...", percent=75,
+                         deps=("LOAD_MATCH_DATA",))
+            async def _train_model(ctx):
+                df, _, _ = ctx.results["LOAD_MATCH_DATA"]
+                async with _model_lock:
+                    return await asyncio.to_thread(model_instance.train, df)
+
+            @graph.stage("PERFORMANCE_METRICS", message="Calculating performance metrics...", percent=78,
+                         deps=("LOAD_MATCH_DATA",))
+            async def _performance_metrics(ctx):
+                df, _, _ = ctx.results["LOAD_MATCH_DATA"]
+                return model_instance.calculate_weighted_averages(df)
+
+            @graph.stage("LANE_LEADS", message="Computing lane leads & territory...", percent=79,
+                         deps=("FIND_ACCOUNT", "LOAD_MATCH_DATA"), priority=1)
+            async def _lane_leads(ctx):
+                user, _ = ctx.results["FIND_ACCOUNT"]
+                df, _, _ = ctx.results["LOAD_MATCH_DATA"]
+                # Add timeline-derived lane opponent leads (gold/xp) at ~14m
+                # and territory metrics, one timeline pass per match.
                 try:
-                     result = await db.execute(
-                        select(Match)
-                        .join(Participant)
-                        .where(Participant.puuid == user.puuid)
-                        .order_by(Match.game_creation.desc())
-                        .limit(1)
-                     )
-                     last_match_obj = result.scalar_one_or_none()
-                except Exception as e:
-                     logger.exception("Error fetching last match obj")
-
-            yield await _progress("MOOD", "Analyzing player mood...", 83)
-
-            player_moods = model_instance.analyze_player_mood(df)
-
-            win_rate = float(df['win'].mean() * 100) if not df.empty else 50.0
-
-            yield await _progress("WIN_PROB", "Calculating win probability...", 88)
-
-            raw_model_prediction = model_instance.predict_win_probability(last_match_stats)
-            win_probability = (win_rate * 0.7) + (raw_model_prediction * 0.3)
-            
-            yield await _progress("OPPONENT_COMPARE", "Comparing with opponent...", 90)
-            
-            # --- Extract Enemy Laner Stats for Comparison ---
-            enemy_stats = {}
-            enemy_p_id = None
-            if last_match_obj and last_match_obj.data:
+                    lane_lead_limit = min(int(len(df)) if not df.empty else 0, LANE_LEAD_MATCH_LIMIT_MAX)
+                    if lane_lead_limit <= 0:
+                        lane_lead_limit = LANE_LEAD_MATCH_LIMIT_MAX
+                    ctx.report(f"Computing lane leads & territory (last {lane_lead_limit} matches)...", 79)
+
+                    async with session_factory() as db:
+                        return await analyze_recent_timelines(
+                            db,
+                            user.puuid,
+                            request.region,
+                            target_minute=LANE_LEAD_TARGET_MINUTE,
+                            lane_lead_limit=lane_lead_limit,
+                            timeline_cache=_timeline_cache,
+                            session_factory=session_factory,
+                        )
+                except Exception:
+                    logger.exception("Error computing lane leads / territory")
+                    return None, {}
+
+            @graph.stage("MOOD", message="Analyzing player mood...", percent=83,
+                         deps=("LOAD_MATCH_DATA",))
+            async def _mood(ctx):
+                df, _, _ = ctx.results["LOAD_MATCH_DATA"]
+                return model_instance.analyze_player_mood(df)
+
+            @graph.stage("WIN_PROB", message="Calculating win probability...", percent=88,
+                         deps=("LOAD_MATCH_DATA", "TRAIN_MODEL"))
+            async def _win_prob(ctx):
+                df, last_match_stats, _ = ctx.results["LOAD_MATCH_DATA"]
+                win_rate = float(df['win'].mean() * 100) if not df.empty else 50.0
+                async with _model_lock:
+                    raw_model_prediction = model_instance.predict_win_probability(last_match_stats)
+                return {
+                    "win_probability": (win_rate * 0.7) + (raw_model_prediction * 0.3),
+                    "win_rate": win_rate,
+                    "total_matches": len(df),
+                }
+
+            @graph.stage("OPPONENT_COMPARE", message="Comparing with opponent...", percent=90,
+                         deps=("FIND_ACCOUNT", "LOAD_MATCH_DATA"))
+            async def _opponent_compare(ctx):
+                user, _ = ctx.results["FIND_ACCOUNT"]
+                _, _, last_match_obj = ctx.results["LOAD_MATCH_DATA"]
+                if not (last_match_obj and last_match_obj.data):
+                    return {}
                 try:
-                    info = last_match_obj.data.get('info', {})
-                    participants = info.get('participants', [])
-                    
-                    me = next((p for p in participants if p.get('puuid') == user.puuid), None)
-
-                    if me:
-                        my_team = me.get('teamId')
-                        my_role = me.get('teamPosition')
-                        
-                        if my_role:
-                            enemy = next((p for p in participants if p.get('teamId') != my_team and p.get('teamPosition') == my_role), None)
-                            
-                            if enemy:
-                                enemy_p_id = enemy.get('participantId')
-                                challenges = enemy.get('challenges', {})
-                                game_duration = info.get('gameDuration', 1) / 60
-                                if game_duration == 0: game_duration = 1
-                                
-                                enemy_stats = {
-                                     'championName': enemy.get('championName', 'Opponent'),
-                                     'visionScore': enemy.get('visionScore', 0),
-                                     'goldPerMinute': enemy.get('goldEarned', 0) / game_duration,
-                                     'damageDealtToChampions': enemy.get('totalDamageDealtToChampions', 0),
-                                     'totalMinionsKilled': enemy.get('totalMinionsKilled', 0) + enemy.get('neutralMinionsKilled', 0),
-                                     'towerDamageDealt': enemy.get('damageDealtToTurrets', 0),
-                                     'xpPerMinute': enemy.get('champExperience', 0) / game_duration,
-                                     'soloKills': challenges.get('soloKills', 0),
-                                     'killParticipation': challenges.get('killParticipation', 0),
-                                     'skillshotHitRate': challenges.get('skillshotsHit', 0), 
-                                     'wardsPlaced': enemy.get('wardsPlaced', 0),
-                                     'controlWardsPlaced': enemy.get('detectorWardsPlaced', 0),
-                                     'detectorWardsPlaced': enemy.get('detectorWardsPlaced', 0), 
-
-                                     'kills': enemy.get('kills', 0),
-                                     'deaths': enemy.get('deaths', 0),
-                                     'assists': enemy.get('assists', 0),
-                                     'kda': (enemy.get('kills', 0) + enemy.get('assists', 0)) / (enemy.get('deaths', 0) if enemy.get('deaths', 0) > 0 else 1),
-                                     'damagePerMinute': enemy.get('totalDamageDealtToChampions', 0) / game_duration,
-                                     'damageTakenOnTeamPercentage': challenges.get('damageTakenOnTeamPercentage', 0),
-                                     'teamDamagePercentage': challenges.get('teamDamagePercentage', 0),
-
-                                     'enemyMissingPings': enemy.get('enemyMissingPings', 0),
-                                     'onMyWayPings': enemy.get('onMyWayPings', 0),
-                                     'assistMePings': enemy.get('assistMePings', 0),
-                                     'getBackPings': enemy.get('getBackPings', 0),
-                                     'allInPings': enemy.get('allInPings', 0),
-                                     'commandPings': enemy.get('commandPings', 0),
-                                     'pushPings': enemy.get('pushPings', 0),
-                                     'visionClearedPings': enemy.get('visionClearedPings', 0),
-                                     'needVisionPings': enemy.get('needVisionPings', 0),
-                                     'holdPings': enemy.get('holdPings', 0),
-
-                                     'laneMinionsFirst10Minutes': challenges.get('laneMinionsFirst10Minutes') or 0,
-                                     'turretPlatesTaken': challenges.get('turretPlatesTaken') or 0,
-                                     'skillshotsDodged': challenges.get('skillshotsDodged') or 0,
-                                     'skillshotsHit': challenges.get('skillshotsHit') or 0,
-
-                                     'earlyLaningPhaseGoldExpAdvantage': challenges.get('earlyLaningPhaseGoldExpAdvantage') or 0,
-                                     'laningPhaseGoldExpAdvantage': challenges.get('laningPhaseGoldExpAdvantage') or 0,
-                                     'maxCsAdvantageOnLaneOpponent': challenges.get('maxCsAdvantageOnLaneOpponent') or 0,
-                                     'maxLevelLeadLaneOpponent': challenges.get('maxLevelLeadLaneOpponent') or 0,
-                                     'visionScoreAdvantageLaneOpponent': challenges.get('visionScoreAdvantageLaneOpponent') or 0,
-                                     'controlWardTimeCoverageInRiverOrEnemyHalf': challenges.get('controlWardTimeCoverageInRiverOrEnemyHalf') or 0,
-                                }
-                except Exception as e:
+                    return _extract_enemy_stats(last_match_obj.data, user.puuid)
+                except Exception:
                     logger.exception("Error extracting enemy stats")
-
-            yield await _progress("WIN_FACTORS", "Analyzing win factors...", 92)
-
-            win_drivers = model_instance.get_win_driver_insights(df, last_match_stats, enemy_stats)
-            skill_focus = model_instance.get_skill_focus(df, last_match_stats, enemy_stats)
-
-            yield await _progress("FETCH_TIMELINE", "Fetching match timeline...", 95)
-
-            # 11. Timeline Series (Gold/XP Difference) + Heatmap Data
-            match_timeline_series = {}
-            heatmap_data = None
-            if last_match_obj:
-                 try:
-                     regional_routing = REGION_TO_ROUTING.get(request.region.lower(), "europe")
-
-                     # Reuse cached timeline if lane-leads or territory already fetched it
-                     if last_match_obj.match_id in _timeline_cache:
-                         timeline = _timeline_cache[last_match_obj.match_id]
-                     else:
-                         timeline = await riot_service.get_match_timeline(regional_routing, last_match_obj.match_id)
-                         _timeline_cache[last_match_obj.match_id] = timeline
-
-                     # Find participant ID from match object
-                     p_id = 0
-                     if last_match_obj.data:
-                         for p in last_match_obj.data.get('info', {}).get('participants', []):
-                             if p.get('puuid') == user.puuid:
-                                 p_id = p.get('participantId')
-                                 break
-
-                     if p_id > 0:
-                         match_timeline_series = analyze_match_timeline_series(timeline, p_id, enemy_p_id)
-
-                         # Fallback for early-game advantage stats.
-                         # Riot's `challenges.*GoldExpAdvantage` keys are not reliably present in all queues/patches,
-                         # which would otherwise make these indicators always 0.
-                         try:
-                             timeline_points = (match_timeline_series or {}).get("timeline") or []
-
-                             def _closest_point(target_minute: int):
-                                 valid = [
-                                     p for p in timeline_points
-                                     if isinstance(p, dict)
-                                     and ("minute" in p)
-                                     and isinstance(p.get("minute"), (int, float))
-                                 ]
-                                 if not valid:
-                                     return None
-                                 return min(valid, key=lambda p: abs(float(p["minute"]) - float(target_minute)))
-
-                             for target_minute, stat_key in [
-                                 (8, "earlyLaningPhaseGoldExpAdvantage"),
-                                 (14, "laningPhaseGoldExpAdvantage"),
-                             ]:
-                                 # Only overwrite when missing/zero (preserve Riot-provided value if present).
-                                 current_val = last_match_stats.get(stat_key, 0) if isinstance(last_match_stats, dict) else 0
-                                 try:
-                                     current_num = float(current_val) if current_val is not None else 0.0
-                                 except Exception:
-                                     current_num = 0.0
-
-                                 if current_num == 0.0:
-                                     point = _closest_point(target_minute)
-                                     if point and ("laneGoldDelta" in point) and ("laneXpDelta" in point):
-                                         try:
-                                             lane_gold = float(point.get("laneGoldDelta") or 0)
-                                             lane_xp = float(point.get("laneXpDelta") or 0)
-                                             # Approximate Riot's combined gold+xp advantage metric.
-                                             last_match_stats[stat_key] = lane_gold + lane_xp
-                                         except Exception:
-                                             pass
-                         except Exception as e:
-                             logger.exception("Error computing early-game advantage fallback")
-
-                     # Extract heatmap data for all participants
-                     if timeline and last_match_obj.data:
-                         heatmap_data = extract_heatmap_data(timeline, last_match_obj.data)
-
-                 except Exception as e:
+                    return {}
+
+            @graph.stage("WIN_FACTORS", message="Analyzing win factors...", percent=92,
+                         deps=("LOAD_MATCH_DATA", "TRAIN_MODEL", "OPPONENT_COMPARE"))
+            async def _win_factors(ctx):
+                df, last_match_stats, _ = ctx.results["LOAD_MATCH_DATA"]
+                enemy_stats = ctx.results["OPPONENT_COMPARE"]
+                async with _model_lock:
+                    return {
+                        "win_drivers": model_instance.get_win_driver_insights(df, last_match_stats, enemy_stats),
+                        "skill_focus": model_instance.get_skill_focus(df, last_match_stats, enemy_stats),
+                        "enemy_stats": enemy_stats,
+                    }
+
+            @graph.stage("FETCH_TIMELINE", message="Fetching match timeline...", percent=95,
+                         deps=("FIND_ACCOUNT", "LOAD_MATCH_DATA"), priority=1)
+            async def _fetch_last_timeline(ctx):
+                user, _ = ctx.results["FIND_ACCOUNT"]
+                _, last_match_stats, last_match_obj = ctx.results["LOAD_MATCH_DATA"]
+
+                # 11. Timeline Series (Gold/XP Difference) + Heatmap Data
+                match_timeline_series = {}
+                heatmap_data = None
+                advantage_fallback = {}
+                if not last_match_obj:
+                    return match_timeline_series, heatmap_data, advantage_fallback
+                try:
+                    regional_routing = REGION_TO_ROUTING.get(request.region.lower(), "europe")
+
+                    # Reuse cached timeline if lane-leads or territory already fetched it
+                    timeline = await _fetch_timeline(
+                        _timeline_cache, regional_routing, last_match_obj.match_id, session_factory=session_factory
+                    )
+
+                    me, enemy = _lane_opponent(last_match_obj.data, user.puuid)
+                    p_id = (me or {}).get('participantId') or 0
+                    enemy_p_id = (enemy or {}).get('participantId')
+
+                    outputs = []
+                    extracted = {}
+                    if p_id > 0:
+                        outputs.append("series")
+                    if p_id > 0 and enemy_p_id:
+                        outputs.append("lane_leads")
+                    # Heatmap data for all participants, from the same pass
+                    if request.include_heatmap and timeline and last_match_obj.data:
+                        outputs.append("heatmap")
+                    if outputs:
+                        extracted = await asyncio.to_thread(
+                            extract_timeline_metrics,
+                            timeline,
+                            outputs,
+                            participant_id=p_id,
+                            enemy_participant_id=enemy_p_id,
+                            match_data=last_match_obj.data,
+                            lane_lead_minutes=[minute for minute, _ in EARLY_ADVANTAGE_STATS],
+                        )
+                        heatmap_data = extracted.get("heatmap")
+
+                    if p_id > 0:
+                        match_timeline_series = extracted["series"]
+                        try:
+                            advantage_fallback = _early_advantage_fallback(
+                                extracted.get("lane_leads"), last_match_stats
+                            )
+                        except Exception:
+                            logger.exception("Error computing early-game advantage fallback")
+                except Exception:
                     logger.exception("Error fetching timeline series")
-
-            yield await _progress("PREPARE_RESULTS", "Preparing results...", 98)
-
-            performance_trends = []
-            if not df.empty:
+                return match_timeline_series, heatmap_data, advantage_fallback
+
+            @graph.stage("PREPARE_RESULTS", message="Preparing results...", percent=98,
+                         deps=("LOAD_MATCH_DATA",))
+            async def _prepare_results(ctx):
+                df, _, _ = ctx.results["LOAD_MATCH_DATA"]
+                if df.empty:
+                    return []
                 trend_cols = ['kda', 'visionScore', 'killParticipation', 'win', 'gameCreation', 'aggressionScore', 'visionDominance', 'jungleInvasionPressure', 'goldPerMinute', 'damagePerMinute']
                 valid_cols = [c for c in trend_cols if c in df.columns]
-                performance_trends = df[valid_cols].to_dict(orient='records')
-                
+                return df[valid_cols].to_dict(orient='records')
+
+            results: dict = {}
+            events = graph.run()
+            try:
+                async for event in events:
+                    if event.kind != "done":
+                        yield await _progress(event.stage, event.message, event.percent)
+                        continue
+
+                    results[event.stage] = event.result
+                    if event.stage == "FIND_ACCOUNT":
+                        user, ddragon_version = event.result
+                        yield _partial("user", {**_user_to_dict(user), "ddragon_version": ddragon_version})
+                    elif event.stage == "FETCH_RANKED":
+                        yield _partial("ranked_data", event.result)
+                    elif event.stage == "TRAIN_MODEL":
+                        metrics = event.result
+                        if "error" in metrics:
+                            # Handle partial analysis - convert user to dict
+                            partial_data = {
+                                "status": "partial",
+                                "message": metrics["error"],
+                                "user": _user_to_dict(user),
+                                # ... default empty structure ...
+                                "win_probability": 50.0
+                            }
+                            yield ndjson_line({"type": "result", "data": partial_data})
+                            return
+                        yield _partial("metrics", metrics)
+                    elif event.stage == "LANE_LEADS":
+                        weighted_averages = results["PERFORMANCE_METRICS"]
+                        lane_leads, territory_metrics = event.result
+                        if isinstance(weighted_averages, dict) and isinstance(lane_leads, dict):
+                            weighted_averages.update(lane_leads)
+                        yield _partial("weighted_averages", weighted_averages)
+                        yield _partial("territory_metrics", territory_metrics)
+                    elif event.stage == "MOOD":
+                        yield _partial("player_moods", event.result)
+                    elif event.stage == "WIN_PROB":
+                        yield _partial("win_probability", event.result)
+                    elif event.stage == "WIN_FACTORS":
+                        yield _partial("win_drivers", event.result)
+                    elif event.stage == "FETCH_TIMELINE":
+                        match_timeline_series, heatmap_data, _ = event.result
+                        if results["LOAD_MATCH_DATA"][2] is not None:
+                            yield _partial("match_timeline_series", match_timeline_series)
+                        if heatmap_data is not None:
+                            yield _partial("heatmap_data", heatmap_data)
+            except StageError as e:
+                if isinstance(e.error, UserNotFoundError):
+                    yield ndjson_line({"type": "error", "message": "User not found"})
+                    return
+                if e.stage in ("FIND_ACCOUNT", "FETCH_RANKED", "MATCH_HISTORY"):
+                    logger.error("Error during ingestion", exc_info=e.error)
+                    yield ndjson_line({"type": "error", "message": str(e.error)})
+                    return
+                raise e.error
+            finally:
+                await events.aclose()
+
+            df, last_match_stats, last_match_obj = results["LOAD_MATCH_DATA"]
+            win_prob = results["WIN_PROB"]
+            factors = results["WIN_FACTORS"]
+            match_timeline_series, heatmap_data, advantage_fallback = results["FETCH_TIMELINE"]
+            # Timeline-derived fallbacks only fill the returned stats; the
+            # prediction and win drivers above saw Riot's values, as before.
+            last_match_stats.update(advantage_fallback)
+
             result_data = {
                 "status": "success",
-                "user": user,
+                "user": _user_to_dict(user),
                 "metrics": metrics,
-                "win_probability": win_probability,
-                "player_moods": player_moods,
-                "weighted_averages": weighted_averages,
+                "win_probability": win_prob["win_probability"],
+                "player_moods": results["MOOD"],
+                "weighted_averages": results["PERFORMANCE_METRICS"],
                 "last_match_stats": last_match_stats,
-                "enemy_stats": enemy_stats,
-                "win_drivers": win_drivers,
-                "skill_focus": skill_focus,
+                "enemy_stats": factors["enemy_stats"],
+                "win_drivers": factors["win_drivers"],
+                "skill_focus": factors["skill_focus"],
                 "match_timeline_series": match_timeline_series,
-                "performance_trends": performance_trends,
-                "win_rate": win_rate,
-                "total_matches": len(df),
-                "territory_metrics": territory_metrics,
-                "ranked_data": ranked_data,
+                "performance_trends": results["PREPARE_RESULTS"],
+                "win_rate": win_prob["win_rate"],
+                "total_matches": win_prob["total_matches"],
+                "territory_metrics": results["LANE_LEADS"][1],
+                "ranked_data": results["FETCH_RANKED"],
                 "ddragon_version": ddragon_version,
-                "heatmap_data": heatmap_data
-            }
-            
-            result_data["user"] = {
-                "game_name": user.game_name,
-                "tag_line": user.tag_line,
-                "region": user.region,
-                "profile_icon_id": user.profile_icon_id,
-                "summoner_level": user.summoner_level,
-                "puuid": user.puuid
+                "heatmap_data": heatmap_data,
+                "last_match_id": last_match_obj.match_id if last_match_obj else None,
             }
-            
-            result_data = sanitize_for_json(result_data)
-            
-            yield json.dumps({"type": "result", "data": result_data}) + "\n"
+
+            ANALYSIS_TOTAL_SECONDS.observe(time.perf_counter() - started_at)
+            if request.include_timings:
+                result_data["timings"] = {
+                    "queueWaitMs": (started_at - queued_at) * 1000,
+                    "totalMs": (time.perf_counter() - started_at) * 1000,
+                    "stages": timings.stages,
+                }
+
+            yield ndjson_line({"type": "result", "data": result_data})
         
         except Exception as e:
              logger.exception("Server error during analysis")
-             yield json.dumps({"type": "error", "message": f"Server error: {str(e)}"}) + "\n"
+             yield ndjson_line({"type": "error", "message": f"Server error: {str(e)}"})
         finally:
+            # Prefetches nobody awaited (failed stage, cancelled or
+            # disconnected stream) would otherwise keep holding the
+            # request pool.
+            for task in _timeline_cache.values():
+                if not task.done():
+                    task.cancel()
             if slot_acquired:
                 await analysis_queue.release()
 
@@ -710,79 +926,182 @@ async def analyze_player(request: AnalyzeRequest, background_tasks: BackgroundTa
     )
 
 
-async def analyze_territory_for_player(
-    db: AsyncSession,
-    puuid: str,
-    region: str,
-    limit: int = 5,
-    timeline_cache: dict | None = None,
-) -> dict:
-    """Analyze territorial control for a player's recent matches.
+def _routing_for_match(match: Match) -> str:
+    """Resolve the regional routing value from a stored match's platform id."""
+    platform = (match.platform_id or match.match_id.split("_", 1)[0] or "").lower()
+    return REGION_TO_ROUTING.get(platform, "europe")
 
-    Accepts an optional *timeline_cache* dict to avoid re-fetching timelines
-    already retrieved by other pipeline stages (e.g. lane-lead computation).
-    Fetches all required timelines concurrently instead of sequentially.
-    """
-    if timeline_cache is None:
-        timeline_cache = {}
 
-    try:
-        # Get recent match IDs with participant info
-        result = await db.execute(
-            select(Participant, Match)
-            .join(Match)
-            .where(Participant.puuid == puuid)
-            .order_by(Match.game_creation.desc())
-            .options(selectinload(Participant.match))
-            .limit(limit)
-        )
+# Encoded per-match bodies (heatmaps, series) keyed by (match_id, kind).  Matches are immutable
+# once played, so entries never expire; the LRU bound keeps memory in check.
+_HEATMAP_CACHE: "OrderedDict[tuple[str, str], tuple[str, bytes]]" = OrderedDict()
+_HEATMAP_CACHE_MAX = int(os.getenv("HEATMAP_CACHE_SIZE", "256"))
 
-        matches_data = result.all()
 
-        if not matches_data:
-            return {}
+def _heatmap_cache_get(key: tuple[str, str]) -> Optional[tuple[str, bytes]]:
+    entry = _HEATMAP_CACHE.get(key)
+    if entry is not None:
+        _HEATMAP_CACHE.move_to_end(key)
+    return entry
 
-        regional_routing = REGION_TO_ROUTING.get(region.lower(), "europe")
-        _timeline_sem = asyncio.Semaphore(3)
 
-        async def _analyze_one(participant, match):
-            try:
-                stats = participant.stats_json or {}
-                participant_id = stats.get('participantId', 1)
+def _heatmap_cache_set(key: tuple[str, str], entry: tuple[str, bytes]) -> None:
+    _HEATMAP_CACHE[key] = entry
+    _HEATMAP_CACHE.move_to_end(key)
+    while len(_HEATMAP_CACHE) > max(1, _HEATMAP_CACHE_MAX):
+        _HEATMAP_CACHE.popitem(last=False)
 
-                # Use cached timeline if available
-                if match.match_id in timeline_cache:
-                    timeline = timeline_cache[match.match_id]
-                else:
-                    async with _timeline_sem:
-                        timeline = await riot_service.get_match_timeline(regional_routing, match.match_id)
-                    timeline_cache[match.match_id] = timeline
 
-                if not timeline:
-                    return None
+def _build_heatmap_body(timeline, match_data: dict, fmt: str, bins: int = DEFAULT_GRID_BINS) -> bytes:
+    if fmt == "grid":
+        return dumps(encode_heatmap_grid(timeline, match_data, bins))
+    heatmap_data = extract_heatmap_data(timeline, match_data)
+    if fmt == "columnar":
+        heatmap_data = encode_heatmap_columnar(heatmap_data)
+    return dumps(heatmap_data)
 
-                return calculate_territory_metrics(timeline, participant_id, participant.team_id)
-            except Exception:
-                logger.exception("Error analyzing timeline for %s", match.match_id)
-                return None
 
-        # Fetch & analyze all timelines concurrently
-        tasks = [_analyze_one(row[0], row[1]) for row in matches_data]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+async def _match_body_response(
+    db: AsyncSession,
+    session_factory,
+    request: Request,
+    match_id: str,
+    kind: str,
+    build,
+) -> Response:
+    """Serve a per-match body derived from its timeline, with LRU + ETag caching.
+
+    *build* is ``build(timeline, match_data) -> bytes`` and runs in a worker
+    thread; bodies are cached under ``(match_id, kind)``.  The timeline is
+    read from ``match_timelines`` and only fetched from Riot when not stored.
+    """
+    cache_key = (match_id, kind)
+    entry = _heatmap_cache_get(cache_key)
+
+    if entry is None:
+        result = await db.execute(select(Match).where(Match.match_id == match_id))
+        match = result.scalar_one_or_none()
+        if match is None:
+            raise HTTPException(status_code=404, detail="Match not found")
+        match_data = match.data
+        if not match_data:
+            # Stripped by retention: rebuild the participant list.
+            match_data = (await match_data_from_participants(db, [match_id])).get(match_id)
+            if not match_data:
+                raise HTTPException(status_code=404, detail="Match not found")
+        # Release the connection before the (possibly slow) timeline fetch.
+        await db.commit()
+
+        timeline = await load_timeline(match_id, _routing_for_match(match), session_factory)
+        if not timeline:
+            raise HTTPException(status_code=404, detail="Timeline not available")
+
+        body = await asyncio.to_thread(build, timeline, match_data)
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        entry = (etag, body)
+        _heatmap_cache_set(cache_key, entry)
+
+    etag, body = entry
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=86400",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/matches/{match_id}/heatmap")
+async def get_match_heatmap(
+    match_id: str,
+    request: Request,
+    format: str = Query("columnar", pattern="^(columnar|json|grid)$"),
+    bins: int = Query(DEFAULT_GRID_BINS, ge=8, le=MAX_GRID_BINS),
+    db: AsyncSession = Depends(get_db),
+    session_factory=Depends(get_session_factory),
+):
+    """Return heatmap data for a stored match, computed on demand.
+
+    Kept out of the ``/analyze`` stream so the main payload stays small and
+    the timeline walk is only paid for when the heatmap tab is opened.
+
+    ``format=columnar`` (default) returns base64 typed-array columns (see
+    :mod:`ml.heatmap_encoding`); ``format=json`` returns the legacy
+    per-position dicts; ``format=grid`` returns pre-binned ``bins x bins``
+    occupancy grids per participant and team (see
+    :func:`~ml.heatmap_encoding.encode_heatmap_grid`).  Responses are cached
+    per match and carry an ETag so repeat views are answered with
+    ``304 Not Modified``.
+    """
+    kind = f"grid:{bins}" if format == "grid" else format
+    return await _match_body_response(
+        db, session_factory, request, match_id, kind,
+        lambda timeline, match_data: _build_heatmap_body(timeline, match_data, format, bins),
+    )
 
-        territory_results: list[dict[str, float]] = [
-            r for r in results
-            if isinstance(r, dict)
-        ]
 
-        if territory_results:
-            return aggregate_territory_metrics(territory_results)
+@router.get("/matches/{match_id}/series")
+async def get_match_series(
+    match_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    session_factory=Depends(get_session_factory),
+):
+    """Gold/XP series for all ten participants of a stored match.
 
-        return {}
+    Keyed by participant id; every point carries deltas against the match
+    average, the player's team average and (when known) the lane opponent.
+    Cached and ETagged like the heatmap endpoint.
+    """
+    return await _match_body_response(
+        db, session_factory, request, match_id, "series",
+        lambda timeline, match_data: dumps(analyze_match_timeline_series_all(timeline, match_data)),
+    )
 
-    except Exception:
-        logger.exception("Error in territory analysis")
-        return {}
+
+PLAYER_HEATMAP_MAX_MATCHES = 200
+
+
+@router.get("/players/{puuid}/heatmap")
+async def get_player_heatmap(
+    puuid: str,
+    limit: int = Query(20, ge=1, le=PLAYER_HEATMAP_MAX_MATCHES),
+    bins: int = Query(DEFAULT_GRID_BINS, ge=8, le=MAX_GRID_BINS),
+    db: AsyncSession = Depends(get_db),
+    session_factory=Depends(get_session_factory),
+):
+    """Aggregated early/mid/late position grids over a player's last *limit* matches.
+
+    Per-match grid entries are stored on first use, so only matches seen for
+    the first time cost a timeline fetch.  Red-side games are rotated onto the
+    blue side; ``player`` and ``opponents`` hold one encoded grid per range.
+    """
+    heatmap = await aggregate_player_heatmap(
+        db,
+        puuid,
+        lambda match: load_timeline(match.match_id, _routing_for_match(match), session_factory),
+        limit=limit,
+        bins=bins,
+    )
+    if heatmap is None:
+        raise HTTPException(status_code=404, detail="No matches found")
+    return Response(content=dumps(heatmap), media_type="application/json")
+
+
+@router.get("/players/{puuid}/league-history")
+async def get_league_history(
+    puuid: str,
+    queue: str = Query("RANKED_SOLO_5x5"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+):
+    """LP history for one ranked queue, from stored league snapshots (oldest first).
+
+    No Riot calls: a point is recorded whenever an analysis sees the
+    standing change.
+    """
+    return {"queueType": queue, "history": await league_history(db, puuid, queue, limit)}
 
 
 # ---------------------------------------------------------------------------
@@ -13,10 +13,11 @@ from pydantic import BaseModel, Field
 
 from ml.draft_inference import draft_analyzer
 from services.ddragon import get_ddragon_version
+from services.serialization import FastJSONResponse
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/api/draft", tags=["draft"])
+router = APIRouter(prefix="/api/draft", tags=["draft"], default_response_class=FastJSONResponse)
 
 
 # ---------------------------------------------------------------------------
@@ -160,9 +161,9 @@ async def get_champions():
     _ensure_loaded()
     version = await get_ddragon_version()
 
-    def _build_champion_list():
+    def _build_champion_list() -> FastJSONResponse:
         champs = draft_analyzer.get_champion_list()
-        return [
+        champions = [
             ChampionInfo(
                 id=c["id"],
                 name=c["name"],
@@ -175,9 +176,12 @@ async def get_champions():
             )
             for c in champs
         ]
+        # Serialize inside the worker thread as well; the models are already
+        # validated, so FastAPI's second validation pass is skipped.
+        response = ChampionListResponse(champions=champions, ddragon_version=version)
+        return FastJSONResponse(response.model_dump())
 
-    result = await asyncio.to_thread(_build_champion_list)
-    return ChampionListResponse(champions=result, ddragon_version=version)
+    return await asyncio.to_thread(_build_champion_list)
 
 
 @router.post("/analyze", response_model=DraftAnalyzeResponse)
@@ -199,7 +203,7 @@ async def analyze_draft(req: DraftAnalyzeRequest):
     # All CPU-bound work runs inside a thread so the event loop stays free
     # to serve other requests concurrently.
     # -------------------------------------------------------------------
-    def _compute() -> DraftAnalyzeResponse:
+    def _compute() -> FastJSONResponse:
         # Determine ally / enemy from user perspective
         if req.user_side == "blue":
             ally = req.blue_champions
@@ -278,7 +282,7 @@ async def analyze_draft(req: DraftAnalyzeRequest):
         enemy_role_assignments = draft_analyzer.get_team_role_assignments(active_enemy)
         unfilled = list(draft_analyzer._get_unfilled_roles(active_ally))
 
-        return DraftAnalyzeResponse(
+        response = DraftAnalyzeResponse(
             win_probability=round(displayed_win_prob * 100, 1),
             suggested_picks=suggested_picks,
             suggested_bans=suggested_bans,
@@ -289,6 +293,7 @@ async def analyze_draft(req: DraftAnalyzeRequest):
             unfilled_roles=unfilled,
             ddragon_version=version,
         )
+        return FastJSONResponse(response.model_dump())
 
     return await asyncio.to_thread(_compute)
 
@@ -0,0 +1,165 @@
+"""Multi-match positional heatmaps built from stored per-match grids.
+
+Each match's timeline is binned once into sparse grid entries
+(:func:`ml.heatmap_encoding.match_grid_entries`) and kept in
+``match_position_grids``.  Aggregating a player's last N games is then one
+query plus a NumPy summation; timelines are only fetched for games that have
+no entries yet.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ml.heatmap_encoding import (
+    DEFAULT_GRID_BINS,
+    GRID_ENTRIES_VERSION,
+    GRID_VERSION,
+    MAP_EXTENT,
+    MINUTE_RANGES,
+    aggregate_grid_entries,
+    encode_grid,
+    match_grid_entries,
+)
+from models import Match, MatchPositionGrid, Participant
+
+logger = logging.getLogger(__name__)
+
+# Timeline fetches for matches without stored grids.
+_FETCH_CONCURRENCY = 3
+
+
+async def _build_missing_grids(
+    db: AsyncSession,
+    matches: List[Match],
+    bins: int,
+    fetch_timeline: Callable[[Match], Awaitable[Any]],
+    stale: Dict[str, MatchPositionGrid],
+) -> Dict[str, bytes]:
+    sem = asyncio.Semaphore(_FETCH_CONCURRENCY)
+
+    async def _one(match: Match):
+        async with sem:
+            timeline = await fetch_timeline(match)
+        if not timeline:
+            return match.match_id, None
+        return match.match_id, await asyncio.to_thread(match_grid_entries, timeline, bins)
+
+    results = await asyncio.gather(*(_one(m) for m in matches), return_exceptions=True)
+
+    built: Dict[str, bytes] = {}
+    for r in results:
+        if isinstance(r, Exception):
+            logger.warning("Error building position grid: %s", r)
+            continue
+        match_id, entries = r
+        if entries is None:
+            continue
+        built[match_id] = entries
+        row = stale.get(match_id)
+        if row is not None:
+            row.entries = entries
+            row.version = GRID_ENTRIES_VERSION
+        else:
+            db.add(MatchPositionGrid(
+                match_id=match_id, bins=bins, version=GRID_ENTRIES_VERSION, entries=entries,
+            ))
+
+    if built:
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Another request stored the same grids first; ours are identical.
+            await db.rollback()
+    return built
+
+
+def _match_sides(match: Match, puuid: str, participant: Participant):
+    """Return ``(player_id, opponent_ids, team_id)`` for *puuid* in *match*."""
+    participants = ((match.data or {}).get("info") or {}).get("participants", [])
+    me = next((p for p in participants if p.get("puuid") == puuid), None)
+    player_id = (me or {}).get("participantId") or (participant.stats_json or {}).get("participantId")
+    team_id = (me or {}).get("teamId") or participant.team_id
+    opponents = [p.get("participantId") for p in participants if p.get("teamId") not in (None, team_id)]
+    if not opponents:
+        # Riot's layout: participants 1-5 are blue (100), 6-10 red (200).
+        opponents = list(range(6, 11)) if team_id == 100 else list(range(1, 6))
+    return player_id, opponents, team_id
+
+
+async def aggregate_player_heatmap(
+    db: AsyncSession,
+    puuid: str,
+    fetch_timeline: Callable[[Match], Awaitable[Any]],
+    limit: int = 20,
+    bins: int = DEFAULT_GRID_BINS,
+) -> Optional[Dict[str, Any]]:
+    """Early/mid/late occupancy grids for a player and their opponents.
+
+    Covers the player's last *limit* stored matches.  Red-side games are
+    rotated 180 degrees so every grid reads from the blue side.  Returns
+    ``None`` when the player has no stored matches.
+    """
+    result = await db.execute(
+        select(Participant, Match)
+        .join(Match)
+        .where(Participant.puuid == puuid)
+        .order_by(Participant.game_creation.desc())
+        .limit(limit)
+    )
+    rows = result.all()
+    if not rows:
+        return None
+
+    match_ids = [match.match_id for _, match in rows]
+    stored_result = await db.execute(
+        select(MatchPositionGrid).where(
+            MatchPositionGrid.match_id.in_(match_ids),
+            MatchPositionGrid.bins == bins,
+        )
+    )
+    stored = {g.match_id: g for g in stored_result.scalars().all()}
+    entries = {
+        match_id: g.entries for match_id, g in stored.items()
+        if g.version == GRID_ENTRIES_VERSION and g.entries is not None
+    }
+
+    missing = [match for _, match in rows if match.match_id not in entries]
+    if missing:
+        # Release the connection while the timelines download.
+        await db.commit()
+        entries.update(await _build_missing_grids(db, missing, bins, fetch_timeline, stored))
+
+    items = []
+    for participant, match in rows:
+        match_entries = entries.get(match.match_id)
+        if match_entries is None:
+            continue
+        player_id, opponents, team_id = _match_sides(match, puuid, participant)
+        if not player_id:
+            continue
+        items.append((match_entries, [player_id], opponents, team_id == 200))
+
+    grids = await asyncio.to_thread(aggregate_grid_entries, items, bins)
+
+    return {
+        "format": "grid",
+        "version": GRID_VERSION,
+        "bins": bins,
+        "extent": MAP_EXTENT,
+        "dtype": "uint16",
+        "orientation": "blue",
+        "matches": len(items),
+        "requested": len(rows),
+        "ranges": [
+            {"name": name, "fromMinute": start, "toMinute": end}
+            for name, start, end in MINUTE_RANGES
+        ],
+        **{
+            who: {name: encode_grid(grids[who][r]) for r, (name, _, _) in enumerate(MINUTE_RANGES)}
+            for who in ("player", "opponents")
+        },
+    }
@@ -1,136 +1,251 @@
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, update
 from sqlalchemy.future import select
 from sqlalchemy.exc import IntegrityError
-from models import User, Match, Participant
+from models import User, Match, Participant, normalize_riot_id, utcnow
 from services.riot import riot_service
+from services.timelines import prefetch_timeline
+from services.user_cache import (
+    NOT_FOUND,
+    USER_NEGATIVE_TTL_SECONDS,
+    CachedUser,
+    riot_id_key,
+    user_cache,
+)
+from services.metrics import USER_CACHE_REQUESTS_TOTAL
+from database import AsyncSessionLocal
 from riotskillissue import NotFoundError, RiotAPIError
+from dataclasses import dataclass, field
 import asyncio
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Mapping simple region to platform for summoner lookups (e.g. euw -> euw1)
+REGION_TO_PLATFORM = {
+    "euw": "euw1",
+    "eune": "eun1",
+    "na": "na1",
+    "br": "br1",
+    "lan": "la1",
+    "las": "la2",
+    "kr": "kr",
+    "jp": "jp1",
+    "oce": "oc1",
+    "tr": "tr1",
+    "ru": "ru",
+    "ph": "ph2",
+    "sg": "sg2",
+    "th": "th2",
+    "tw": "tw2",
+    "vn": "vn2",
+}
+
+# Summoner icon/level older than this are refreshed in the background.
+USER_REFRESH_SECONDS = int(os.getenv("USER_REFRESH_SECONDS", str(6 * 3600)))
+
+# Fetched-but-unsaved matches held in memory, and matches written per commit.
+INGEST_QUEUE_SIZE = 8
+INGEST_BATCH_SIZE = 5
+
+
+@dataclass
+class IngestionSummary:
+    """Outcome of :meth:`IngestionService.ingest_match_history`."""
+
+    total: int = 0
+    cached: int = 0
+    new_matches: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)  # match_id -> error
+
+def _platform_for(platform_region: str) -> str:
+    # Default to passed value if not in map (assuming it might be already correct) or euw1
+    return REGION_TO_PLATFORM.get(platform_region.lower(), platform_region if platform_region else "euw1")
+
+
+# Running summoner refreshes by puuid; also keeps the tasks referenced.
+_refresh_tasks: dict[str, asyncio.Task] = {}
+
+
+def _schedule_refresh(key: tuple, user: CachedUser, region_routing: str) -> None:
+    """Re-check *user* against Riot in the background when the profile is stale."""
+    if user.puuid in _refresh_tasks:
+        return
+    if user.last_updated is not None:
+        age = (utcnow() - user.last_updated).total_seconds()
+        if age < USER_REFRESH_SECONDS:
+            return
+    task = asyncio.ensure_future(_refresh_user(key, user, region_routing))
+    _refresh_tasks[user.puuid] = task
+    task.add_done_callback(lambda _: _refresh_tasks.pop(user.puuid, None))
+
+
+async def _store_account(db: AsyncSession, platform_region: str, account, summoner) -> User:
+    """Insert or update the ``users`` row of *account* under its current Riot ID.
+
+    Riot IDs change hands: the ID may still be held by another row (its owner
+    renamed, or the ID was reused), and the puuid may already be stored under
+    an old Riot ID or under the NULL keys left by deduplication.  On conflict
+    the other holder loses its normalized keys and this puuid's row takes the
+    current names.
+    """
+    values = dict(
+        game_name=account.gameName,
+        tag_line=account.tagLine,
+        normalized_name=normalize_riot_id(account.gameName),
+        normalized_tag=normalize_riot_id(account.tagLine),
+        region=platform_region,
+        profile_icon_id=summoner.profileIconId,
+        summoner_level=summoner.summonerLevel,
+        last_updated=utcnow(),
+    )
+    user = User(puuid=account.puuid, **values)
+    try:
+        db.add(user)
+        await db.commit()
+        await db.refresh(user)
+        return user
+    except IntegrityError:
+        await db.rollback()
+
+    try:
+        await db.execute(
+            update(User)
+            .where(
+                User.region == platform_region,
+                User.normalized_name == values["normalized_name"],
+                User.normalized_tag == values["normalized_tag"],
+                User.puuid != account.puuid,
+            )
+            .values(normalized_name=None, normalized_tag=None)
+        )
+        result = await db.execute(update(User).where(User.puuid == account.puuid).values(**values))
+        if result.rowcount == 0:
+            db.add(User(puuid=account.puuid, **values))
+        await db.commit()
+    except IntegrityError:
+        # Another request stored the same account in the meantime.
+        await db.rollback()
+    result = await db.execute(
+        select(User).where(User.puuid == account.puuid).execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+
+async def _refresh_user(key: tuple, user: CachedUser, region_routing: str) -> None:
+    try:
+        try:
+            account = await riot_service.get_account_by_riot_id(region_routing, user.game_name, user.tag_line)
+        except NotFoundError:
+            account = None
+        summoner = None
+        if account:
+            summoner = await riot_service.get_summoner_by_puuid(_platform_for(user.region), account.puuid)
+
+        async with AsyncSessionLocal() as session:
+            if not account:
+                # Renamed and not taken again: the row keeps its match data
+                # but no longer answers to this Riot ID.
+                await session.execute(
+                    update(User)
+                    .where(User.puuid == user.puuid)
+                    .values(normalized_name=None, normalized_tag=None)
+                )
+                await session.commit()
+                user_cache.set(key, NOT_FOUND, ttl=USER_NEGATIVE_TTL_SECONDS)
+                return
+            row = await _store_account(session, user.region, account, summoner)
+        if row is not None:
+            user_cache.set(key, CachedUser.from_row(row))
+    except Exception as e:
+        logger.warning("Failed to refresh user %s: %s", user.puuid, e)
+
+
 class IngestionService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
     async def get_or_update_user(self, region_routing: str, platform_region: str, game_name: str, tag_line: str):
+        """Resolve a Riot ID to a :class:`CachedUser`, or ``None`` if it does not exist.
+
+        Served from :data:`user_cache` when possible, then the DB, then the
+        Riot account/summoner APIs.  Unknown Riot IDs are cached negatively.
+        Profiles older than ``USER_REFRESH_SECONDS`` are returned as-is and
+        refreshed in the background, which also re-resolves the Riot ID in
+        case it now belongs to another account.
+        """
+        key = riot_id_key(platform_region, game_name, tag_line)
+        cached = user_cache.get(key)
+        if cached is NOT_FOUND:
+            USER_CACHE_REQUESTS_TOTAL.inc(result="negative")
+            return None
+        if cached is not None:
+            USER_CACHE_REQUESTS_TOTAL.inc(result="hit")
+            _schedule_refresh(key, cached, region_routing)
+            return cached
+        USER_CACHE_REQUESTS_TOTAL.inc(result="miss")
+
         # Check DB
-        result = await self.db.execute(select(User).where(User.game_name == game_name, User.tag_line == tag_line, User.region == platform_region))
+        result = await self.db.execute(select(User).where(
+            User.region == platform_region,
+            User.normalized_name == normalize_riot_id(game_name),
+            User.normalized_tag == normalize_riot_id(tag_line),
+        ))
         user = result.scalars().first()
         
         if user:
-            return user
-            
+            cached = CachedUser.from_row(user)
+            user_cache.set(key, cached)
+            _schedule_refresh(key, cached, region_routing)
+            return cached
+        # End the read transaction before the Riot calls so the session does
+        # not keep a pooled connection checked out while they run.
+        await self.db.commit()
+
         # Fetch from Riot
-        account = await riot_service.get_account_by_riot_id(region_routing, game_name, tag_line)
+        try:
+            account = await riot_service.get_account_by_riot_id(region_routing, game_name, tag_line)
+        except NotFoundError:
+            account = None
         if not account:
+            user_cache.set(key, NOT_FOUND, ttl=USER_NEGATIVE_TTL_SECONDS)
             return None
 
         # riotskillissue returns objects (DTOs), so use dot notation
-        puuid = account.puuid
-        
-        # Mapping simple region to platform for summoner lookups (e.g. europe -> euw1)
-        REGION_TO_PLATFORM = {
-            "euw": "euw1",
-            "eune": "eun1",
-            "na": "na1",
-            "br": "br1",
-            "lan": "la1",
-            "las": "la2",
-            "kr": "kr",
-            "jp": "jp1",
-            "oce": "oc1",
-            "tr": "tr1",
-            "ru": "ru",
-            "ph": "ph2",
-            "sg": "sg2",
-            "th": "th2",
-            "tw": "tw2",
-            "vn": "vn2",
-        }
-        
-        # Default to passed value if not in map (assuming it might be already correct) or euw1
-        platform = REGION_TO_PLATFORM.get(platform_region.lower(), platform_region if platform_region else "euw1")
-        
-        summoner = await riot_service.get_summoner_by_puuid(platform, puuid)
-        
-        user = User(
-            puuid=puuid,
-            game_name=account.gameName,
-            tag_line=account.tagLine,
-            region=platform_region,
-            profile_icon_id=summoner.profileIconId,
-            summoner_level=summoner.summonerLevel
-        )
-        try:
-            self.db.add(user)
-            await self.db.commit()
-            await self.db.refresh(user)
-        except IntegrityError:
-            await self.db.rollback()
-            # Race condition: User was created by another request in the meantime
-            result = await self.db.execute(select(User).where(User.puuid == puuid))
-            user = result.scalars().first()
-            
-        return user
+        summoner = await riot_service.get_summoner_by_puuid(_platform_for(platform_region), account.puuid)
 
-    async def ingest_match_history(self, user: User, count: int = 20):
-        # Determine routing
-        routing = self._get_routing(user.region)
-            
-        match_ids = await riot_service.get_match_history(routing, user.puuid, count=count)
-        
-        new_matches = []
-        for match_id in match_ids:
-            # Check if exists
-            result = await self.db.execute(select(Match).where(Match.match_id == match_id))
-            if result.scalars().first():
-                continue
-                
-            # Fetch details
-            try:
-                details = await riot_service.get_match_details(routing, match_id)
-                await self.save_match(details)
-                new_matches.append(match_id)
-                # Delay between requests to avoid rate limiting
-                await asyncio.sleep(1.2)
-            except NotFoundError:
-                logger.debug("Match %s not found, skipping", match_id)
-            except RiotAPIError as e:
-                logger.error("Riot API error ingesting match %s: %s", match_id, e)
-            except Exception as e:
-                logger.exception("Failed to ingest match %s", match_id)
-                
-        return new_matches
-
-    async def ingest_match_history_generator(self, user: User, count: int = 20):
-        """Yield progress updates while ingesting match history."""
-        routing = self._get_routing(user.region)
-        match_ids = await riot_service.get_match_history(routing, user.puuid, count=count)
-        
-        total = len(match_ids)
-        if total == 0:
-            yield {"current": 0, "total": 0, "status": "No matches found"}
-            return
+        user = await _store_account(self.db, platform_region, account, summoner)
+        if user is None:
+            return None
+        cached = CachedUser.from_row(user)
+        user_cache.set(key, cached)
+        return cached
 
-        yield {"current": 0, "total": total, "status": f"Found {total} matches, checking cache..."}
-        
-        # Batch check which matches already exist in DB
+    async def _existing_match_ids(self, match_ids: list[str]) -> set[str]:
+        """Ids among *match_ids* that are already stored (one ``IN`` query)."""
+        if not match_ids:
+            return set()
         result = await self.db.execute(
             select(Match.match_id).where(Match.match_id.in_(match_ids))
         )
-        existing_ids = set(row[0] for row in result.fetchall())
-        
-        new_match_ids = [mid for mid in match_ids if mid not in existing_ids]
-        cached_count = len(existing_ids)
-        
-        if cached_count > 0:
-            yield {"current": cached_count, "total": total, "status": f"{cached_count} matches cached, fetching {len(new_match_ids)} new..."}
-        
-        if not new_match_ids:
-            yield {"current": total, "total": total, "status": "All matches already cached"}
-            return
-        
+        existing = set(row[0] for row in result.fetchall())
+        # End the read transaction: the fetches that follow take seconds and
+        # must not keep a pooled connection checked out.
+        await self.db.commit()
+        return existing
+
+    async def _ingest_matches(self, routing: str, match_ids: list[str], timeline_cache: dict | None = None):
+        """Fetch and store *match_ids*, yielding ``(match_id, fetch_error, saved)`` per match.
+
+        Shared core of both ingestion entry points.  Details are fetched
+        concurrently through a rate-limited pool; fetchers push into a bounded
+        queue that is drained in micro-batches, so a slow commit never holds
+        up API requests (the queue bound still caps how many DTOs pile up in
+        memory).  Results are yielded once their batch is committed.  With
+        *timeline_cache*, each saved match also gets its timeline prefetched
+        through the same pool (see :func:`services.timelines.prefetch_timeline`).
+        """
         # Throttle concurrent API requests to avoid rate limiting.
         _API_SEMAPHORE = asyncio.Semaphore(3)   # max 3 concurrent requests
         _API_DELAY     = 1.2                     # seconds between requests
@@ -153,25 +268,93 @@ class IngestionService:
                 finally:
                     await asyncio.sleep(_API_DELAY)
 
-        tasks = [asyncio.create_task(fetch_match_data(mid)) for mid in new_match_ids]
+        fetched: asyncio.Queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+
+        async def produce(match_id: str):
+            await fetched.put(await fetch_match_data(match_id))
+
+        tasks = [asyncio.create_task(produce(mid)) for mid in match_ids]
+        remaining = len(match_ids)
+        try:
+            while remaining:
+                batch = [await fetched.get()]
+                while len(batch) < min(INGEST_BATCH_SIZE, remaining) and not fetched.empty():
+                    batch.append(fetched.get_nowait())
+                remaining -= len(batch)
+
+                to_save = [details for _, details, _ in batch if details]
+                saved = await self.save_matches(to_save) if to_save else set()
+
+                for match_id, details, error in batch:
+                    if match_id in saved and timeline_cache is not None:
+                        prefetch_timeline(timeline_cache, routing, match_id, _API_SEMAPHORE, _API_DELAY)
+                    yield match_id, (None if details else error), match_id in saved
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def ingest_match_history(self, user: User, count: int = 20) -> IngestionSummary:
+        """Ingest the last *count* matches without progress reporting.
+
+        Same core as :meth:`ingest_match_history_generator`, for batch and
+        CLI backfills; returns an :class:`IngestionSummary`.
+        """
+        routing = self._get_routing(user.region)
+        match_ids = await riot_service.get_match_history(routing, user.puuid, count=count)
+
+        existing_ids = await self._existing_match_ids(match_ids)
+        summary = IngestionSummary(total=len(match_ids), cached=len(existing_ids))
+        new_match_ids = [mid for mid in match_ids if mid not in existing_ids]
+
+        async for match_id, error, saved in self._ingest_matches(routing, new_match_ids):
+            if saved:
+                summary.new_matches.append(match_id)
+            else:
+                summary.failed[match_id] = error or "save failed"
+        return summary
+
+    async def ingest_match_history_generator(self, user: User, count: int = 20, timeline_cache: dict | None = None):
+        """Yield progress updates while ingesting match history.
+
+        When *timeline_cache* is given, every newly saved match also gets its
+        timeline fetched (and persisted) through the same request pool; the
+        running tasks are left in the cache for the caller to await.
+        """
+        routing = self._get_routing(user.region)
+        match_ids = await riot_service.get_match_history(routing, user.puuid, count=count)
+        
+        total = len(match_ids)
+        if total == 0:
+            yield {"current": 0, "total": 0, "status": "No matches found"}
+            return
+
+        yield {"current": 0, "total": total, "status": f"Found {total} matches, checking cache..."}
+        
+        # Batch check which matches already exist in DB
+        existing_ids = await self._existing_match_ids(match_ids)
+        
+        new_match_ids = [mid for mid in match_ids if mid not in existing_ids]
+        cached_count = len(existing_ids)
+        
+        if cached_count > 0:
+            yield {"current": cached_count, "total": total, "status": f"{cached_count} matches cached, fetching {len(new_match_ids)} new..."}
+        
+        if not new_match_ids:
+            yield {"current": total, "total": total, "status": "All matches already cached"}
+            return
 
         yield {"current": cached_count, "total": total, "status": f"Fetching {len(new_match_ids)} matches from Riot API..."}
 
         completed = cached_count
-        for task in asyncio.as_completed(tasks):
-            match_id, details, error = await task
+        async for match_id, error, saved in self._ingest_matches(routing, new_match_ids, timeline_cache):
             completed += 1
-
-            if details:
-                try:
-                    await self.save_match(details)
-                    status = f"Saved match {completed}/{total}"
-                except Exception as e:
-                    logger.error(f"Failed to save match {match_id}: {e}")
-                    status = f"Failed to save {match_id}"
-            else:
+            if saved:
+                status = f"Saved match {completed}/{total}"
+            elif error:
                 status = f"Failed to fetch {match_id}: {error}"
-
+            else:
+                status = f"Failed to save {match_id}"
             yield {"current": completed, "total": total, "status": status}
 
     def _get_routing(self, region: str) -> str:
@@ -181,12 +364,13 @@ class IngestionService:
             return "asia"
         return "europe"
 
-    async def save_match(self, match_data):
-        # match_data is a MatchDto object
+    @staticmethod
+    def _match_rows(match_data) -> tuple[dict, list[dict]]:
+        """Column values for a match and its participants from a ``MatchDto``."""
         info = match_data.info
         metadata = match_data.metadata
-        
-        match = Match(
+
+        match_row = dict(
             match_id=metadata.matchId,
             platform_id=info.platformId,
             game_creation=info.gameCreation,
@@ -195,20 +379,20 @@ class IngestionService:
             queue_id=info.queueId,
             data=match_data.model_dump() if hasattr(match_data, 'model_dump') else match_data.__dict__
         )
-        
-        self.db.add(match)
-        
-        # Parse participants
+
+        participant_rows = []
         for p in info.participants:
             # Stats handling - using getattr for safety or direct access
             gold = 0.0
             if hasattr(p, 'challenges') and p.challenges:
                  # Challenges might be an object too
                  gold = getattr(p.challenges, 'goldPerMinute', 0.0)
-            
-            part = Participant(
-                match_id=match.match_id,
+
+            participant_rows.append(dict(
+                match_id=metadata.matchId,
                 puuid=p.puuid,
+                game_creation=info.gameCreation,
+                queue_id=info.queueId,
                 champion_id=p.championId,
                 team_id=p.teamId,
                 win=p.win,
@@ -220,11 +404,54 @@ class IngestionService:
                 vision_score=p.visionScore,
                 damage_dealt_to_champions=p.totalDamageDealtToChampions,
                 stats_json=p.model_dump() if hasattr(p, 'model_dump') else p.__dict__
-            )
-            self.db.add(part)
-            
+            ))
+        return match_row, participant_rows
+
+    async def save_match(self, match_data):
+        # match_data is a MatchDto object
+        match_row, participant_rows = self._match_rows(match_data)
+
+        self.db.add(Match(**match_row))
+        for row in participant_rows:
+            self.db.add(Participant(**row))
+
+        try:
+            await self.db.commit()
+        except IntegrityError:
+            await self.db.rollback()
+            logger.info(f"Match {match_row['match_id']} already exists, skipping save.")
+
+    async def save_matches(self, matches: list) -> set[str]:
+        """Persist several ``MatchDto`` objects with two bulk INSERTs and one commit.
+
+        Falls back to :meth:`save_match` per match when the batch hits a
+        duplicate (another request saved one of them first).  Returns the ids
+        of matches that are now stored.
+        """
+        match_rows = []
+        participant_rows = []
+        for match_data in matches:
+            match_row, rows = self._match_rows(match_data)
+            match_rows.append(match_row)
+            participant_rows.extend(rows)
+        if not match_rows:
+            return set()
+        match_ids = {row["match_id"] for row in match_rows}
+
         try:
+            await self.db.execute(insert(Match), match_rows)
+            if participant_rows:
+                await self.db.execute(insert(Participant), participant_rows)
             await self.db.commit()
+            return match_ids
         except IntegrityError:
             await self.db.rollback()
-            logger.info(f"Match {match.match_id} already exists, skipping save.")
+
+        saved = set()
+        for match_data in matches:
+            try:
+                await self.save_match(match_data)
+                saved.add(match_data.metadata.matchId)
+            except Exception as e:
+                logger.error(f"Failed to save match {match_data.metadata.matchId}: {e}")
+        return saved
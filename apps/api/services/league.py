@@ -0,0 +1,217 @@
+"""Persisted ranked league entries, keyed by puuid and queue type.
+
+Ranked standing changes at most once per game, yet every analysis used to
+call league-v4.  :func:`get_league_entries` serves the latest
+:class:`~models.LeagueSnapshot` rows instead and only goes to Riot when they
+are older than ``LEAGUE_SNAPSHOT_TTL_SECONDS`` or older than the end of the
+player's most recently stored match (i.e. a game was ingested since).  Changed
+standings are appended rather than overwritten, which gives an LP history for
+free (:func:`league_history`).  An unranked answer is stored too, as an
+:data:`UNRANKED` marker row, so unranked players are not looked up again on
+every analysis either.
+
+Snapshots are read and written in their own short-lived session because the
+ranked stage runs concurrently with match ingestion.  The lookup starts right
+away; only the decision to serve or store its answer waits for ingestion, so
+the games just downloaded are taken into account.
+"""
+import asyncio
+import datetime
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import AsyncSessionLocal
+from models import LeagueSnapshot, Match, Participant, utcnow
+
+logger = logging.getLogger(__name__)
+
+# Shorter than any ranked game, so a game finished since the last check is
+# never missed even before it has been ingested.
+LEAGUE_SNAPSHOT_TTL_SECONDS = int(os.getenv("LEAGUE_SNAPSHOT_TTL_SECONDS", "900"))
+
+# queue_type of the marker row recording that Riot returned no entries.
+UNRANKED = "UNRANKED"
+
+_STANDING_FIELDS = (
+    ("tier", "tier"),
+    ("rank", "rank"),
+    ("league_points", "leaguePoints"),
+    ("wins", "wins"),
+    ("losses", "losses"),
+)
+
+
+def league_platform(region: str) -> str:
+    """Platform id for league-v4 from the short region the client sends."""
+    if region in ['euw', 'eun', 'na', 'br', 'la', 'tr', 'jp', 'oc']:
+        return region + '1'
+    return region
+
+
+async def _latest_snapshots(session: AsyncSession, puuid: str) -> List[LeagueSnapshot]:
+    latest_ids = (
+        select(func.max(LeagueSnapshot.id))
+        .where(LeagueSnapshot.puuid == puuid)
+        .group_by(LeagueSnapshot.queue_type)
+    )
+    result = await session.execute(select(LeagueSnapshot).where(LeagueSnapshot.id.in_(latest_ids)))
+    return list(result.scalars().all())
+
+
+async def _latest_match_end(session: AsyncSession, puuid: str) -> Optional[datetime.datetime]:
+    result = await session.execute(
+        select(func.max(Match.game_creation + Match.game_duration * 1000))
+        .join(Participant)
+        .where(Participant.puuid == puuid)
+    )
+    end_ms = result.scalar()
+    if not end_ms:
+        return None
+    return datetime.datetime.fromtimestamp(end_ms / 1000, datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _current(snapshots: List[LeagueSnapshot]) -> List[LeagueSnapshot]:
+    """The rows Riot confirmed on the last check (they share its ``checked_at``)."""
+    if not snapshots:
+        return []
+    checked = max(s.checked_at or datetime.datetime.min for s in snapshots)
+    return [s for s in snapshots if (s.checked_at or datetime.datetime.min) == checked]
+
+
+def _entries(snapshots: List[LeagueSnapshot]) -> List[dict]:
+    return [s.data for s in snapshots if s.queue_type != UNRANKED]
+
+
+def _is_fresh(current: List[LeagueSnapshot], latest_match_end: Optional[datetime.datetime]) -> bool:
+    if not current:
+        return False
+    checked = current[0].checked_at or datetime.datetime.min
+    if (utcnow() - checked).total_seconds() >= LEAGUE_SNAPSHOT_TTL_SECONDS:
+        return False
+    return latest_match_end is None or checked >= latest_match_end
+
+
+async def _fetch(
+    fetch_entries: Callable[[], Awaitable[Optional[List[dict]]]],
+) -> Tuple[Optional[List[dict]], datetime.datetime]:
+    """Riot's answer (``None`` on failure) and when it was given."""
+    try:
+        entries = await fetch_entries()
+    except Exception as e:
+        logger.warning("Error fetching league entries: %s", e)
+        entries = None
+    return entries, utcnow()
+
+
+async def _store_entries(
+    session: AsyncSession, puuid: str, entries: List[dict], now: Optional[datetime.datetime] = None,
+) -> None:
+    latest = {s.queue_type: s for s in await _latest_snapshots(session, puuid)}
+    now = now or utcnow()
+    if not entries:
+        marker = latest.get(UNRANKED)
+        if marker is not None:
+            marker.checked_at = now
+        else:
+            session.add(LeagueSnapshot(puuid=puuid, queue_type=UNRANKED, captured_at=now, checked_at=now))
+    for entry in entries:
+        queue_type = entry.get("queueType")
+        if not queue_type:
+            continue
+        standing = {column: entry.get(key) for column, key in _STANDING_FIELDS}
+        previous = latest.get(queue_type)
+        if previous is not None and all(getattr(previous, c) == v for c, v in standing.items()):
+            previous.checked_at = now
+            previous.data = entry
+        else:
+            session.add(LeagueSnapshot(
+                puuid=puuid, queue_type=queue_type, data=entry,
+                captured_at=now, checked_at=now, **standing,
+            ))
+    await session.commit()
+
+
+async def get_league_entries(
+    puuid: str,
+    fetch_entries: Callable[[], Awaitable[Optional[List[dict]]]],
+    session_factory=AsyncSessionLocal,
+    ingested: Optional[asyncio.Event] = None,
+) -> List[dict]:
+    """League entries (dicts, as from ``RiotService.fetch_league_entries``) for *puuid*.
+
+    *fetch_entries* is only awaited when the stored snapshots are stale.  It
+    returns ``[]`` for an unranked player, which is stored as such; when it
+    fails (raises or returns ``None``) the stale snapshots are served instead.
+    Database errors fall back to the API.
+
+    *ingested*, if given, is set once the player's match history has been
+    ingested.  Stale snapshots are refreshed without waiting for it, but the
+    answer is only served or stored once it is known to postdate every
+    ingested game; otherwise Riot is asked again.
+    """
+    current: List[LeagueSnapshot] = []
+    latest_match_end: Optional[datetime.datetime] = None
+    try:
+        async with session_factory() as session:
+            current = _current(await _latest_snapshots(session, puuid))
+            latest_match_end = await _latest_match_end(session, puuid)
+    except Exception:
+        logger.exception("Error loading league snapshots")
+
+    pending = None
+    if not _is_fresh(current, latest_match_end):
+        pending = asyncio.ensure_future(_fetch(fetch_entries))
+    try:
+        if ingested is not None:
+            await ingested.wait()
+            try:
+                async with session_factory() as session:
+                    latest_match_end = await _latest_match_end(session, puuid)
+            except Exception:
+                logger.exception("Error loading league snapshots")
+        if pending is None:
+            if _is_fresh(current, latest_match_end):
+                return _entries(current)
+            pending = asyncio.ensure_future(_fetch(fetch_entries))
+        entries, fetched_at = await pending
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+
+    if entries is not None and latest_match_end is not None and fetched_at < latest_match_end:
+        # A game ingested meanwhile ended after Riot answered.
+        entries, fetched_at = await _fetch(fetch_entries)
+    if entries is None:
+        return _entries(current)
+    try:
+        async with session_factory() as session:
+            await _store_entries(session, puuid, entries, fetched_at)
+    except Exception:
+        logger.exception("Error storing league snapshots")
+    return entries
+
+
+async def league_history(db: AsyncSession, puuid: str, queue_type: str, limit: int = 100) -> List[Dict[str, Any]]:
+    """Stored standings for one queue, oldest first."""
+    result = await db.execute(
+        select(LeagueSnapshot)
+        .where(LeagueSnapshot.puuid == puuid, LeagueSnapshot.queue_type == queue_type)
+        .order_by(LeagueSnapshot.captured_at.desc(), LeagueSnapshot.id.desc())
+        .limit(limit)
+    )
+    return [
+        {
+            "capturedAt": s.captured_at.isoformat() if s.captured_at else None,
+            "tier": s.tier,
+            "rank": s.rank,
+            "leaguePoints": s.league_points,
+            "wins": s.wins,
+            "losses": s.losses,
+        }
+        for s in reversed(result.scalars().all())
+    ]
@@ -0,0 +1,220 @@
+"""In-process metrics with a Prometheus text exposition.
+
+Deliberately dependency-free: a handful of counters and histograms keyed by
+label values, rendered in the Prometheus text format by ``/api/metrics``.
+Values are per process; scrape every worker to get the full picture.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Seconds.  Covers fast DB queries up to multi-minute cold analyses.
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        return self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}"
+            for key, v in items
+        ]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            counts, total, n = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    def count(self, **labels: str) -> int:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        entry = self._values.get(key)
+        return entry[2] if entry else 0
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._values.items())
+        lines = []
+        inf_le = 'le="+Inf"'
+        for key, (counts, total, n) in items:
+            for bound, c in zip(self.buckets, counts):
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {c}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, inf_le)} {n}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+ANALYSIS_STAGE_SECONDS = registry.register(Histogram(
+    "analysis_stage_seconds", "Wall-clock time spent in each /analyze stage.", ["stage"],
+))
+ANALYSIS_STAGE_CPU_SECONDS = registry.register(Histogram(
+    "analysis_stage_cpu_seconds",
+    "Process CPU time consumed while each /analyze stage was running.",
+    ["stage"],
+))
+ANALYSIS_QUEUE_WAIT_SECONDS = registry.register(Histogram(
+    "analysis_queue_wait_seconds", "Time an /analyze request waited for a queue slot.",
+))
+ANALYSIS_TOTAL_SECONDS = registry.register(Histogram(
+    "analysis_total_seconds", "End-to-end /analyze duration after the queue slot was acquired.",
+))
+RIOT_REQUESTS_TOTAL = registry.register(Counter(
+    "riot_requests_total", "Riot API calls made through RiotService.", ["endpoint", "outcome"],
+))
+RIOT_REQUEST_SECONDS = registry.register(Histogram(
+    "riot_request_seconds", "Riot API call latency (includes rate-limiter waits).", ["endpoint"],
+))
+TIMELINE_CACHE_REQUESTS_TOTAL = registry.register(Counter(
+    "timeline_cache_requests_total", "Timeline lookups served from cache vs fetched.", ["result"],
+))
+RIOT_CACHE_REQUESTS_TOTAL = registry.register(Counter(
+    "riot_cache_requests_total", "Riot response cache lookups by endpoint and answering tier (or miss).",
+    ["endpoint", "result"],
+))
+USER_CACHE_REQUESTS_TOTAL = registry.register(Counter(
+    "user_cache_requests_total", "Riot ID lookups by cache outcome (hit, negative, miss).", ["result"],
+))
+RETENTION_MATCHES_TOTAL = registry.register(Counter(
+    "retention_matches_total", "Matches processed by the retention job.", ["action"],
+))
+DB_QUERY_SECONDS = registry.register(Histogram(
+    "db_query_seconds", "Database statement execution time.", ["statement"],
+))
+
+
+class StageTimings:
+    """Per-stage timings of one analysis request.
+
+    Stages report their own measurements through :meth:`record` (the
+    :class:`~services.stage_graph.StageGraph` does this for every stage); CPU
+    time is process-wide, so overlapping stages each see the CPU burnt by
+    their neighbours too.
+    """
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def record(self, stage: str, wall: float, cpu: float) -> None:
+        """Record a stage measured elsewhere (e.g. by a concurrent executor)."""
+        ANALYSIS_STAGE_SECONDS.observe(wall, stage=stage)
+        ANALYSIS_STAGE_CPU_SECONDS.observe(cpu, stage=stage)
+        entry = self.stages.setdefault(stage, {"wallMs": 0.0, "cpuMs": 0.0})
+        entry["wallMs"] += wall * 1000
+        entry["cpuMs"] += cpu * 1000
+
+
+def instrument_engine(engine) -> None:
+    """Record statement execution time for an (async) SQLAlchemy engine."""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    # The start time lives on the statement's execution context, which is
+    # discarded when the statement fails, so nothing leaks onto the pooled
+    # connection (IntegrityError is a normal outcome of some inserts).
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        start = getattr(context, "_query_start", None)
+        if start is None:
+            return
+        verb = (statement.lstrip().split(None, 1) or ["OTHER"])[0].upper()
+        DB_QUERY_SECONDS.observe(time.perf_counter() - start, statement=verb)
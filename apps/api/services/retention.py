@@ -0,0 +1,425 @@
+"""Retention for ``matches`` and ``participants``.
+
+Both tables grow with every analysis, and ``matches.data`` repeats the full
+stats of all ten participants.  :func:`run_retention` applies a
+:class:`RetentionPolicy`:
+
+* after ``RETENTION_STRIP_JSON_DAYS`` a match's raw JSON and its stored
+  timeline are dropped.  Participant rows (including ``stats_json``) stay, so
+  player features still load; only the enemy-cast features in
+  ``ml.pipeline`` (skillshot dodge rate) read ``matches.data`` and fall back
+  to 0 for such matches.  The timeline views (match heatmap and series, lane
+  leads, player heatmap) keep working: they read the participant list from
+  :func:`match_data_from_participants` and fetch the timeline from Riot
+  again, storing it until the match is archived.  The trade-off is one Riot
+  request per stripped match viewed, and once Riot no longer serves the match
+  (about two years) those views answer "Timeline not available";
+* after ``RETENTION_ARCHIVE_DAYS`` matches and their participants move to
+  ``matches_archive``/``participants_archive``; derived rows (position
+  grids, timelines) are deleted.
+
+Both steps work through ``RETENTION_BATCH_SIZE`` matches per transaction, so
+ingestion never waits on them for long.  A value of 0 disables a step, which
+is the default.
+
+On PostgreSQL ``participants`` can be range-partitioned by ``game_creation``
+month with :func:`partition_participants`.  This is a one-off that rewrites
+the table under an exclusive lock, so run it in a maintenance window.  From
+then on :func:`run_retention` also creates ``RETENTION_PARTITION_MONTHS_AHEAD``
+future partitions, and drops old partitions once archiving has emptied them.
+Recent-N player queries then touch the few newest partitions.
+
+The API runs the job every ``RETENTION_INTERVAL_SECONDS`` (0, the default,
+disables it).  Every worker runs the loop; on PostgreSQL a run first takes
+an advisory lock and is skipped while another worker's run holds it.  To run
+it from cron instead, from ``apps/api``::
+
+    python -m services.retention [--partition]
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import DateTime, delete, insert, inspect, literal, null, text, update
+from sqlalchemy.future import select
+
+from database import AsyncSessionLocal
+from models import (
+    Match, MatchArchive, MatchPositionGrid, MatchTimeline, Participant, ParticipantArchive, utcnow,
+)
+from services.metrics import RETENTION_MATCHES_TOTAL
+
+logger = logging.getLogger(__name__)
+
+DAY_MS = 24 * 3600 * 1000
+
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", "0"))
+
+# pg_advisory_xact_lock key (see init_db.MIGRATION_LOCK_ID): one run at a time
+# across workers and cron.
+RETENTION_LOCK_ID = 7_240_512_049
+
+PARTITIONED_TABLE = "participants"
+_PARTITION_NAME = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    strip_json_after_days: int = 0
+    archive_after_days: int = 0
+    batch_size: int = 500
+    partition_months_ahead: int = 3
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        return cls(
+            strip_json_after_days=int(os.getenv("RETENTION_STRIP_JSON_DAYS", "0")),
+            archive_after_days=int(os.getenv("RETENTION_ARCHIVE_DAYS", "0")),
+            batch_size=max(1, int(os.getenv("RETENTION_BATCH_SIZE", "500"))),
+            partition_months_ahead=max(0, int(os.getenv("RETENTION_PARTITION_MONTHS_AHEAD", "3"))),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.strip_json_after_days > 0 or self.archive_after_days > 0
+
+
+@dataclass
+class RetentionSummary:
+    """Outcome of :func:`run_retention`."""
+
+    stripped: int = 0
+    archived: int = 0
+    partitions_created: List[str] = field(default_factory=list)
+    partitions_dropped: List[str] = field(default_factory=list)
+    skipped: bool = False  # another run held the lock
+
+
+async def match_data_from_participants(db, match_ids: Iterable[str]) -> Dict[str, dict]:
+    """Stand-in ``matches.data`` for stripped matches, built from participant rows.
+
+    ``stats_json`` holds each participant's full match-v5 entry, so
+    ``{"info": {"participants": [...]}}`` carries the ids, teams, champions
+    and positions the timeline views read.  Matches without stored
+    participant stats are left out.
+    """
+    match_ids = list(match_ids)
+    if not match_ids:
+        return {}
+    result = await db.execute(
+        select(Participant.match_id, Participant.stats_json)
+        .where(Participant.match_id.in_(match_ids), Participant.stats_json.isnot(None))
+    )
+    participants: Dict[str, List[dict]] = {}
+    for match_id, stats in result.all():
+        participants.setdefault(match_id, []).append(stats)
+    return {
+        match_id: {"info": {"participants": sorted(rows, key=lambda p: p.get("participantId") or 0)}}
+        for match_id, rows in participants.items()
+    }
+
+
+async def strip_raw_json(session_factory, older_than_ms: int, batch_size: int) -> int:
+    """Drop ``matches.data`` and stored timelines of matches created before *older_than_ms*."""
+    stripped = 0
+    while True:
+        async with session_factory() as session:
+            result = await session.execute(
+                select(Match.match_id)
+                .where(Match.game_creation < older_than_ms, Match.data.isnot(None))
+                .limit(batch_size)
+            )
+            match_ids = list(result.scalars().all())
+            if not match_ids:
+                return stripped
+            # SQL NULL, not JSON 'null', so the rows leave the filter above.
+            await session.execute(update(Match).where(Match.match_id.in_(match_ids)).values(data=null()))
+            await session.execute(delete(MatchTimeline).where(MatchTimeline.match_id.in_(match_ids)))
+            await session.commit()
+        stripped += len(match_ids)
+        RETENTION_MATCHES_TOTAL.inc(len(match_ids), action="stripped")
+
+
+def _copy_columns(source, target) -> List[str]:
+    return [c.name for c in source.__table__.columns if c.name in target.__table__.columns]
+
+
+async def archive_matches(session_factory, older_than_ms: int, batch_size: int) -> int:
+    """Move matches created before *older_than_ms* (and their participants) to the archive tables."""
+    match_columns = _copy_columns(Match, MatchArchive)
+    participant_columns = _copy_columns(Participant, ParticipantArchive)
+    archived = 0
+    while True:
+        async with session_factory() as session:
+            result = await session.execute(
+                select(Match.match_id)
+                .where(Match.game_creation < older_than_ms)
+                .order_by(Match.game_creation)
+                .limit(batch_size)
+            )
+            match_ids = list(result.scalars().all())
+            if not match_ids:
+                return archived
+            now = literal(utcnow(), DateTime)
+
+            # A match archived before and ingested again replaces its old copy.
+            await session.execute(delete(ParticipantArchive).where(ParticipantArchive.match_id.in_(match_ids)))
+            await session.execute(delete(MatchArchive).where(MatchArchive.match_id.in_(match_ids)))
+            await session.execute(
+                insert(MatchArchive).from_select(
+                    match_columns + ["archived_at"],
+                    select(*(Match.__table__.c[c] for c in match_columns), now)
+                    .where(Match.match_id.in_(match_ids)),
+                )
+            )
+            await session.execute(
+                insert(ParticipantArchive).from_select(
+                    participant_columns + ["archived_at"],
+                    select(*(Participant.__table__.c[c] for c in participant_columns), now)
+                    .where(Participant.match_id.in_(match_ids)),
+                )
+            )
+            for model in (MatchPositionGrid, MatchTimeline, Participant, Match):
+                await session.execute(delete(model).where(model.match_id.in_(match_ids)))
+            await session.commit()
+        archived += len(match_ids)
+        RETENTION_MATCHES_TOTAL.inc(len(match_ids), action="archived")
+
+
+# --- PostgreSQL partitions ---------------------------------------------------
+
+def _month_start_ms(year: int, month: int) -> int:
+    return int(datetime.datetime(year, month, 1, tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+
+def _next_month(year: int, month: int) -> Tuple[int, int]:
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def month_partitions(table: str, start_ms: int, end_ms: int) -> List[Tuple[str, int, int]]:
+    """``(name, from_ms, to_ms)`` for every calendar month (UTC) overlapping ``[start_ms, end_ms]``."""
+    start = datetime.datetime.fromtimestamp(start_ms / 1000, datetime.timezone.utc)
+    year, month = start.year, start.month
+    partitions = []
+    while _month_start_ms(year, month) <= end_ms:
+        upper = _next_month(year, month)
+        partitions.append((
+            f"{table}_p{year:04d}_{month:02d}", _month_start_ms(year, month), _month_start_ms(*upper),
+        ))
+        year, month = upper
+    return partitions
+
+
+def _months_ahead_ms(now_ms: int, months: int) -> int:
+    now = datetime.datetime.fromtimestamp(now_ms / 1000, datetime.timezone.utc)
+    year, month = now.year, now.month
+    for _ in range(months):
+        year, month = _next_month(year, month)
+    return _month_start_ms(year, month)
+
+
+def is_partitioned(conn, table: str = PARTITIONED_TABLE) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :table"
+        ),
+        {"table": table},
+    ).first() is not None
+
+
+def _create_partitions(conn, table: str, start_ms: int, end_ms: int) -> List[str]:
+    existing = set(inspect(conn).get_table_names())
+    created = []
+    for name, lower, upper in month_partitions(table, start_ms, end_ms):
+        if name in existing:
+            continue
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM ({lower}) TO ({upper})"
+        ))
+        created.append(name)
+    return created
+
+
+def ensure_partitions(conn, now_ms: int, months_ahead: int, table: str = PARTITIONED_TABLE) -> List[str]:
+    """Create the current and next *months_ahead* monthly partitions if *table* is partitioned."""
+    if not is_partitioned(conn, table):
+        return []
+    return _create_partitions(conn, table, now_ms, _months_ahead_ms(now_ms, months_ahead) - 1)
+
+
+def drop_empty_partitions(conn, older_than_ms: int, table: str = PARTITIONED_TABLE) -> List[str]:
+    """Drop monthly partitions of *table* that end before *older_than_ms* and hold no rows."""
+    if not is_partitioned(conn, table):
+        return []
+    names = conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :table"
+        ),
+        {"table": table},
+    ).scalars().all()
+    dropped = []
+    for name in sorted(names):
+        match = _PARTITION_NAME.search(name)
+        if match is None:  # the DEFAULT partition
+            continue
+        upper = _month_start_ms(*_next_month(int(match.group(1)), int(match.group(2))))
+        if upper > older_than_ms:
+            continue
+        if conn.execute(text(f"SELECT 1 FROM {name} LIMIT 1")).first() is not None:
+            continue
+        conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
+
+
+def partition_participants(conn, now_ms: int, months_ahead: int = 3) -> bool:
+    """Rebuild ``participants`` as a table RANGE-partitioned by ``game_creation`` month.
+
+    PostgreSQL only, one transaction holding an exclusive lock while every
+    row is copied.  The primary key becomes ``(id, game_creation)`` as
+    partitioning requires; rows without ``game_creation`` get 0 and land in
+    the DEFAULT partition.  Returns ``False`` when there was nothing to do.
+    """
+    table = PARTITIONED_TABLE
+    legacy = f"{table}_unpartitioned"
+    if conn.dialect.name != "postgresql" or is_partitioned(conn, table):
+        return False
+
+    conn.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+    columns = [c["name"] for c in inspect(conn).get_columns(table)]
+    oldest = conn.execute(text(f"SELECT min(game_creation) FROM {table} WHERE game_creation > 0")).scalar()
+    sequence = conn.execute(text(f"SELECT pg_get_serial_sequence('{table}', 'id')")).scalar()
+
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    conn.execute(text(
+        f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (game_creation)"
+    ))
+    conn.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+    _create_partitions(conn, table, oldest or now_ms, _months_ahead_ms(now_ms, months_ahead) - 1)
+
+    column_list = ", ".join(columns)
+    select_list = ", ".join(
+        "COALESCE(game_creation, 0)" if c == "game_creation" else c for c in columns
+    )
+    conn.execute(text(f"INSERT INTO {table} ({column_list}) SELECT {select_list} FROM {legacy}"))
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+    conn.execute(text(f"DROP TABLE {legacy}"))
+
+    conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, game_creation)"))
+    conn.execute(text(f"ALTER TABLE {table} ADD FOREIGN KEY (match_id) REFERENCES matches (match_id)"))
+    conn.execute(text(f"CREATE INDEX ix_{table}_puuid ON {table} (puuid)"))
+    conn.execute(text(f"CREATE INDEX idx_participant_puuid_match ON {table} (puuid, match_id)"))
+    conn.execute(text(f"CREATE INDEX idx_participant_puuid_creation ON {table} (puuid, game_creation DESC)"))
+    return True
+
+
+# --- Job -----------------------------------------------------------------------
+
+async def run_retention(
+    policy: Optional[RetentionPolicy] = None,
+    session_factory=AsyncSessionLocal,
+    now_ms: Optional[int] = None,
+) -> RetentionSummary:
+    """Apply *policy* (default: from the environment) once.
+
+    Returns a ``skipped`` summary when another run holds the lock.
+    """
+    policy = policy or RetentionPolicy.from_env()
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+
+    # The lock is transaction-scoped: this session keeps its (otherwise idle)
+    # transaction open for the whole run, and PostgreSQL releases the lock
+    # when it ends, even if the process dies.
+    async with session_factory() as lock_session:
+        lock_conn = await lock_session.connection()
+        if lock_conn.dialect.name == "postgresql":
+            locked = (await lock_conn.execute(
+                text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": RETENTION_LOCK_ID}
+            )).scalar()
+            if not locked:
+                logger.info("Retention: another run is in progress, skipping")
+                return RetentionSummary(skipped=True)
+        try:
+            return await _run_retention(policy, session_factory, now_ms)
+        finally:
+            await lock_session.rollback()
+
+
+async def _run_retention(policy: RetentionPolicy, session_factory, now_ms: int) -> RetentionSummary:
+    summary = RetentionSummary()
+
+    async with session_factory() as session:
+        conn = await session.connection()
+        summary.partitions_created = await conn.run_sync(ensure_partitions, now_ms, policy.partition_months_ahead)
+        await session.commit()
+
+    if policy.strip_json_after_days > 0:
+        summary.stripped = await strip_raw_json(
+            session_factory, now_ms - policy.strip_json_after_days * DAY_MS, policy.batch_size,
+        )
+    if policy.archive_after_days > 0:
+        cutoff = now_ms - policy.archive_after_days * DAY_MS
+        summary.archived = await archive_matches(session_factory, cutoff, policy.batch_size)
+        async with session_factory() as session:
+            conn = await session.connection()
+            summary.partitions_dropped = await conn.run_sync(drop_empty_partitions, cutoff)
+            await session.commit()
+
+    logger.info(
+        "Retention: %d stripped, %d archived, partitions +%s -%s",
+        summary.stripped, summary.archived, summary.partitions_created, summary.partitions_dropped,
+    )
+    return summary
+
+
+async def _retention_loop(policy: RetentionPolicy, interval: int) -> None:
+    while True:
+        try:
+            await run_retention(policy)
+        except Exception:
+            logger.exception("Retention run failed")
+        await asyncio.sleep(interval)
+
+
+def start_retention_task() -> Optional[asyncio.Task]:
+    """Start the periodic job when ``RETENTION_INTERVAL_SECONDS`` and a policy step are set."""
+    policy = RetentionPolicy.from_env()
+    if RETENTION_INTERVAL_SECONDS <= 0 or not policy.enabled:
+        return None
+    return asyncio.create_task(_retention_loop(policy, RETENTION_INTERVAL_SECONDS))
+
+
+async def _main(partition: bool) -> None:
+    if partition:
+        async with AsyncSessionLocal() as session:
+            conn = await session.connection()
+            policy = RetentionPolicy.from_env()
+            done = await conn.run_sync(
+                partition_participants, int(time.time() * 1000), policy.partition_months_ahead,
+            )
+            await session.commit()
+        logger.info("participants %s", "partitioned" if done else "already partitioned (or not PostgreSQL)")
+    await run_retention()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the match retention policy once.")
+    parser.add_argument(
+        "--partition", action="store_true",
+        help="first convert participants to monthly partitions (PostgreSQL, takes an exclusive lock)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.partition))
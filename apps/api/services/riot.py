@@ -1,11 +1,11 @@
 import os
+import time
 import logging
 from typing import Dict, Any, Optional
 
 from riotskillissue import (
     RiotClient,
     RiotClientConfig,
-    MemoryCache,
     NotFoundError,
     RateLimitError,
     RiotAPIError,
@@ -13,6 +13,9 @@ from riotskillissue import (
 
 from pathlib import Path
 
+from services.metrics import RIOT_REQUESTS_TOTAL, RIOT_REQUEST_SECONDS
+from services.riot_cache import build_cache
+
 logger = logging.getLogger(__name__)
 
 # Try to load .env files for local development (optional)
@@ -50,7 +53,8 @@ class RiotService:
     - Rate limiting (acquires before every call)
     - Automatic 429 retry (sleeps for Retry-After, transparent)
     - 5xx retries with configurable ``max_retries``
-    - Response caching (via ``MemoryCache``)
+    - Response caching, through our :class:`~services.riot_cache.TieredCache`
+      (memory LRU -> SQLite file -> Redis, with per-endpoint TTLs)
     """
 
     _instance: Optional["RiotService"] = None
@@ -65,7 +69,7 @@ class RiotService:
             inst = super().__new__(cls)
             inst.client = RiotClient(
                 config=config,
-                cache=MemoryCache(max_size=2048),
+                cache=build_cache(config.redis_url),
             )
             cls._instance = inst
         return cls._instance
@@ -82,19 +86,45 @@ class RiotService:
         """Return the latest Data Dragon patch version (cached by the library)."""
         return await self.client.static.get_latest_version()
 
+    @staticmethod
+    async def _call(endpoint: str, fn, *args, **kwargs) -> Any:
+        """Invoke a client method, recording call count and latency per endpoint."""
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await fn(*args, **kwargs)
+        except NotFoundError:
+            outcome = "not_found"
+            raise
+        except RateLimitError:
+            outcome = "rate_limited"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            RIOT_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+            RIOT_REQUESTS_TOTAL.inc(endpoint=endpoint, outcome=outcome)
+
     # -- Riot API wrappers ---------------------------------------------------
 
     async def get_account_by_riot_id(
         self, region_routing: str, game_name: str, tag_line: str
     ) -> Any:
-        return await self.client.account.get_by_riot_id(
-            region_routing, game_name, tag_line
+        return await self._call(
+            "account.get_by_riot_id",
+            self.client.account.get_by_riot_id,
+            region_routing, game_name, tag_line,
         )
 
     async def get_summoner_by_puuid(
         self, platform_region: str, puuid: str
     ) -> Any:
-        return await self.client.summoner.get_by_puuid(platform_region, puuid)
+        return await self._call(
+            "summoner.get_by_puuid",
+            self.client.summoner.get_by_puuid,
+            platform_region, puuid,
+        )
 
     async def get_match_history(
         self,
@@ -103,22 +133,28 @@ class RiotService:
         count: int = 20,
         queue: int = 420,
     ) -> list:
-        return await self.client.match.get_match_ids_by_puuid(
-            regional_routing, puuid, queue=queue, count=count
+        return await self._call(
+            "match.get_match_ids_by_puuid",
+            self.client.match.get_match_ids_by_puuid,
+            regional_routing, puuid, queue=queue, count=count,
         )
 
     async def get_match_details(
         self, regional_routing: str, match_id: str
     ) -> Any:
-        return await self.client.match.get_match(regional_routing, match_id)
+        return await self._call(
+            "match.get_match", self.client.match.get_match, regional_routing, match_id
+        )
 
     async def get_match_timeline(
         self, regional_routing: str, match_id: str
     ) -> Optional[Any]:
         """Fetch match timeline; returns ``None`` on 404 or transient errors."""
         try:
-            return await self.client.match.get_timeline(
-                regional_routing, match_id
+            return await self._call(
+                "match.get_timeline",
+                self.client.match.get_timeline,
+                regional_routing, match_id,
             )
         except NotFoundError:
             logger.debug("Timeline not found for %s", match_id)
@@ -130,26 +166,39 @@ class RiotService:
             logger.warning("Unexpected error fetching timeline for %s: %s", match_id, e)
             return None
 
-    async def get_league_entries(
+    async def fetch_league_entries(
         self, platform_region: str, puuid: str
     ) -> list:
-        """Return ranked league entries as dicts.  Empty list on error."""
+        """Return ranked league entries as dicts; ``[]`` when unranked.
+
+        Unlike :meth:`get_league_entries`, errors are raised, so callers can
+        tell an unranked player from a failed request.
+        """
+        logger.info(
+            "Fetching league entries for PUUID %s… on region %s",
+            puuid[:8],
+            platform_region,
+        )
         try:
-            logger.info(
-                "Fetching league entries for PUUID %s… on region %s",
-                puuid[:8],
-                platform_region,
-            )
-            entries = await self.client.league.get_league_entries_by_puuid(
-                platform_region, puuid
+            entries = await self._call(
+                "league.get_league_entries_by_puuid",
+                self.client.league.get_league_entries_by_puuid,
+                platform_region, puuid,
             )
-            # Convert Pydantic DTOs to plain dicts for downstream consumers
-            if entries and hasattr(entries[0], "model_dump"):
-                return [entry.model_dump() for entry in entries]
-            return entries
         except NotFoundError:
             logger.debug("No league entries found for %s", puuid[:8])
             return []
+        # Convert Pydantic DTOs to plain dicts for downstream consumers
+        if entries and hasattr(entries[0], "model_dump"):
+            return [entry.model_dump() for entry in entries]
+        return entries or []
+
+    async def get_league_entries(
+        self, platform_region: str, puuid: str
+    ) -> list:
+        """Return ranked league entries as dicts.  Empty list on error."""
+        try:
+            return await self.fetch_league_entries(platform_region, puuid)
         except RiotAPIError as e:
             logger.warning("Error fetching league entries: %s", e)
             return []
@@ -0,0 +1,270 @@
+"""Tiered HTTP response cache for :class:`~services.riot.RiotService`.
+
+The client library caches GET responses through an ``AbstractCache`` with
+keys ``"GET:{path}:{region}:{params}"`` and values ``(status, headers,
+body)``, using one TTL for everything.  :class:`TieredCache` plugs into that
+interface and adds:
+
+* per-endpoint TTLs (:data:`ENDPOINT_POLICIES`): matches and timelines never
+  change, account, summoner and league data do;
+* an in-process LRU in front of, when configured, a shared SQLite file
+  (:class:`SQLiteCache`, ``RIOT_DISK_CACHE_PATH``) and the library's
+  ``RedisCache`` (``RIOT_REDIS_URL``).  Only persistable endpoints go past
+  memory, so restarted or freshly scaled workers warm up from there instead
+  of from Riot;
+* ``riot_cache_requests_total{endpoint,result}`` counters, where ``result``
+  is the tier that answered or ``miss``.
+
+Persistent tiers are best effort: their errors are logged and treated as
+misses, never surfaced to the request.
+"""
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence, Tuple
+
+from riotskillissue import MemoryCache
+from riotskillissue.core.cache import AbstractCache
+
+from services.metrics import RIOT_CACHE_REQUESTS_TOTAL
+from services.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+_DAY = 24 * 3600
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    endpoint: str
+    pattern: "re.Pattern[str]"
+    ttl: int
+    persist: bool
+
+
+def _policy(endpoint: str, pattern: str, ttl: int, persist: bool) -> CachePolicy:
+    return CachePolicy(endpoint, re.compile(pattern), ttl, persist)
+
+
+# First match wins; patterns are matched against the request path.  Account
+# lookups stay well below USER_REFRESH_SECONDS and in memory only, so a
+# background refresh sees renamed or reused Riot IDs.  League responses are
+# not cached (TTL 0): the stored snapshots in services.league are their
+# cache, and a refresh must not confirm a snapshot with an old response.
+ENDPOINT_POLICIES: Tuple[CachePolicy, ...] = (
+    _policy("match.timeline", r"^/lol/match/v5/matches/[^/]+/timeline$", 30 * _DAY, True),
+    _policy("match.ids", r"^/lol/match/v5/matches/by-puuid/", 60, False),
+    _policy("match", r"^/lol/match/v5/matches/[^/]+$", 30 * _DAY, True),
+    _policy("account", r"^/riot/account/", 60, False),
+    _policy("summoner", r"^/lol/summoner/", 300, False),
+    _policy("league", r"^/lol/league/", 0, False),
+)
+
+
+def policy_for(key: str) -> Optional[CachePolicy]:
+    """Policy for a library cache key, or ``None`` (memory only, library TTL)."""
+    if not key.startswith("GET:"):
+        return None
+    path = key[4:].split(":", 1)[0]
+    for policy in ENDPOINT_POLICIES:
+        if policy.pattern.search(path):
+            return policy
+    return None
+
+
+def _is_response(value: Any) -> bool:
+    return (
+        isinstance(value, tuple) and len(value) == 3
+        and isinstance(value[0], int) and isinstance(value[2], (bytes, bytearray))
+    )
+
+
+class SQLiteCache(AbstractCache):
+    """Response cache in a local SQLite file, shared by all workers on a host.
+
+    Only ``(status, headers, body)`` tuples are stored; bodies are
+    zlib-compressed.  Calls run in worker threads on one connection.  Every
+    ``_PRUNE_EVERY`` writes expired rows are deleted and, beyond *max_rows*,
+    the rows closest to expiry too.
+    """
+
+    _PRUNE_EVERY = 500
+
+    def __init__(self, path: str, max_rows: int = 20_000):
+        self.path = path
+        self.max_rows = max_rows
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS http_cache ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, "
+                "status INTEGER NOT NULL, headers BLOB NOT NULL, body BLOB NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT expires_at, status, headers, body FROM http_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[0] <= time.time():
+            return None
+        return row[1], loads(row[2]), zlib.decompress(row[3])
+
+    def _set(self, key: str, value: Any, ttl: int) -> None:
+        status, headers, body = value
+        record = (key, time.time() + ttl, status, dumps(dict(headers)), zlib.compress(bytes(body), 6))
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO http_cache (key, expires_at, status, headers, body) "
+                "VALUES (?, ?, ?, ?, ?)",
+                record,
+            )
+            self._writes += 1
+            if self._writes % self._PRUNE_EVERY == 0:
+                self._prune(conn)
+            conn.commit()
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM http_cache WHERE expires_at <= ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM http_cache WHERE key IN ("
+            "SELECT key FROM http_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        if _is_response(value):
+            await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        def _delete() -> None:
+            with self._lock:
+                self._connection().execute("DELETE FROM http_cache WHERE key = ?", (key,))
+                self._connection().commit()
+
+        await asyncio.to_thread(_delete)
+
+    async def clear(self) -> None:
+        def _clear() -> None:
+            with self._lock:
+                self._connection().execute("DELETE FROM http_cache")
+                self._connection().commit()
+
+        await asyncio.to_thread(_clear)
+
+
+class TieredCache(AbstractCache):
+    """``memory`` in front of zero or more named persistent tiers."""
+
+    def __init__(self, memory: AbstractCache, persistent: Sequence[Tuple[str, AbstractCache]] = ()):
+        self.memory = memory
+        self.persistent: List[Tuple[str, AbstractCache]] = list(persistent)
+
+    async def get(self, key: str) -> Optional[Any]:
+        policy = policy_for(key)
+        endpoint = policy.endpoint if policy else "other"
+
+        value = await self.memory.get(key)
+        if value is not None:
+            RIOT_CACHE_REQUESTS_TOTAL.inc(endpoint=endpoint, result="memory")
+            return value
+
+        if policy is not None and policy.persist:
+            for i, (name, tier) in enumerate(self.persistent):
+                try:
+                    value = await tier.get(key)
+                except Exception as e:
+                    logger.warning("Riot cache tier %s get failed: %s", name, e)
+                    continue
+                if value is None:
+                    continue
+                RIOT_CACHE_REQUESTS_TOTAL.inc(endpoint=endpoint, result=name)
+                # Promote into the faster tiers.
+                await self.memory.set(key, value, policy.ttl)
+                for upper_name, upper in self.persistent[:i]:
+                    await self._safe_set(upper_name, upper, key, value, policy.ttl)
+                return value
+
+        RIOT_CACHE_REQUESTS_TOTAL.inc(endpoint=endpoint, result="miss")
+        return None
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        policy = policy_for(key)
+        if policy is not None:
+            ttl = policy.ttl
+            if ttl <= 0:
+                return
+        await self.memory.set(key, value, ttl)
+        if policy is not None and policy.persist:
+            for name, tier in self.persistent:
+                await self._safe_set(name, tier, key, value, ttl)
+
+    @staticmethod
+    async def _safe_set(name: str, tier: AbstractCache, key: str, value: Any, ttl: int) -> None:
+        try:
+            await tier.set(key, value, ttl)
+        except Exception as e:
+            logger.warning("Riot cache tier %s set failed: %s", name, e)
+
+    async def delete(self, key: str) -> None:
+        await self.memory.delete(key)
+        for name, tier in self.persistent:
+            try:
+                await tier.delete(key)
+            except Exception as e:
+                logger.warning("Riot cache tier %s delete failed: %s", name, e)
+
+    async def clear(self) -> None:
+        await self.memory.clear()
+        for name, tier in self.persistent:
+            try:
+                await tier.clear()
+            except Exception as e:
+                logger.warning("Riot cache tier %s clear failed: %s", name, e)
+
+
+def build_cache(redis_url: Optional[str] = None) -> TieredCache:
+    """Cache chain from the environment.
+
+    ``RIOT_MEMORY_CACHE_SIZE`` (default 2048) bounds the LRU.
+    ``RIOT_DISK_CACHE_PATH`` enables the SQLite tier (off by default; point it
+    at a data directory outside the source tree), holding at most
+    ``RIOT_DISK_CACHE_MAX_ROWS`` (default 20000) responses.  *redis_url* adds
+    the library's Redis tier.
+    """
+    memory = MemoryCache(max_size=int(os.getenv("RIOT_MEMORY_CACHE_SIZE", "2048")))
+    persistent: List[Tuple[str, AbstractCache]] = []
+
+    disk_path = os.getenv("RIOT_DISK_CACHE_PATH", "")
+    if disk_path:
+        max_rows = max(1, int(os.getenv("RIOT_DISK_CACHE_MAX_ROWS", "20000")))
+        persistent.append(("disk", SQLiteCache(disk_path, max_rows)))
+
+    if redis_url:
+        try:
+            from riotskillissue.core.cache import RedisCache
+        except ImportError:
+            logger.warning("RIOT_REDIS_URL is set but the redis package is not installed")
+        else:
+            persistent.append(("redis", RedisCache(redis_url)))
+
+    return TieredCache(memory, persistent)
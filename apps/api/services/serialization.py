@@ -0,0 +1,87 @@
+"""JSON serialization for API payloads.
+
+Analysis results are large nested structures full of numpy scalars and the
+occasional NaN/inf coming out of pandas.  ``orjson`` encodes all of that in a
+single native pass (numpy support, NaN/inf -> ``null``), so there is no need
+to walk the structure in Python first.  When ``orjson`` is not installed we
+fall back to :func:`sanitize_for_json` + the standard library encoder, which
+produces the same output, just slower.
+"""
+import json
+import math
+from typing import Any
+
+import numpy as np
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without orjson
+    orjson = None
+
+
+def sanitize_for_json(obj):
+    """Recursively sanitize a data structure for JSON serialization."""
+    if isinstance(obj, dict):
+        return {k: sanitize_for_json(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [sanitize_for_json(item) for item in obj]
+    elif isinstance(obj, float):
+        if math.isnan(obj) or math.isinf(obj):
+            return None
+        return obj
+    elif isinstance(obj, (np.floating, np.integer)):
+        if isinstance(obj, np.floating) and (np.isnan(obj) or np.isinf(obj)):
+            return None
+        return obj.item()
+    elif isinstance(obj, np.bool_):
+        return bool(obj)
+    elif isinstance(obj, np.ndarray):
+        return sanitize_for_json(obj.tolist())
+    return obj
+
+
+def _default(obj: Any) -> Any:
+    """Fallback for values orjson cannot encode natively."""
+    if isinstance(obj, np.ndarray):
+        # Non-contiguous or object arrays; orjson encodes the list (NaN -> null).
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize *obj* to compact JSON bytes (NaN/inf become ``null``)."""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+
+else:
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize *obj* to compact JSON bytes (NaN/inf become ``null``)."""
+        return json.dumps(
+            sanitize_for_json(obj), default=_default, separators=(",", ":")
+        ).encode("utf-8")
+
+    loads = json.loads
+
+
+def ndjson_line(obj: Any) -> bytes:
+    """Serialize one NDJSON event, including the trailing newline."""
+    return dumps(obj) + b"\n"
+
+
+class FastJSONResponse(Response):
+    """``JSONResponse`` replacement backed by :func:`dumps`."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
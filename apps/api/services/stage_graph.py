@@ -0,0 +1,165 @@
+"""Tiny dependency-graph executor for multi-stage streaming pipelines.
+
+Stages are registered in *presentation order* together with the stages they
+depend on.  :meth:`StageGraph.run` starts every stage as soon as its
+dependencies have finished, so independent stages overlap, but it reports
+them strictly in registration order: the consumer sees a ``start`` event,
+any ``progress`` reports, and then a ``done`` event for stage 1, then stage 2,
+and so on.  That keeps progress percentages monotonic for the client while
+the actual work runs concurrently.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from services.metrics import StageTimings
+
+
+class StageError(Exception):
+    """A stage raised; ``stage`` names it and ``__cause__`` holds the error."""
+
+    def __init__(self, stage: str, error: BaseException):
+        super().__init__(f"{stage}: {error}")
+        self.stage = stage
+        self.error = error
+
+
+@dataclass
+class StageContext:
+    """Passed to every stage function."""
+
+    results: Dict[str, Any]
+    _queue: "asyncio.Queue[Tuple[str, int]]"
+
+    def report(self, message: str, percent: int) -> None:
+        """Emit an intermediate progress update for the running stage."""
+        self._queue.put_nowait((message, percent))
+
+
+@dataclass
+class StageEvent:
+    kind: str  # "start" | "progress" | "done"
+    stage: str
+    message: str = ""
+    percent: int = 0
+    result: Any = None
+
+
+@dataclass
+class _Stage:
+    name: str
+    fn: Callable[[StageContext], Awaitable[Any]]
+    deps: Tuple[str, ...]
+    message: str
+    percent: int
+    priority: int = 0
+    queue: "asyncio.Queue[Tuple[str, int]]" = field(default_factory=asyncio.Queue)
+
+
+class StageGraph:
+    def __init__(self, timings: Optional[StageTimings] = None) -> None:
+        self._stages: Dict[str, _Stage] = {}
+        self._timings = timings
+
+    def stage(
+        self,
+        name: str,
+        *,
+        message: str,
+        percent: int,
+        deps: Tuple[str, ...] = (),
+        priority: int = 0,
+    ) -> Callable:
+        """Decorator registering ``async def fn(ctx) -> result`` as a stage.
+
+        When several stages become ready at once, higher *priority* stages are
+        resumed first.  Give network-bound stages a higher priority so their
+        requests are in flight before a CPU-bound sibling occupies the loop.
+        """
+
+        def decorator(fn: Callable[[StageContext], Awaitable[Any]]):
+            unknown = [d for d in deps if d not in self._stages]
+            if unknown:
+                raise ValueError(f"Stage {name} depends on unregistered stages: {unknown}")
+            self._stages[name] = _Stage(name, fn, tuple(deps), message, percent, priority)
+            return fn
+
+        return decorator
+
+    async def _run_stage(self, stage: _Stage, tasks: Dict[str, "asyncio.Task"], results: Dict[str, Any]) -> Any:
+        if stage.deps:
+            await asyncio.gather(*(tasks[d] for d in stage.deps))
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            return await stage.fn(StageContext(results, stage.queue))
+        finally:
+            if self._timings is not None:
+                self._timings.record(
+                    stage.name,
+                    time.perf_counter() - wall_start,
+                    time.process_time() - cpu_start,
+                )
+
+    async def run(self) -> AsyncIterator[StageEvent]:
+        """Execute the graph, yielding ordered :class:`StageEvent` objects.
+
+        Raises :class:`StageError` for the first stage (in registration order)
+        that fails; all still-running stages are cancelled when the consumer
+        stops iterating, whether normally, on error or on early exit.
+        """
+        results: Dict[str, Any] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def _store(stage: _Stage) -> Any:
+            value = await self._run_stage(stage, tasks, results)
+            results[stage.name] = value
+            return value
+
+        # Tasks resume in creation order once a shared dependency finishes,
+        # so creation order doubles as the scheduling priority.
+        ordered = sorted(
+            enumerate(self._stages.values()), key=lambda item: (-item[1].priority, item[0])
+        )
+        for _, stage in ordered:
+            tasks[stage.name] = asyncio.ensure_future(_store(stage))
+
+        try:
+            for stage in self._stages.values():
+                task = tasks[stage.name]
+                yield StageEvent("start", stage.name, stage.message, stage.percent)
+
+                while True:
+                    getter = asyncio.ensure_future(stage.queue.get())
+                    done, _ = await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+                    if getter in done:
+                        message, percent = getter.result()
+                        yield StageEvent("progress", stage.name, message, percent)
+                        continue
+                    getter.cancel()
+                    break
+
+                # Drain reports that raced with completion.
+                while not stage.queue.empty():
+                    message, percent = stage.queue.get_nowait()
+                    yield StageEvent("progress", stage.name, message, percent)
+
+                try:
+                    value = task.result()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    raise StageError(stage.name, exc) from exc
+                yield StageEvent("done", stage.name, result=value)
+        finally:
+            pending = [t for t in tasks.values() if not t.done()]
+            for t in pending:
+                t.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            # Retrieve exceptions of finished-but-unreported stages so asyncio
+            # does not log "exception was never retrieved".
+            for t in tasks.values():
+                if t.done() and not t.cancelled():
+                    t.exception()
@@ -0,0 +1,180 @@
+"""Persisted match timelines and ingestion-time prefetching.
+
+Timelines used to be fetched only once the analysis reached its lane-lead
+and last-match stages, long after the match-detail requests had finished.
+Ingestion now queues a timeline fetch for every newly saved match into the
+same rate-limited pool (see :func:`prefetch_timeline`), stores the result in
+``match_timelines`` and leaves the running task in the analysis's timeline
+cache, so later stages await a request that is already in flight.  Matches
+ingested by earlier requests are served from the table
+(:func:`seed_timeline_cache`), and the per-match endpoints read through it
+(:func:`load_timeline`).
+
+Only the fields the parser reads are stored (:func:`compact_timeline`),
+zlib-compressed.
+"""
+import asyncio
+import logging
+import zlib
+from typing import Any, Optional
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import AsyncSessionLocal
+from ml.timeline_parsing import ParsedTimeline, compact_timeline, parse_timeline
+from models import MatchTimeline, Participant
+from services.riot import riot_service
+from services.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+
+def encode_timeline(timeline: Any) -> Optional[bytes]:
+    """Compact and compress a raw timeline for storage."""
+    compact = compact_timeline(timeline)
+    if compact is None:
+        return None
+    return zlib.compress(dumps(compact), 6)
+
+
+def decode_timeline(blob: Optional[bytes]) -> Optional[ParsedTimeline]:
+    """Parse a stored timeline; ``None`` when missing or unreadable."""
+    if not blob:
+        return None
+    try:
+        return parse_timeline(loads(zlib.decompress(blob)))
+    except (zlib.error, ValueError):
+        return None
+
+
+async def store_timeline(match_id: str, timeline: Any, session_factory=AsyncSessionLocal) -> None:
+    """Persist *timeline* in its own short-lived session (best effort)."""
+    blob = await asyncio.to_thread(encode_timeline, timeline)
+    if blob is None:
+        return
+    async with session_factory() as session:
+        session.add(MatchTimeline(match_id=match_id, data=blob))
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+
+
+async def _parse_and_store(match_id: str, timeline: Any, session_factory) -> ParsedTimeline:
+    """Parse a freshly fetched timeline while persisting it."""
+    async def _store() -> None:
+        try:
+            await store_timeline(match_id, timeline, session_factory)
+        except Exception as e:
+            logger.warning("Failed to store timeline %s: %s", match_id, e)
+
+    parsed, _ = await asyncio.gather(asyncio.to_thread(parse_timeline, timeline), _store())
+    return parsed
+
+
+async def load_timeline(
+    match_id: str,
+    regional_routing: str,
+    session_factory=AsyncSessionLocal,
+) -> Optional[ParsedTimeline]:
+    """Return *match_id*'s parsed timeline, from ``match_timelines`` when stored.
+
+    Only a missing (or unreadable) row costs a Riot request; what it returns
+    is stored for the next caller.  ``None`` when Riot has no timeline either.
+    """
+    async with session_factory() as session:
+        result = await session.execute(
+            select(MatchTimeline.data).where(MatchTimeline.match_id == match_id)
+        )
+        blob = result.scalar_one_or_none()
+    if blob:
+        parsed = await asyncio.to_thread(decode_timeline, blob)
+        if parsed is not None:
+            return parsed
+
+    timeline = await riot_service.get_match_timeline(regional_routing, match_id)
+    if not timeline:
+        return None
+    return await _parse_and_store(match_id, timeline, session_factory)
+
+
+def prefetch_timeline(
+    timeline_cache: dict,
+    regional_routing: str,
+    match_id: str,
+    sem: asyncio.Semaphore,
+    delay: float = 0.0,
+    session_factory=AsyncSessionLocal,
+) -> "asyncio.Task":
+    """Start fetching *match_id*'s timeline through *sem* and cache the task.
+
+    The task resolves to the parsed timeline (or ``None``) and persists the
+    raw one on the way.  *sem* and *delay* are the caller's request pool
+    settings, so prefetches queue behind its pending match-detail fetches
+    instead of competing with them.  A failure is logged when the task ends,
+    since nothing may ever await it.
+    """
+    task = timeline_cache.get(match_id)
+    if task is not None:
+        return task
+
+    async def _run() -> Optional[ParsedTimeline]:
+        async with sem:
+            try:
+                timeline = await riot_service.get_match_timeline(regional_routing, match_id)
+            finally:
+                await asyncio.sleep(delay)
+        if not timeline:
+            return None
+        return await _parse_and_store(match_id, timeline, session_factory)
+
+    def _log_failure(done: "asyncio.Task") -> None:
+        if not done.cancelled() and done.exception() is not None:
+            logger.warning("Timeline prefetch for %s failed: %s", match_id, done.exception())
+
+    task = asyncio.ensure_future(_run())
+    task.add_done_callback(_log_failure)
+    timeline_cache[match_id] = task
+    return task
+
+
+async def seed_timeline_cache(db: AsyncSession, puuid: str, timeline_cache: dict, limit: int) -> int:
+    """Fill *timeline_cache* with stored timelines of the player's last *limit* matches.
+
+    Entries already in the cache (e.g. running prefetches) are kept.  Stored
+    blobs are decoded in worker threads; unreadable rows are deleted instead
+    of seeded, so a later miss refetches (and re-stores) them through
+    :func:`load_timeline`.  Returns how many were seeded.
+    """
+    result = await db.execute(
+        select(MatchTimeline.match_id, MatchTimeline.data)
+        .join(Participant, Participant.match_id == MatchTimeline.match_id)
+        .where(Participant.puuid == puuid)
+        .order_by(Participant.game_creation.desc())
+        .limit(limit)
+    )
+    rows = [(match_id, blob) for match_id, blob in result.all() if match_id not in timeline_cache]
+    decoded = await asyncio.gather(*(asyncio.to_thread(decode_timeline, blob) for _, blob in rows))
+
+    loop = asyncio.get_running_loop()
+    seeded = 0
+    unreadable = []
+    for (match_id, _), parsed in zip(rows, decoded):
+        if parsed is None:
+            unreadable.append(match_id)
+            continue
+        if match_id in timeline_cache:  # prefetched while decoding
+            continue
+        future = loop.create_future()
+        future.set_result(parsed)
+        timeline_cache[match_id] = future
+        seeded += 1
+
+    if unreadable:
+        logger.warning("Dropping %d unreadable stored timelines", len(unreadable))
+        await db.execute(delete(MatchTimeline).where(MatchTimeline.match_id.in_(unreadable)))
+        await db.commit()
+    return seeded
@@ -0,0 +1,96 @@
+"""In-process cache for Riot ID -> user lookups.
+
+``FIND_ACCOUNT`` runs on every analysis and used to hit the database (and, for
+unknown Riot IDs, the account API) each time.  Resolved users are kept here as
+:class:`CachedUser` snapshots under a case-insensitive Riot ID key; Riot IDs
+that do not exist are cached as :data:`NOT_FOUND` for a shorter time so
+repeated typos do not cost an API call each.
+"""
+import datetime
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable, Optional
+
+from models import normalize_riot_id
+
+
+class _NotFound:
+    def __repr__(self) -> str:
+        return "NOT_FOUND"
+
+
+NOT_FOUND: Any = _NotFound()
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "600"))
+USER_NEGATIVE_TTL_SECONDS = float(os.getenv("USER_NEGATIVE_TTL_SECONDS", "120"))
+
+
+class TTLCache:
+    """Small LRU mapping whose entries expire after a per-entry TTL."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self._max = max(1, max_size)
+        self._ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._data[key] = (time.monotonic() + (self._ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._max:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Detached, read-only copy of a :class:`models.User` row."""
+
+    puuid: str
+    game_name: str
+    tag_line: str
+    region: str
+    profile_icon_id: Optional[int]
+    summoner_level: Optional[int]
+    last_updated: Optional[datetime.datetime]
+
+    @classmethod
+    def from_row(cls, user) -> "CachedUser":
+        return cls(
+            puuid=user.puuid,
+            game_name=user.game_name,
+            tag_line=user.tag_line,
+            region=user.region,
+            profile_icon_id=user.profile_icon_id,
+            summoner_level=user.summoner_level,
+            last_updated=user.last_updated,
+        )
+
+
+def riot_id_key(region: str, game_name: str, tag_line: str) -> tuple[str, str, str]:
+    """Cache key for a Riot ID; same normalization as the ``users`` lookup index."""
+    return (region or "", normalize_riot_id(game_name), normalize_riot_id(tag_line))
+
+
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
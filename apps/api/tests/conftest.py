@@ -23,11 +23,23 @@ class _FakeResult:
     def first(self):
         return None
 
+    def scalar(self):
+        return None
+
+    def fetchall(self):
+        return []
+
     def all(self):
         return []
 
 
 class FakeAsyncSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):  # noqa: ANN002
+        return False
+
     async def execute(self, *args, **kwargs):  # noqa: ANN001
         return _FakeResult()
 
@@ -44,6 +56,29 @@ class FakeAsyncSession:
         return None
 
 
+@pytest.fixture
+async def sqlite_engine():
+    """An empty in-memory SQLite engine, disposed after the test."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine = create_async_engine("sqlite+aiosqlite://")
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def session_factory(sqlite_engine):
+    """Session factory over an in-memory database with every model table created."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    import models  # noqa: F401  registers the tables on Base.metadata
+    from database import Base
+
+    async with sqlite_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return async_sessionmaker(sqlite_engine, expire_on_commit=False)
+
+
 @pytest.fixture
 def app():
     import main
@@ -59,6 +94,7 @@ def client(app) -> Iterator[TestClient]:
         yield FakeAsyncSession()
 
     app.dependency_overrides[database.get_db] = override_get_db
+    app.dependency_overrides[database.get_session_factory] = lambda: FakeAsyncSession
 
     with TestClient(app) as c:
         yield c
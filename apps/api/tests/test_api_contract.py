@@ -16,6 +16,12 @@ class ProgressEvent(BaseModel):
     limits: Optional[Dict[str, Any]] = None
 
 
+class PartialEvent(BaseModel):
+    type: Literal["partial"]
+    section: str
+    data: Any
+
+
 class ErrorEvent(BaseModel):
     type: Literal["error"]
     message: str
@@ -94,7 +100,7 @@ class ResultEvent(BaseModel):
     data: AnalysisResultData
 
 
-AnalyzeEvent = Union[ProgressEvent, ErrorEvent, ResultEvent]
+AnalyzeEvent = Union[ProgressEvent, PartialEvent, ErrorEvent, ResultEvent]
 
 
 def _parse_ndjson_lines(raw_lines: List[object]) -> List[dict]:
@@ -128,6 +134,13 @@ def test_analyze_rejects_invalid_riot_id(client):
     assert body.get("detail") == "Invalid Riot ID format"
 
 
+def test_analyze_request_includes_heatmap_by_default():
+    from routers.analysis import AnalyzeRequest
+
+    # Existing clients read heatmap_data from the result without asking for it.
+    assert AnalyzeRequest(riot_id="TestName#EUW", region="euw1").include_heatmap is True
+
+
 def test_analyze_stream_contract_offline(client, monkeypatch):
     import routers.analysis as analysis
 
@@ -145,7 +158,7 @@ def test_analyze_stream_contract_offline(client, monkeypatch):
                 summoner_level=456,
             )
 
-        async def ingest_match_history_generator(self, user, count: int = 20):  # noqa: ANN001
+        async def ingest_match_history_generator(self, user, count: int = 20, timeline_cache=None):  # noqa: ANN001
             yield {"current": 1, "total": 2, "status": "Ingesting match 1/2"}
             yield {"current": 2, "total": 2, "status": "Ingesting match 2/2"}
 
@@ -169,7 +182,7 @@ def test_analyze_stream_contract_offline(client, monkeypatch):
             return [{"focus": "cs", "tip": "Aim for 7+ CS/min"}]
 
     class FakeRiotService:
-        async def get_league_entries(self, league_region: str, puuid: str):
+        async def fetch_league_entries(self, league_region: str, puuid: str):
             return [
                 {
                     "queueType": "RANKED_SOLO_5x5",
@@ -190,8 +203,8 @@ def test_analyze_stream_contract_offline(client, monkeypatch):
     async def fake_get_ddragon_version():
         return "14.24.1"
 
-    async def fake_analyze_territory_for_player(*args, **kwargs):  # noqa: ANN001
-        return {}
+    async def fake_analyze_recent_timelines(*args, **kwargs):  # noqa: ANN001
+        return {"laneGoldLeadAt14": 0.0, "laneXpLeadAt14": 0.0, "laneLeadSampleSize": 0}, {}
 
     async def fake_load_player_data(db, puuid: str):  # noqa: ANN001
         return pd.DataFrame(
@@ -227,10 +240,10 @@ def test_analyze_stream_contract_offline(client, monkeypatch):
     monkeypatch.setattr(analysis, "model_instance", FakeModel())
     monkeypatch.setattr(analysis, "riot_service", FakeRiotService())
     monkeypatch.setattr(analysis, "get_ddragon_version", fake_get_ddragon_version)
-    monkeypatch.setattr(analysis, "analyze_territory_for_player", fake_analyze_territory_for_player)
+    monkeypatch.setattr(analysis, "analyze_recent_timelines", fake_analyze_recent_timelines)
     monkeypatch.setattr(analysis, "load_player_data", fake_load_player_data)
 
-    payload = {"riot_id": "TestName#EUW", "region": "euw1"}
+    payload = {"riot_id": "TestName#EUW", "region": "euw1", "include_timings": True}
     with client.stream("POST", "/api/analyze", json=payload) as r:
         assert r.status_code == 200
         assert r.headers.get("content-type", "").startswith("application/x-ndjson")
@@ -245,6 +258,8 @@ def test_analyze_stream_contract_offline(client, monkeypatch):
         t = e["type"]
         if t == "progress":
             parsed.append(ProgressEvent.model_validate(e))
+        elif t == "partial":
+            parsed.append(PartialEvent.model_validate(e))
         elif t == "result":
             parsed.append(ResultEvent.model_validate(e))
         elif t == "error":
@@ -255,3 +270,194 @@ def test_analyze_stream_contract_offline(client, monkeypatch):
     assert any(isinstance(p, ProgressEvent) for p in parsed)
     assert any(isinstance(p, ResultEvent) for p in parsed)
     assert not any(isinstance(p, ErrorEvent) for p in parsed)
+
+    # Partial sections arrive before the final result and use known section names.
+    partials = [p for p in parsed if isinstance(p, PartialEvent)]
+    assert {p.section for p in partials} >= {"user", "ranked_data", "metrics", "weighted_averages"}
+    assert {p.section for p in partials} <= set(analysis.PARTIAL_SECTIONS)
+    result_index = next(i for i, p in enumerate(parsed) if isinstance(p, ResultEvent))
+    assert all(parsed.index(p) < result_index for p in partials)
+
+    timings = events[result_index]["data"]["timings"]
+    assert {"FIND_ACCOUNT", "TRAIN_MODEL", "PREPARE_RESULTS"} <= set(timings["stages"])
+
+
+def test_analyze_stream_cancels_unfinished_prefetches(client, monkeypatch):
+    import asyncio
+
+    import routers.analysis as analysis
+
+    prefetches = []
+
+    class FakeIngestionService:
+        def __init__(self, db):  # noqa: ANN001
+            self.db = db
+
+        async def get_or_update_user(self, region_routing: str, platform_region: str, game_name: str, tag_line: str):
+            return SimpleNamespace(puuid="test-puuid", game_name=game_name, tag_line=tag_line,
+                                   region=platform_region, profile_icon_id=1, summoner_level=1)
+
+        async def ingest_match_history_generator(self, user, count: int = 20, timeline_cache=None):  # noqa: ANN001
+            # A prefetch is still in flight when ingestion fails.
+            timeline_cache["EUW1_1"] = asyncio.get_running_loop().create_future()
+            prefetches.append(timeline_cache["EUW1_1"])
+            yield {"current": 1, "total": 2, "status": "Ingesting match 1/2"}
+            raise RuntimeError("Riot is down")
+
+    class FakeRiotService:
+        async def fetch_league_entries(self, league_region: str, puuid: str):
+            return []
+
+    async def fake_get_ddragon_version():
+        return "14.24.1"
+
+    monkeypatch.setattr(analysis, "IngestionService", FakeIngestionService)
+    monkeypatch.setattr(analysis, "riot_service", FakeRiotService())
+    monkeypatch.setattr(analysis, "get_ddragon_version", fake_get_ddragon_version)
+
+    with client.stream("POST", "/api/analyze", json={"riot_id": "TestName#EUW", "region": "euw1"}) as r:
+        events = _parse_ndjson_lines(list(r.iter_lines()))
+
+    assert events[-1] == {"type": "error", "message": "Riot is down"}
+    assert len(prefetches) == 1 and prefetches[0].cancelled()
+
+
+def test_match_heatmap_not_found(client):
+    r = client.get("/api/matches/EUW1_404/heatmap")
+    assert r.status_code == 404
+
+
+def _serve_match(app, monkeypatch, match, participants=(), frames=()) -> list:
+    """Serve *match* (and its *participants* rows) from the DB and *frames* from Riot.
+
+    Returns the list the fake Riot service records timeline calls in.
+    """
+    import database
+    import routers.analysis as analysis
+    import services.timelines as timelines
+
+    class _Result:
+        def scalar_one_or_none(self):
+            return match
+
+        def all(self):
+            return list(participants)
+
+    class _Session:
+        async def execute(self, *args, **kwargs):  # noqa: ANN001
+            return _Result()
+
+        async def commit(self):
+            return None
+
+    async def override_get_db():
+        yield _Session()
+
+    timeline_calls = []
+
+    class FakeRiotService:
+        async def get_match_timeline(self, regional_routing: str, match_id: str):
+            timeline_calls.append((regional_routing, match_id))
+            return {"info": {"frames": list(frames)}}
+
+    monkeypatch.setattr(timelines, "riot_service", FakeRiotService())
+    monkeypatch.setattr(analysis, "_HEATMAP_CACHE", analysis.OrderedDict())
+    app.dependency_overrides[database.get_db] = override_get_db
+    return timeline_calls
+
+
+_AHRI_MATCH = SimpleNamespace(
+    match_id="EUW1_1",
+    platform_id="EUW1",
+    data={"info": {"participants": [{"participantId": 1, "championName": "Ahri", "teamId": 100}]}},
+)
+
+_AHRI_FRAMES = [
+    {"timestamp": i * 60000, "participantFrames": {"1": {"position": {"x": 500 + 100 * i, "y": 400}, "totalGold": 500 + 300 * i}}}
+    for i in range(5)
+]
+
+
+def test_match_heatmap_columnar_with_etag(app, client, monkeypatch):
+    from ml.heatmap_encoding import decode_column
+
+    timeline_calls = _serve_match(app, monkeypatch, _AHRI_MATCH, frames=_AHRI_FRAMES)
+
+    r = client.get("/api/matches/EUW1_1/heatmap")
+    assert r.status_code == 200
+    etag = r.headers["etag"]
+    body = r.json()
+    assert body["format"] == "columnar"
+    ahri = body["participants"][0]
+    assert ahri["championName"] == "Ahri"
+    assert decode_column(ahri["columns"]["x"]).tolist() == [500, 600, 700, 800, 900]
+    assert decode_column(ahri["columns"]["timestamp"]).tolist() == [0, 60000, 120000, 180000, 240000]
+    assert timeline_calls == [("europe", "EUW1_1")]
+
+    r2 = client.get("/api/matches/EUW1_1/heatmap", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+    assert len(timeline_calls) == 1
+
+
+def test_match_heatmap_grid_format(app, client, monkeypatch):
+    from ml.heatmap_encoding import decode_grid
+
+    _serve_match(app, monkeypatch, _AHRI_MATCH, frames=_AHRI_FRAMES)
+
+    r = client.get("/api/matches/EUW1_1/heatmap?format=grid&bins=16")
+    assert r.status_code == 200
+    body = r.json()
+    assert body["format"] == "grid" and body["bins"] == 16
+    assert decode_grid(body["participants"][0]["grid"], 16).sum() == 5
+
+
+def test_match_series_all_participants(app, client, monkeypatch):
+    _serve_match(app, monkeypatch, _AHRI_MATCH, frames=_AHRI_FRAMES)
+
+    r = client.get("/api/matches/EUW1_1/series")
+    assert r.status_code == 200
+    series = r.json()
+    assert set(series) == {str(pid) for pid in range(1, 11)}
+    assert [p["myGold"] for p in series["1"]["timeline"]] == [500, 800, 1100, 1400, 1700]
+
+
+def test_match_series_of_stripped_match_uses_participant_rows(app, client, monkeypatch):
+    # Retention dropped the raw JSON; the participant rows are left.
+    match = SimpleNamespace(match_id="EUW1_2", platform_id="EUW1", data=None)
+    participants = [
+        ("EUW1_2", {"participantId": pid, "teamId": 100 if pid <= 5 else 200,
+                    "teamPosition": ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"][(pid - 1) % 5]})
+        for pid in range(1, 11)
+    ]
+    frames = [
+        {"timestamp": i * 60000, "participantFrames": {
+            str(pid): {"position": {"x": 100, "y": 100}, "totalGold": 500 + pid * 10 * i}
+            for pid in range(1, 11)
+        }}
+        for i in range(3)
+    ]
+    _serve_match(app, monkeypatch, match, participants, frames)
+
+    r = client.get("/api/matches/EUW1_2/series")
+    assert r.status_code == 200
+    # Lane opponents come from the rebuilt participant list (1 vs 6 in top).
+    point = r.json()["1"]["timeline"][-1]
+    assert point["myGold"] == 520 and point["enemyGold"] == 620
+
+
+def test_metrics_endpoint_prometheus_format(client):
+    from services.metrics import ANALYSIS_STAGE_SECONDS
+
+    ANALYSIS_STAGE_SECONDS.observe(0.2, stage="TRAIN_MODEL")
+    r = client.get("/api/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    text = r.text
+    assert "# TYPE analysis_stage_seconds histogram" in text
+    assert 'analysis_stage_seconds_bucket{stage="TRAIN_MODEL",le="+Inf"}' in text
+    assert "# TYPE riot_requests_total counter" in text
+
+
+def test_player_heatmap_not_found(client):
+    r = client.get("/api/players/unknown/heatmap")
+    assert r.status_code == 404
@@ -115,6 +115,9 @@ async def test_riot_get_league_entries_returns_empty_on_error(monkeypatch):
 
     entries = await riot_mod.riot_service.get_league_entries("euw1", "test-puuid")
     assert entries == []
+    # The raising variant lets callers tell errors from unranked players.
+    with pytest.raises(RuntimeError):
+        await riot_mod.riot_service.fetch_league_entries("euw1", "test-puuid")
 
 
 @pytest.mark.anyio
@@ -175,3 +178,1044 @@ async def test_ddragon_version_fallback_when_service_fails(monkeypatch):
     v = await ddragon.get_ddragon_version()
     assert isinstance(v, str) and v
     assert v == "14.24.1"
+
+
+def test_serialization_dumps_handles_numpy_and_non_finite():
+    import json
+
+    import numpy as np
+
+    from services.serialization import dumps, ndjson_line
+
+    payload = {
+        "nan": float("nan"),
+        "inf": np.float64("inf"),
+        "int": np.int64(7),
+        "flag": np.bool_(True),
+        "arr": np.array([1.5, np.nan]),
+        "nested": [{"v": np.float32(2.5)}],
+    }
+    assert json.loads(dumps(payload)) == {
+        "nan": None,
+        "inf": None,
+        "int": 7,
+        "flag": True,
+        "arr": [1.5, None],
+        "nested": [{"v": 2.5}],
+    }
+    line = ndjson_line({"type": "progress"})
+    assert line.endswith(b"\n") and json.loads(line) == {"type": "progress"}
+
+
+@pytest.mark.anyio
+async def test_stage_graph_runs_independent_stages_concurrently_in_order():
+    import asyncio
+
+    from services.stage_graph import StageError, StageGraph
+
+    graph = StageGraph()
+    slow_started = asyncio.Event()
+
+    @graph.stage("A", message="a", percent=10)
+    async def _a(ctx):
+        return 1
+
+    @graph.stage("SLOW", message="slow", percent=20, deps=("A",))
+    async def _slow(ctx):
+        slow_started.set()
+        ctx.report("halfway", 25)
+        await asyncio.sleep(0.01)
+        return "slow"
+
+    @graph.stage("FAST", message="fast", percent=30, deps=("A",))
+    async def _fast(ctx):
+        # Only completes if SLOW is running at the same time.
+        await asyncio.wait_for(slow_started.wait(), timeout=1)
+        return ctx.results["A"] + 1
+
+    events = [(e.kind, e.stage) async for e in graph.run()]
+    assert events == [
+        ("start", "A"), ("done", "A"),
+        ("start", "SLOW"), ("progress", "SLOW"), ("done", "SLOW"),
+        ("start", "FAST"), ("done", "FAST"),
+    ]
+
+    failing = StageGraph()
+
+    @failing.stage("BOOM", message="boom", percent=0)
+    async def _boom(ctx):
+        raise RuntimeError("nope")
+
+    with pytest.raises(StageError) as exc_info:
+        async for _ in failing.run():
+            pass
+    assert exc_info.value.stage == "BOOM"
+
+
+def _sample_timeline() -> dict:
+    frames = []
+    for f in range(3):
+        participant_frames = {
+            str(pid): {
+                "totalGold": 500 + 100 * f * pid,
+                "xp": 50 * f * pid,
+                "position": {"x": 1000 * pid, "y": 500 + 1000 * f},
+            }
+            for pid in range(1, 11)
+        }
+        events = [
+            {"type": "CHAMPION_KILL", "timestamp": f * 60000 + 5, "killerId": 1, "victimId": 6,
+             "position": {"x": 7000, "y": 7000}},
+            {"type": "WARD_PLACED", "timestamp": f * 60000 + 7, "creatorId": 2, "wardType": "YELLOW_TRINKET"},
+            {"type": "ITEM_PURCHASED", "timestamp": f * 60000 + 9, "participantId": 3},
+        ]
+        frames.append({"timestamp": f * 60000, "participantFrames": participant_frames, "events": events})
+    return {"info": {"frames": frames}}
+
+
+def test_parse_timeline_arrays_and_metrics_accept_parsed_form():
+    from ml.timeline_analysis import (
+        analyze_match_timeline_series,
+        calculate_territory_metrics,
+        extract_heatmap_data,
+        extract_lane_lead_at_minute,
+    )
+    from ml.timeline_parsing import parse_timeline
+
+    raw = _sample_timeline()
+    parsed = parse_timeline(raw)
+    assert parsed.x.shape == (3, 10)
+    assert parsed.total_gold[2, 9] == 500 + 100 * 2 * 10
+    # Non-heatmap events are dropped; the ward keeps a zero position.
+    assert list(parsed.events.type) == ["CHAMPION_KILL", "WARD_PLACED"] * 3
+    assert parse_timeline({"info": {"frames": []}}) is None
+    # A position missing a coordinate sits on the map centre's, not the corner.
+    partial = parse_timeline({"info": {"frames": [{"participantFrames": {"1": {"position": {"x": 100}}}}]}})
+    assert (partial.x[0, 0], partial.y[0, 0]) == (100, 7250) and partial.has_position[0, 0]
+
+    assert extract_lane_lead_at_minute(parsed, 1, 6, 2) == (-1000, -500)
+    assert extract_lane_lead_at_minute(raw, 1, 6, 2) == (-1000, -500)
+    assert calculate_territory_metrics(parsed, 3, 100) == calculate_territory_metrics(raw, 3, 100)
+    assert analyze_match_timeline_series(parsed, 1, 6) == analyze_match_timeline_series(raw, 1, 6)
+
+    heatmap = extract_heatmap_data(parsed, {"info": {"participants": []}})
+    # Wards without a position fall back to the creator's frame position.
+    assert heatmap["ward_events"][0]["x"] == 2000
+    assert len(heatmap["kill_events"]) == 3
+    assert heatmap["participants"][0]["positions"][1]["goldDelta"] == 100
+
+
+def test_territory_metrics_all_matches_single_player_and_team_view():
+    from ml.timeline_analysis import (
+        calculate_territory_metrics,
+        calculate_territory_metrics_all,
+        team_territory_metrics,
+    )
+    from ml.timeline_parsing import parse_timeline
+
+    parsed = parse_timeline(_sample_timeline())
+    everyone = calculate_territory_metrics_all(parsed)
+    assert len(everyone) == 10
+    for pid in range(1, 11):
+        assert everyone[pid - 1] == calculate_territory_metrics(parsed, pid, 100 if pid <= 5 else 200)
+
+    teams = team_territory_metrics(everyone)
+    assert set(teams) == {100, 200}
+    assert set(teams[100]) == set(everyone[0])
+
+
+def test_extract_timeline_metrics_single_pass_matches_individual_functions():
+    from ml.timeline_analysis import (
+        analyze_match_timeline_series,
+        calculate_territory_metrics,
+        extract_lane_lead_at_minute,
+        extract_timeline_metrics,
+    )
+
+    raw = _sample_timeline()
+    out = extract_timeline_metrics(
+        raw,
+        ["lane_lead", "territory", "series", "heatmap"],
+        participant_id=1,
+        enemy_participant_id=6,
+        team_id=100,
+        match_data={"info": {"participants": []}},
+        lane_lead_minute=2,
+    )
+    assert out["lane_lead"] == extract_lane_lead_at_minute(raw, 1, 6, 2)
+    assert out["territory"] == calculate_territory_metrics(raw, 1, 100)
+    assert out["series"] == analyze_match_timeline_series(raw, 1, 6)
+    assert len(out["heatmap"]["participants"]) == 10
+
+    with pytest.raises(ValueError):
+        extract_timeline_metrics(raw, ["nope"])
+
+
+def test_frame_indices_and_batch_lane_leads():
+    import numpy as np
+
+    from ml.timeline_analysis import extract_lane_lead_at_minute, extract_lane_leads_at_minutes
+    from ml.timeline_parsing import frame_indices, parse_timeline
+
+    parsed = parse_timeline(_sample_timeline())
+    # Closest frame, ties to the earlier one, clamped at both ends.
+    assert frame_indices(parsed, [-5, 0, 30000, 30001, 61000, 10**9]).tolist() == [0, 0, 0, 1, 1, 2]
+    assert isinstance(frame_indices(parsed, 60000), np.ndarray)
+
+    leads = extract_lane_leads_at_minutes(parsed, 1, 6, (0, 1, 2, 20))
+    assert leads == {m: extract_lane_lead_at_minute(parsed, 1, 6, m) for m in (0, 1, 2, 20)}
+    assert extract_lane_leads_at_minutes(parsed, 1, 42, (5,)) == {5: None}
+
+
+def test_timeline_series_all_players_team_and_lane_deltas():
+    from ml.timeline_analysis import analyze_match_timeline_series, analyze_match_timeline_series_all
+
+    raw = _sample_timeline()
+    match_data = {"info": {"participants": [
+        {"participantId": pid, "teamId": 100 if pid <= 5 else 200,
+         "teamPosition": ["TOP", "JUNGLE", "MIDDLE", "BOTTOM", "UTILITY"][(pid - 1) % 5]}
+        for pid in range(1, 11)
+    ]}}
+    everyone = analyze_match_timeline_series_all(raw, match_data)
+    assert set(everyone) == set(range(1, 11))
+    assert everyone[1] == analyze_match_timeline_series(raw, 1, 6)
+
+    point = everyone[1]["timeline"][2]
+    # Blue side gold at frame 2 is 500 + 200 * pid for pids 1..5.
+    assert point["teamAvgGold"] == 500 + 200 * 3
+    assert point["teamGoldDelta"] == point["myGold"] - point["teamAvgGold"]
+    assert point["laneGoldDelta"] == point["myGold"] - everyone[6]["timeline"][2]["myGold"]
+
+
+def test_match_grid_entries_aggregate_by_range_with_side_flip():
+    import numpy as np
+
+    from ml.heatmap_encoding import aggregate_grid_entries, match_grid_entries
+
+    raw = _sample_timeline()
+    entries = match_grid_entries(raw, 16)
+    # All three frames fall in the "early" range: one position per frame per player.
+    blue = aggregate_grid_entries([(entries, [1], [6, 7, 8, 9, 10], False)], 16)
+    assert blue["player"].shape == (3, 16, 16)
+    assert blue["player"][0].sum() == 3 and blue["player"][1:].sum() == 0
+    assert blue["opponents"][0].sum() == 15
+
+    red = aggregate_grid_entries([(entries, [1], [6, 7, 8, 9, 10], True)], 16)
+    assert np.array_equal(red["player"][0], blue["player"][0][::-1, ::-1])
+
+    both = aggregate_grid_entries([(entries, [1], [6], False)] * 2, 16)
+    assert both["player"][0].sum() == 6
+
+
+@pytest.mark.anyio
+async def test_prefetch_timeline_persists_compact_form_and_shares_task(monkeypatch):
+    import asyncio
+
+    import numpy as np
+
+    import services.timelines as timelines
+    from ml.timeline_parsing import parse_timeline
+
+    raw = _sample_timeline()
+    calls = []
+    stored = []
+
+    class FakeRiot:
+        async def get_match_timeline(self, regional_routing, match_id):  # noqa: ANN001
+            calls.append((regional_routing, match_id))
+            return raw
+
+    class FakeSession:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):  # noqa: ANN002
+            return False
+
+        def add(self, row):  # noqa: ANN001
+            stored.append(row)
+
+        async def commit(self):
+            return None
+
+    monkeypatch.setattr(timelines, "riot_service", FakeRiot())
+    cache: dict = {}
+    sem = asyncio.Semaphore(1)
+    task = timelines.prefetch_timeline(cache, "europe", "EUW1_1", sem, session_factory=FakeSession)
+    assert timelines.prefetch_timeline(cache, "europe", "EUW1_1", sem, session_factory=FakeSession) is task
+    parsed = await cache["EUW1_1"]
+
+    assert calls == [("europe", "EUW1_1")]
+    assert [row.match_id for row in stored] == ["EUW1_1"]
+    expected = parse_timeline(raw)
+    assert np.array_equal(parsed.total_gold, expected.total_gold)
+
+    # The stored blob drops unused events but parses to the same arrays.
+    restored = timelines.decode_timeline(stored[0].data)
+    assert np.array_equal(restored.x, expected.x)
+    assert list(restored.events.type) == list(expected.events.type)
+    assert timelines.decode_timeline(b"garbage") is None
+
+
+@pytest.mark.anyio
+async def test_prefetch_timeline_logs_failures_nobody_awaits(monkeypatch, caplog):
+    import asyncio
+
+    import services.timelines as timelines
+
+    class FailingRiot:
+        async def get_match_timeline(self, regional_routing, match_id):  # noqa: ANN001
+            raise RuntimeError("Riot is down")
+
+    monkeypatch.setattr(timelines, "riot_service", FailingRiot())
+    with caplog.at_level("WARNING", logger="services.timelines"):
+        task = timelines.prefetch_timeline({}, "europe", "EUW1_1", asyncio.Semaphore(1))
+        await asyncio.wait({task})
+        await asyncio.sleep(0)  # let the done-callback run
+    assert "Timeline prefetch for EUW1_1 failed: Riot is down" in caplog.text
+
+
+@pytest.mark.anyio
+async def test_load_timeline_prefers_stored_row_and_stores_fetches(monkeypatch, session_factory):
+    import numpy as np
+
+    import services.timelines as timelines
+    from ml.timeline_parsing import parse_timeline
+    from models import MatchTimeline
+
+    raw = _sample_timeline()
+    calls = []
+
+    class FakeRiot:
+        async def get_match_timeline(self, regional_routing, match_id):  # noqa: ANN001
+            calls.append(match_id)
+            return raw if match_id != "EUW1_404" else None
+
+    monkeypatch.setattr(timelines, "riot_service", FakeRiot())
+    async with session_factory() as db:
+        db.add(MatchTimeline(match_id="EUW1_1", data=timelines.encode_timeline(raw)))
+        await db.commit()
+
+    expected = parse_timeline(raw)
+    stored = await timelines.load_timeline("EUW1_1", "europe", session_factory)
+    assert np.array_equal(stored.total_gold, expected.total_gold)
+    assert calls == []
+
+    # Missing rows are fetched once, then served from the table.
+    fetched = await timelines.load_timeline("EUW1_2", "europe", session_factory)
+    assert np.array_equal(fetched.x, expected.x)
+    await timelines.load_timeline("EUW1_2", "europe", session_factory)
+    assert calls == ["EUW1_2"]
+
+    # The analysis stages' timeline cache reads and fills the table too.
+    from routers.analysis import _fetch_timeline
+
+    await _fetch_timeline({}, "europe", "EUW1_1", session_factory=session_factory)
+    await _fetch_timeline({}, "europe", "EUW1_3", session_factory=session_factory)
+    await timelines.load_timeline("EUW1_3", "europe", session_factory)
+    assert calls == ["EUW1_2", "EUW1_3"]
+
+    assert await timelines.load_timeline("EUW1_404", "europe", session_factory) is None
+
+
+@pytest.mark.anyio
+async def test_seed_timeline_cache_drops_unreadable_rows(session_factory):
+    import numpy as np
+    from sqlalchemy import select
+
+    import services.timelines as timelines
+    from models import Match, MatchTimeline, Participant
+
+    raw = _sample_timeline()
+    async with session_factory() as db:
+        for i, blob in enumerate([timelines.encode_timeline(raw), b"garbage"]):
+            match_id = f"EUW1_{i}"
+            db.add(Match(match_id=match_id, game_creation=i, queue_id=420))
+            db.add(Participant(match_id=match_id, puuid="p", game_creation=i))
+            db.add(MatchTimeline(match_id=match_id, data=blob))
+        await db.commit()
+
+    cache = {}
+    async with session_factory() as db:
+        assert await timelines.seed_timeline_cache(db, "p", cache, 10) == 1
+    assert list(cache) == ["EUW1_0"]
+    assert np.array_equal((await cache["EUW1_0"]).x, timelines.decode_timeline(timelines.encode_timeline(raw)).x)
+
+    async with session_factory() as db:
+        stored = (await db.execute(select(MatchTimeline.match_id))).scalars().all()
+    assert stored == ["EUW1_0"]
+
+
+def _fake_match_dto(match_id: str, creation: int = 0):
+    participants = [
+        SimpleNamespace(
+            puuid=f"p{pid}", championId=pid, teamId=100 if pid <= 5 else 200, win=pid <= 5,
+            kills=1, deaths=2, assists=3, challenges=None, totalMinionsKilled=100,
+            visionScore=10.0, totalDamageDealtToChampions=1000,
+            model_dump=lambda pid=pid: {"participantId": pid},
+        )
+        for pid in range(1, 11)
+    ]
+    info = SimpleNamespace(
+        platformId="EUW1", gameCreation=creation, gameDuration=1800, gameVersion="14.1.1",
+        queueId=420, participants=participants,
+    )
+    return SimpleNamespace(
+        info=info,
+        metadata=SimpleNamespace(matchId=match_id),
+        model_dump=lambda: {"metadata": {"matchId": match_id}},
+    )
+
+
+@pytest.mark.anyio
+async def test_ingest_generator_batches_saves_and_streams_progress(monkeypatch, session_factory):
+    from sqlalchemy import func
+    from sqlalchemy.future import select
+
+    import services.ingestion as ingestion
+    from models import Match, Participant
+
+    match_ids = [f"EUW1_{i}" for i in range(7)]
+
+    class FakeRiot:
+        async def get_match_history(self, routing, puuid, count=20):  # noqa: ANN001
+            return match_ids
+
+        async def get_match_details(self, routing, match_id):  # noqa: ANN001
+            if match_id == "EUW1_3":
+                raise RuntimeError("boom")
+            return _fake_match_dto(match_id)
+
+    async def no_sleep(_):  # noqa: ANN001
+        return None
+
+    monkeypatch.setattr(ingestion, "riot_service", FakeRiot())
+    monkeypatch.setattr(ingestion.asyncio, "sleep", no_sleep)
+
+    async with session_factory() as db:
+        service = ingestion.IngestionService(db)
+        user = SimpleNamespace(region="euw1", puuid="p1")
+        updates = [u async for u in service.ingest_match_history_generator(user)]
+
+        assert updates[-1]["current"] == updates[-1]["total"] == 7
+        assert any("Failed to fetch EUW1_3" in u["status"] for u in updates)
+        assert (await db.execute(select(func.count()).select_from(Match))).scalar() == 6
+        assert (await db.execute(select(func.count()).select_from(Participant))).scalar() == 60
+
+        # A batch containing an already stored match falls back to per-match saves.
+        saved = await service.save_matches([_fake_match_dto("EUW1_0"), _fake_match_dto("EUW1_9")])
+        assert saved == {"EUW1_0", "EUW1_9"}
+        assert (await db.execute(select(func.count()).select_from(Match))).scalar() == 7
+
+        # The non-streaming entry point shares the core and reports a summary.
+        match_ids.extend(["EUW1_20", "EUW1_21"])
+        summary = await service.ingest_match_history(user)
+        assert summary.total == 9 and summary.cached == 6
+        assert sorted(summary.new_matches) == ["EUW1_20", "EUW1_21"]
+        assert summary.failed == {"EUW1_3": "boom"}
+
+
+@pytest.mark.anyio
+async def test_get_or_update_user_caches_hits_misses_and_refreshes_stale(monkeypatch, session_factory):
+    import asyncio
+    import datetime
+
+    from riotskillissue import NotFoundError
+    from sqlalchemy.future import select
+
+    import services.ingestion as ingestion
+    from models import User, utcnow
+    from services.user_cache import user_cache
+
+    calls = []
+    sessions = []
+
+    class FakeRiot:
+        async def get_account_by_riot_id(self, routing, game_name, tag_line):  # noqa: ANN001
+            calls.append(("account", game_name))
+            # The DB lookup's transaction is closed before Riot is called.
+            assert not any(s.in_transaction() for s in sessions)
+            if game_name == "Nobody":
+                raise NotFoundError("missing")
+            return SimpleNamespace(puuid="puuid-1", gameName=game_name, tagLine=tag_line)
+
+        async def get_summoner_by_puuid(self, platform, puuid):  # noqa: ANN001
+            calls.append(("summoner", platform))
+            return SimpleNamespace(profileIconId=7, summonerLevel=len(calls))
+
+    monkeypatch.setattr(ingestion, "riot_service", FakeRiot())
+    monkeypatch.setattr(ingestion, "AsyncSessionLocal", session_factory)
+    user_cache.clear()
+
+    async with session_factory() as db:
+        sessions.append(db)
+        service = ingestion.IngestionService(db)
+        user = await service.get_or_update_user("europe", "euw", "Faker", "KR1")
+        assert user.puuid == "puuid-1" and user.summoner_level == 2
+        # Case-insensitive cache hit: no DB or Riot round-trip.
+        assert await service.get_or_update_user("europe", "euw", "faker", "kr1") is user
+        assert await service.get_or_update_user("europe", "euw", "Nobody", "X") is None
+        assert await service.get_or_update_user("europe", "euw", "Nobody", "X") is None
+        assert calls == [("account", "Faker"), ("summoner", "euw1"), ("account", "Nobody")]
+
+        # A stale profile is returned immediately and refreshed in the background.
+        sessions.clear()  # the refresh uses its own session
+        await db.execute(User.__table__.update().values(
+            last_updated=utcnow() - datetime.timedelta(days=2)
+        ))
+        await db.commit()
+        user_cache.clear()
+        stale = await service.get_or_update_user("europe", "euw", "Faker", "KR1")
+        assert stale.summoner_level == 2
+        await asyncio.gather(*ingestion._refresh_tasks.values())
+
+        # The refresh re-resolves the Riot ID (call 4) before the summoner (call 5).
+        refreshed = await service.get_or_update_user("europe", "euw", "Faker", "KR1")
+        assert refreshed.summoner_level == 5
+        row = (await db.execute(select(User).execution_options(populate_existing=True))).scalar_one()
+        assert row.summoner_level == 5
+    user_cache.clear()
+
+
+@pytest.mark.anyio
+async def test_get_or_update_user_follows_renamed_and_reused_riot_ids(monkeypatch, session_factory):
+    import asyncio
+    import datetime
+
+    from sqlalchemy.future import select
+
+    import services.ingestion as ingestion
+    from models import User, utcnow
+    from services.user_cache import user_cache
+
+    owners = {"faker#kr1": "new-owner", "hide#kr1": "old-owner"}
+
+    class FakeRiot:
+        async def get_account_by_riot_id(self, routing, game_name, tag_line):  # noqa: ANN001
+            return SimpleNamespace(
+                puuid=owners[f"{game_name}#{tag_line}".lower()], gameName=game_name, tagLine=tag_line,
+            )
+
+        async def get_summoner_by_puuid(self, platform, puuid):  # noqa: ANN001
+            return SimpleNamespace(profileIconId=1, summonerLevel=30)
+
+    monkeypatch.setattr(ingestion, "riot_service", FakeRiot())
+    monkeypatch.setattr(ingestion, "AsyncSessionLocal", session_factory)
+    user_cache.clear()
+
+    stale = utcnow() - datetime.timedelta(days=2)
+    async with session_factory() as db:
+        # "old-owner" used to be Faker#KR1 and has since renamed to Hide#KR1;
+        # "new-owner" took Faker#KR1 and is not stored yet.
+        db.add(User(puuid="old-owner", game_name="Faker", tag_line="KR1", normalized_name="faker",
+                    normalized_tag="kr1", region="kr", last_updated=stale))
+        # Case-variant duplicate left with NULL keys by the 0002 migration.
+        db.add(User(puuid="dup", game_name="hide", tag_line="kr2", region="kr", last_updated=stale))
+        await db.commit()
+
+        service = ingestion.IngestionService(db)
+        # The stored row answers first; the background refresh notices the new owner.
+        assert (await service.get_or_update_user("asia", "kr", "Faker", "KR1")).puuid == "old-owner"
+        await asyncio.gather(*ingestion._refresh_tasks.values())
+        assert (await service.get_or_update_user("asia", "kr", "Faker", "KR1")).puuid == "new-owner"
+
+        # The renamed account is found under its new Riot ID (puuid conflict on insert).
+        renamed = await service.get_or_update_user("asia", "kr", "Hide", "KR1")
+        assert (renamed.puuid, renamed.game_name) == ("old-owner", "Hide")
+
+        # A NULL-keyed duplicate gets its keys once resolved through Riot.
+        owners["hide#kr2"] = "dup"
+        assert (await service.get_or_update_user("asia", "kr", "Hide", "KR2")).puuid == "dup"
+
+        rows = (await db.execute(
+            select(User.puuid, User.normalized_name, User.normalized_tag)
+            .order_by(User.puuid)
+            .execution_options(populate_existing=True)
+        )).all()
+        assert [tuple(r) for r in rows] == [
+            ("dup", "hide", "kr2"), ("new-owner", "faker", "kr1"), ("old-owner", "hide", "kr1"),
+        ]
+    user_cache.clear()
+
+
+@pytest.mark.anyio
+async def test_user_riot_id_migration_backfills_and_dedupes(sqlite_engine):
+    from sqlalchemy import text
+
+    from init_db import _upgrade
+
+    async with sqlite_engine.connect() as conn:
+        # Pre-migration schema with two case variants of the same Riot ID.
+        await conn.execute(text(
+            "CREATE TABLE users (puuid VARCHAR PRIMARY KEY, game_name VARCHAR, tag_line VARCHAR, "
+            "region VARCHAR, profile_icon_id INTEGER, summoner_level INTEGER, last_updated DATETIME)"
+        ))
+        await conn.execute(text(
+            "INSERT INTO users (puuid, game_name, tag_line, region, last_updated) VALUES "
+            "('a', 'Faker', 'KR1', 'kr', '2024-01-01'), ('b', 'faker', 'kr1', 'kr', '2024-06-01'), "
+            "('c', 'Ümit', 'TR1', 'tr', NULL)"
+        ))
+        await conn.commit()
+        await conn.run_sync(_upgrade, "head")
+        # Revisions are idempotent: replaying them on an unstamped database is a no-op.
+        await conn.execute(text("DROP TABLE alembic_version"))
+        await conn.commit()
+        await conn.run_sync(_upgrade, "head")
+
+        rows = (await conn.execute(text(
+            "SELECT puuid, normalized_name, normalized_tag FROM users ORDER BY puuid"
+        ))).fetchall()
+        assert [tuple(r) for r in rows] == [("a", None, None), ("b", "faker", "kr1"), ("c", "ümit", "tr1")]
+        with pytest.raises(Exception):
+            await conn.execute(text(
+                "INSERT INTO users (puuid, region, normalized_name, normalized_tag) VALUES ('d', 'kr', 'faker', 'kr1')"
+            ))
+
+
+@pytest.mark.anyio
+async def test_participant_game_creation_migration_backfills_in_batches(monkeypatch, sqlite_engine):
+    from sqlalchemy import text
+
+    import migrations.ops
+    from init_db import _upgrade
+
+    monkeypatch.setattr(migrations.ops, "BACKFILL_BATCH_SIZE", 2)
+    async with sqlite_engine.connect() as conn:
+        # Pre-migration schema: ordering data only on matches.
+        await conn.execute(text(
+            "CREATE TABLE matches (match_id VARCHAR PRIMARY KEY, game_creation BIGINT, queue_id INTEGER)"
+        ))
+        await conn.execute(text(
+            "CREATE TABLE participants (id INTEGER PRIMARY KEY, match_id VARCHAR, puuid VARCHAR)"
+        ))
+        await conn.execute(text("INSERT INTO matches VALUES ('m1', 100, 420), ('m2', 200, 440)"))
+        await conn.execute(text(
+            "INSERT INTO participants (match_id, puuid) VALUES "
+            "('m1', 'p'), ('gone', 'p'), ('m2', 'p'), ('m2', 'q'), ('m1', 'q')"
+        ))
+        await conn.commit()
+        await conn.run_sync(_upgrade, "head")
+
+        rows = (await conn.execute(text(
+            "SELECT match_id, puuid, game_creation, queue_id FROM participants ORDER BY id"
+        ))).fetchall()
+        assert [tuple(r) for r in rows] == [
+            ("m1", "p", 100, 420), ("gone", "p", None, None), ("m2", "p", 200, 440),
+            ("m2", "q", 200, 440), ("m1", "q", 100, 420),
+        ]
+
+        plan = " ".join(str(r[-1]) for r in (await conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT match_id FROM participants "
+            "WHERE puuid = 'p' ORDER BY game_creation DESC LIMIT 20"
+        ))).fetchall())
+        assert "idx_participant_puuid_creation" in plan
+        assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.anyio
+async def test_migrations_match_models(sqlite_engine):
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+
+    from database import Base
+    from init_db import _upgrade
+
+    async with sqlite_engine.connect() as conn:
+        await conn.run_sync(_upgrade, "head")
+        diff = await conn.run_sync(
+            lambda sync_conn: compare_metadata(MigrationContext.configure(sync_conn), Base.metadata)
+        )
+    assert diff == []
+
+
+@pytest.mark.anyio
+async def test_league_snapshots_skip_fresh_calls_and_record_history(session_factory):
+    import datetime
+
+    from models import LeagueSnapshot, utcnow
+    from services.league import get_league_entries, league_history
+
+    lp = [20]
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return [{"queueType": "RANKED_SOLO_5x5", "tier": "GOLD", "rank": "IV",
+                 "leaguePoints": lp[0], "wins": 10, "losses": 8}]
+
+    first = await get_league_entries("p", fetch, session_factory)
+    assert first[0]["leaguePoints"] == 20
+    # Fresh snapshot: no second call.
+    assert (await get_league_entries("p", fetch, session_factory))[0]["leaguePoints"] == 20
+    assert len(calls) == 1
+
+    async def expire():
+        async with session_factory() as session:
+            await session.execute(LeagueSnapshot.__table__.update().values(
+                checked_at=utcnow() - datetime.timedelta(days=1)
+            ))
+            await session.commit()
+
+    # Stale and unchanged: the row is re-confirmed, not duplicated.
+    await expire()
+    await get_league_entries("p", fetch, session_factory)
+    # Stale and changed: a new history point.
+    await expire()
+    lp[0] = 41
+    assert (await get_league_entries("p", fetch, session_factory))[0]["leaguePoints"] == 41
+    assert len(calls) == 3
+
+    async with session_factory() as session:
+        history = await league_history(session, "p", "RANKED_SOLO_5x5")
+    assert [h["leaguePoints"] for h in history] == [20, 41]
+
+
+@pytest.mark.anyio
+async def test_league_snapshots_remember_unranked_and_survive_errors(session_factory):
+    import datetime
+
+    from models import LeagueSnapshot, utcnow
+    from services.league import get_league_entries
+
+    answers = [[], None, [{"queueType": "RANKED_FLEX_SR", "tier": "IRON", "rank": "I",
+                           "leaguePoints": 5, "wins": 1, "losses": 0}]]
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        answer = answers[len(calls) - 1]
+        if answer is None:
+            raise RuntimeError("rate limited")
+        return answer
+
+    async def expire():
+        async with session_factory() as session:
+            await session.execute(LeagueSnapshot.__table__.update().values(
+                checked_at=utcnow() - datetime.timedelta(days=1)
+            ))
+            await session.commit()
+
+    # Unranked is stored, so a repeat analysis does not ask Riot again.
+    assert await get_league_entries("p", fetch, session_factory) == []
+    assert await get_league_entries("p", fetch, session_factory) == []
+    assert len(calls) == 1
+
+    # A failed refresh serves the stored answer and stores nothing.
+    await expire()
+    assert await get_league_entries("p", fetch, session_factory) == []
+    assert len(calls) == 2
+
+    # Newly ranked: the entries replace the marker as the current answer.
+    flex = await get_league_entries("p", fetch, session_factory)
+    assert flex[0]["tier"] == "IRON"
+    assert (await get_league_entries("p", fetch, session_factory))[0]["tier"] == "IRON"
+    assert len(calls) == 3
+
+
+@pytest.mark.anyio
+async def test_league_lookup_overlaps_ingestion_and_rechecks_after_it(session_factory, monkeypatch):
+    import asyncio
+
+    import services.league as league_mod
+    from models import utcnow
+
+    match_end = [None]
+
+    async def fake_latest_match_end(session, puuid):
+        return match_end[0]
+
+    monkeypatch.setattr(league_mod, "_latest_match_end", fake_latest_match_end)
+
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return [{"queueType": "RANKED_SOLO_5x5", "tier": "GOLD", "rank": "IV",
+                 "leaguePoints": 10 * len(calls), "wins": 10, "losses": 8}]
+
+    class Ingestion(asyncio.Event):
+        """Records when the lookup starts waiting for ingestion."""
+
+        def __init__(self):
+            super().__init__()
+            self.waiting = asyncio.Event()
+
+        async def wait(self):
+            self.waiting.set()
+            return await super().wait()
+
+    # Stale snapshots: Riot is asked before ingestion has finished.
+    ingested = Ingestion()
+    lookup = asyncio.ensure_future(league_mod.get_league_entries("p", fetch, session_factory, ingested))
+    await asyncio.wait_for(ingested.waiting.wait(), 5)
+    await asyncio.sleep(0)
+    assert len(calls) == 1 and not lookup.done()
+    ingested.set()
+    assert (await lookup)[0]["leaguePoints"] == 10
+
+    # Fresh snapshot, but ingestion brings in a game that ended after it.
+    ingested = Ingestion()
+    lookup = asyncio.ensure_future(league_mod.get_league_entries("p", fetch, session_factory, ingested))
+    await asyncio.wait_for(ingested.waiting.wait(), 5)
+    assert len(calls) == 1
+    match_end[0] = utcnow()
+    ingested.set()
+    assert (await lookup)[0]["leaguePoints"] == 20
+    assert len(calls) == 2
+
+
+@pytest.mark.anyio
+async def test_tiered_riot_cache_per_endpoint_ttl_and_disk_warmup(tmp_path):
+    from riotskillissue import MemoryCache
+
+    from services.metrics import RIOT_CACHE_REQUESTS_TOTAL
+    from services.riot_cache import SQLiteCache, TieredCache, policy_for
+
+    timeline_key = "GET:/lol/match/v5/matches/EUW1_1/timeline:europe:"
+    league_key = "GET:/lol/league/v4/entries/by-puuid/abc:euw1:"
+    assert policy_for(timeline_key).endpoint == "match.timeline"
+    assert policy_for("GET:/lol/match/v5/matches/EUW1_1:europe:").endpoint == "match"
+    assert policy_for("GET:/lol/match/v5/matches/by-puuid/abc/ids:europe:[('count', 20)]").endpoint == "match.ids"
+    assert policy_for("ddragon:version") is None
+
+    disk = SQLiteCache(str(tmp_path / "riot_cache.db"))
+    response = (200, {"content-type": "application/json"}, b'{"info": {}}')
+    warm = TieredCache(MemoryCache(), [("disk", disk)])
+    await warm.set(timeline_key, response, ttl=60)
+    await warm.set(league_key, response, ttl=60)
+
+    # A cold worker: immutable responses come from disk, short-lived ones do not.
+    before = RIOT_CACHE_REQUESTS_TOTAL.value(endpoint="match.timeline", result="disk")
+    cold = TieredCache(MemoryCache(), [("disk", SQLiteCache(str(tmp_path / "riot_cache.db")))])
+    assert await cold.get(timeline_key) == response
+    assert await cold.get(league_key) is None
+    assert RIOT_CACHE_REQUESTS_TOTAL.value(endpoint="match.timeline", result="disk") == before + 1
+    # Promoted into memory on the first hit.
+    assert await cold.memory.get(timeline_key) == response
+
+    # League answers are never cached; account lookups never reach disk.
+    account_key = "GET:/riot/account/v1/accounts/by-riot-id/Faker/KR1:asia:"
+    await warm.set(account_key, response, ttl=3600)
+    assert await warm.get(league_key) is None
+    assert await warm.memory.get(account_key) == response
+    assert await disk.get(account_key) is None
+
+
+@pytest.mark.anyio
+async def test_riot_disk_cache_is_opt_in_and_bounded(tmp_path, monkeypatch):
+    from services.riot_cache import SQLiteCache, build_cache
+
+    monkeypatch.delenv("RIOT_DISK_CACHE_PATH", raising=False)
+    assert build_cache().persistent == []
+    monkeypatch.setenv("RIOT_DISK_CACHE_PATH", str(tmp_path / "riot_cache.db"))
+    assert [name for name, _ in build_cache().persistent] == ["disk"]
+
+    disk = SQLiteCache(str(tmp_path / "bounded.db"), max_rows=3)
+    disk._PRUNE_EVERY = 5
+    response = (200, {}, b"{}")
+    for i in range(5):
+        await disk.set(f"GET:/lol/match/v5/matches/EUW1_{i}:europe:", response, ttl=60 + i)
+    # The rows closest to expiry go first.
+    assert await disk.get("GET:/lol/match/v5/matches/EUW1_0:europe:") is None
+    assert await disk.get("GET:/lol/match/v5/matches/EUW1_4:europe:") == response
+    count = disk._connection().execute("SELECT COUNT(*) FROM http_cache").fetchone()[0]
+    assert count == 3
+
+
+def test_db_pool_settings_validation(monkeypatch, caplog):
+    import database
+
+    monkeypatch.setenv("DB_POOL_SIZE", "abc")
+    with pytest.raises(ValueError):
+        database._env_int("DB_POOL_SIZE", 5, 1)
+    monkeypatch.setenv("DB_POOL_SIZE", "0")
+    with pytest.raises(ValueError):
+        database._env_int("DB_POOL_SIZE", 5, 1)
+
+    with caplog.at_level("WARNING", logger="database"):
+        assert database.check_pool_capacity(5, 20, 3) == 20
+        assert not caplog.records
+        assert database.check_pool_capacity(2, 2, 10) == 10 * database.SESSIONS_PER_ANALYSIS - 2
+    assert "MAX_CONCURRENT_ANALYSES=10" in caplog.text
+
+
+@pytest.mark.anyio
+async def test_sqlite_performance_mode_sets_pragmas(tmp_path):
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    import database
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'perf.db'}")
+    database.enable_sqlite_performance_mode(engine)
+    try:
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+            assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1  # NORMAL
+            assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() > 0
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_retention_strips_json_then_archives_old_matches(session_factory):
+    from sqlalchemy import func
+    from sqlalchemy.future import select
+
+    from models import Match, MatchArchive, MatchTimeline, Participant, ParticipantArchive
+    from services.retention import DAY_MS, RetentionPolicy, match_data_from_participants, run_retention
+
+    now = 1_760_000_000_000
+    ages = {"new": 1, "stale": 40, "old": 400}
+    async with session_factory() as db:
+        for match_id, days in ages.items():
+            created = now - days * DAY_MS
+            db.add(Match(match_id=match_id, game_creation=created, queue_id=420, data={"info": {}}))
+            db.add(MatchTimeline(match_id=match_id, data=b"blob"))
+            for pid, puuid in ((2, "q"), (1, "p")):
+                db.add(Participant(match_id=match_id, puuid=puuid, game_creation=created,
+                                   stats_json={"participantId": pid, "kills": 1}))
+        await db.commit()
+
+    policy = RetentionPolicy(strip_json_after_days=30, archive_after_days=365, batch_size=1)
+    summary = await run_retention(policy, session_factory, now_ms=now)
+    assert (summary.stripped, summary.archived) == (2, 1)
+
+    async with session_factory() as db:
+        matches = {m.match_id: m for m in (await db.execute(select(Match))).scalars()}
+        assert set(matches) == {"new", "stale"}
+        assert matches["new"].data == {"info": {}} and matches["stale"].data is None
+        timelines = (await db.execute(select(MatchTimeline.match_id))).scalars().all()
+        assert timelines == ["new"]
+        stats = (await db.execute(
+            select(Participant.stats_json).where(Participant.match_id == "stale")
+        )).scalars().all()
+        assert sorted(s["participantId"] for s in stats) == [1, 2]
+        # Timeline views rebuild the participant list of stripped matches.
+        rebuilt = await match_data_from_participants(db, ["stale", "old"])
+        assert rebuilt == {"stale": {"info": {"participants": [
+            {"participantId": 1, "kills": 1}, {"participantId": 2, "kills": 1},
+        ]}}}
+
+        archived = (await db.execute(select(MatchArchive))).scalars().all()
+        assert [(a.match_id, a.data) for a in archived] == [("old", None)]
+        assert (await db.execute(
+            select(func.count()).select_from(ParticipantArchive).where(ParticipantArchive.match_id == "old")
+        )).scalar() == 2
+        assert (await db.execute(
+            select(func.count()).select_from(Participant).where(Participant.match_id == "old")
+        )).scalar() == 0
+
+    # Nothing left to do on a second run.
+    summary = await run_retention(policy, session_factory, now_ms=now)
+    assert (summary.stripped, summary.archived) == (0, 0)
+
+
+@pytest.mark.anyio
+async def test_retention_skips_while_another_run_holds_the_lock():
+    from services.retention import RETENTION_LOCK_ID, RetentionPolicy, run_retention
+
+    executed = []
+
+    class _Conn:
+        dialect = SimpleNamespace(name="postgresql")
+
+        async def execute(self, statement, params=None):  # noqa: ANN001
+            executed.append((str(statement), params))
+            return SimpleNamespace(scalar=lambda: False)
+
+    class _Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):  # noqa: ANN002
+            return False
+
+        async def connection(self):
+            return _Conn()
+
+    summary = await run_retention(RetentionPolicy(strip_json_after_days=30), _Session)
+    assert summary.skipped and summary.stripped == 0
+    assert executed == [("SELECT pg_try_advisory_xact_lock(:id)", {"id": RETENTION_LOCK_ID})]
+
+
+@pytest.mark.anyio
+async def test_instrument_engine_times_statements_after_failures(sqlite_engine):
+    from sqlalchemy import text
+    from sqlalchemy.exc import IntegrityError
+
+    from services.metrics import DB_QUERY_SECONDS, instrument_engine
+
+    instrument_engine(sqlite_engine)
+    before = DB_QUERY_SECONDS.count(statement="SELECT")
+    async with sqlite_engine.connect() as conn:
+        await conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY)"))
+        await conn.execute(text("INSERT INTO t VALUES (1)"))
+        with pytest.raises(IntegrityError):
+            await conn.execute(text("INSERT INTO t VALUES (1)"))
+        await conn.execute(text("SELECT id FROM t"))
+        assert "_query_start" not in conn.sync_connection.info
+    assert DB_QUERY_SECONDS.count(statement="SELECT") == before + 1
+
+
+def test_month_partitions_cover_range_in_utc_months():
+    from services.retention import month_partitions
+
+    dec_15 = 1_734_220_800_000  # 2024-12-15T00:00Z
+    feb_01 = 1_738_368_000_000  # 2025-02-01T00:00Z
+    parts = month_partitions("participants", dec_15, feb_01)
+    assert [name for name, _, _ in parts] == [
+        "participants_p2024_12", "participants_p2025_01", "participants_p2025_02",
+    ]
+    assert parts[0][1] == 1_733_011_200_000  # 2024-12-01
+    assert all(parts[i][2] == parts[i + 1][1] for i in range(len(parts) - 1))
+
+
+@pytest.mark.anyio
+async def test_parquet_export_matches_player_features(tmp_path, session_factory):
+    pytest.importorskip("pyarrow")
+    import pyarrow.dataset as ds
+
+    from ml.parquet_export import export_features, patch_of
+    from ml.pipeline import load_player_data
+    from models import Match, Participant
+
+    games = [("m1", "14.1.553.1", 420), ("m2", "14.2.1.1", 420), ("m3", "14.2.9.9", 440)]
+    async with session_factory() as db:
+        for i, (match_id, version, queue) in enumerate(games):
+            created = 1_700_000_000_000 + i
+            db.add(Match(
+                match_id=match_id, game_creation=created, game_duration=1800,
+                game_version=version, queue_id=queue, data={"info": {"participants": []}},
+            ))
+            for pid in range(1, 11):
+                stats = {"championName": "Ahri", "kills": pid, "deaths": 2, "assists": 3,
+                         "challenges": {"skillshotsHit": 5, "soloKills": 1}}
+                db.add(Participant(
+                    match_id=match_id, puuid=f"p{pid}", team_id=100 if pid <= 5 else 200,
+                    win=pid <= 5, kills=pid, deaths=2, assists=3, game_creation=created,
+                    queue_id=queue, stats_json=stats,
+                ))
+        db.add(Participant(match_id="m1", puuid="nostats", game_creation=1_700_000_000_000, stats_json=None))
+        await db.commit()
+
+    out = tmp_path / "export"
+    summary = await export_features(str(out), session_factory, batch_size=2, rows_per_file=4)
+    assert (summary.matches, summary.rows, summary.skipped) == (3, 30, 1)
+    assert {p.relative_to(out).parts[:2] for p in out.rglob("*.parquet")} == {
+        ("patch=14.1", "queue=420"), ("patch=14.2", "queue=420"), ("patch=14.2", "queue=440"),
+    }
+
+    table = ds.dataset(str(out), format="parquet", partitioning="hive").to_table()
+    assert table.num_rows == 30
+    exported = table.to_pandas()
+    exported = exported[exported["puuid"] == "p3"].sort_values("gameCreation", ascending=False)
+    async with session_factory() as db:
+        expected = await load_player_data(db, "p3")
+    assert list(exported["match_id"]) == list(expected["match_id"])
+    for column in ("kda", "kills", "skillshotsHit", "aggressionScore", "win"):
+        assert list(exported[column].astype(float)) == list(expected[column].astype(float))
+
+    with pytest.raises(FileExistsError):
+        await export_features(str(out), session_factory)
+    assert patch_of(None) == "unknown"
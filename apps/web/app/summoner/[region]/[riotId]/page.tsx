@@ -2,8 +2,8 @@
 
 import { useEffect, useState } from "react";
 import { useParams } from "next/navigation";
-import { analyzeStats } from "@/lib/api";
-import type { AnalyzeProgressUpdate } from "@/lib/analysisContract";
+import { analyzeStats, fetchMatchHeatmap } from "@/lib/api";
+import type { AnalyzeProgressUpdate, HeatmapData } from "@/lib/analysisContract";
 import {
     ArrowLeft, Trophy, Skull, Crown, Flame, HeartCrack, Umbrella,
     Baby, UserX, Swords, Castle, Wheat, Eye, EyeOff, Coins, Shield, Target,
@@ -155,6 +155,7 @@ export default function Dashboard() {
     const [error, setError] = useState<string | null>(null);
     const [activeTab, setActiveTab] = useState<"overview" | "match" | "trends" | "heatmap" | "ai">("overview");
     const [rankEmblemErrored, setRankEmblemErrored] = useState(false);
+    const [lazyHeatmap, setLazyHeatmap] = useState<HeatmapData | null>(null);
 
     useEffect(() => {
         async function fetchData() {
@@ -176,6 +177,16 @@ export default function Dashboard() {
         setRankEmblemErrored(false);
     }, [data?.ranked_data?.tier]);
 
+    // Heatmaps are not part of the analysis payload; fetch them the first time the tab opens.
+    useEffect(() => {
+        if (activeTab !== "heatmap" || lazyHeatmap || data?.heatmap_data || !data?.last_match_id) return;
+        let cancelled = false;
+        fetchMatchHeatmap(data.last_match_id)
+            .then((h) => { if (!cancelled) setLazyHeatmap(h); })
+            .catch(() => {});
+        return () => { cancelled = true; };
+    }, [activeTab, data?.last_match_id, data?.heatmap_data, lazyHeatmap]);
+
     // Derived formatting helpers
     const fmt = (val: any, decimals = 1) => typeof val === 'number' ? val.toFixed(decimals) : "0";
     const fmtSigned = (val: unknown) => {
@@ -565,7 +576,7 @@ export default function Dashboard() {
                     {activeTab === "heatmap" && (
                         <div className="space-y-8 animate-in fade-in slide-in-from-bottom duration-500">
                             <HeatmapVisualization
-                                heatmapData={heatmap_data}
+                                heatmapData={heatmap_data ?? lazyHeatmap}
                                 ddragonVersion={ddragon_version}
                             />
                         </div>
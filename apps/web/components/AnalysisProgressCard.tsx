@@ -20,9 +20,9 @@ type StageDef = {
 const STAGES: StageDef[] = [
     // Setup
     { id: "find", label: "Finding Account", stage: "FIND_ACCOUNT", minPercent: 0, group: "setup" },
-    { id: "rank", label: "Fetching Ranked Info", stage: "FETCH_RANKED", minPercent: 8, group: "setup" },
     // Data
     { id: "history", label: "Loading Match History", stage: "MATCH_HISTORY", minPercent: 10, group: "data" },
+    { id: "rank", label: "Fetching Ranked Info", stage: "FETCH_RANKED", minPercent: 71, group: "data" },
     { id: "load", label: "Loading Match Data", stage: "LOAD_MATCH_DATA", minPercent: 72, group: "data" },
     // Analysis
     { id: "train", label: "Training AI Model", stage: "TRAIN_MODEL", minPercent: 75, group: "analysis" },
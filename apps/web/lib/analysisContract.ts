@@ -96,6 +96,7 @@ export type AnalysisResult = {
     ranked_data: RankedData | null;
     ddragon_version: string;
     heatmap_data: HeatmapData | null;
+    last_match_id: string | null;
 };
 
 const toNum = (v: unknown, fallback: number) => {
@@ -157,5 +158,6 @@ export function normalizeAnalysisResult(raw: unknown): AnalysisResult {
         ranked_data: parseRankedData(data.ranked_data),
         ddragon_version: typeof data.ddragon_version === 'string' ? data.ddragon_version : '14.24.1',
         heatmap_data: (data.heatmap_data && typeof data.heatmap_data === 'object') ? (data.heatmap_data as HeatmapData) : null,
+        last_match_id: typeof data.last_match_id === 'string' ? data.last_match_id : null,
     };
 }
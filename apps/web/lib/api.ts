@@ -1,10 +1,11 @@
-import type { AnalyzeProgressUpdate, AnalysisResult, RiotApiLimits, QueueStats } from "./analysisContract";
+import type { AnalyzeProgressUpdate, AnalysisResult, HeatmapData, RiotApiLimits, QueueStats } from "./analysisContract";
 import { normalizeAnalysisResult } from "./analysisContract";
 
 const API_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000/api";
 
 type AnalyzeStreamEvent =
     | { type: "progress"; message: string; percent: number; stage?: string; limits?: RiotApiLimits; queue?: QueueStats; queuePosition?: number }
+    | { type: "partial"; section: string; data: unknown }
     | { type: "result"; data: unknown }
     | { type: "error"; message: string };
 
@@ -64,6 +65,11 @@ function parseAnalyzeEvent(line: string): AnalyzeStreamEvent | undefined {
             return { type: 'error', message: event.message };
         }
 
+        if (event.type === 'partial') {
+            if (typeof event.section !== 'string') return undefined;
+            return { type: 'partial', section: event.section, data: event.data };
+        }
+
         if (event.type === 'result') {
             return { type: 'result', data: event.data };
         }
@@ -77,7 +83,8 @@ function parseAnalyzeEvent(line: string): AnalyzeStreamEvent | undefined {
 export async function analyzeStats(
     riotId: string,
     region: string,
-    onProgress?: (progress: AnalyzeProgressUpdate) => void
+    onProgress?: (progress: AnalyzeProgressUpdate) => void,
+    onPartial?: (section: string, data: unknown) => void
 ): Promise<AnalysisResult> {
 
     try {
@@ -87,7 +94,8 @@ export async function analyzeStats(
                 "Content-Type": "application/json",
             },
             cache: "no-store",
-            body: JSON.stringify({ riot_id: riotId, region }),
+            // The heatmap tab loads its data lazily via fetchMatchHeatmap.
+            body: JSON.stringify({ riot_id: riotId, region, include_heatmap: false }),
         });
 
         if (!response.ok) {
@@ -128,6 +136,8 @@ export async function analyzeStats(
                         queue: event.queue,
                         queuePosition: event.queuePosition,
                     });
+                } else if (event.type === "partial" && onPartial) {
+                    onPartial(event.section, event.data);
                 } else if (event.type === "result") {
                     return normalizeAnalysisResult(event.data);
                 } else if (event.type === "error") {
@@ -154,6 +164,76 @@ export async function analyzeStats(
     }
 }
 
+type EncodedColumn = { dtype: "int16" | "int32"; delta: boolean; length: number; data: string };
+
+function decodeColumn(column: EncodedColumn | undefined): number[] {
+    if (!column || !column.data) return [];
+    const bytes = Uint8Array.from(atob(column.data), (c) => c.charCodeAt(0));
+    const view = column.dtype === "int32"
+        ? new Int32Array(bytes.buffer, 0, bytes.byteLength / 4)
+        : new Int16Array(bytes.buffer, 0, bytes.byteLength / 2);
+    const out = Array.from(view);
+    if (column.delta) {
+        for (let i = 1; i < out.length; i++) out[i] += out[i - 1];
+    }
+    return out;
+}
+
+function decodeColumnarHeatmap(raw: any): HeatmapData | null {
+    if (!raw || typeof raw !== 'object' || raw.format !== 'columnar') return null;
+
+    const participants = (raw.participants ?? []).map((p: any) => {
+        const cols = p.columns ?? {};
+        const ts = decodeColumn(cols.timestamp);
+        const xs = decodeColumn(cols.x);
+        const ys = decodeColumn(cols.y);
+        const gold = decodeColumn(cols.totalGold);
+        const goldDelta = decodeColumn(cols.goldDelta);
+        return {
+            participantId: p.participantId,
+            championName: p.championName,
+            teamId: p.teamId,
+            positions: ts.map((timestamp, i) => ({
+                x: xs[i], y: ys[i], timestamp, totalGold: gold[i], goldDelta: goldDelta[i],
+            })),
+        };
+    });
+
+    const kills = raw.kill_events?.columns ?? {};
+    const killTs = decodeColumn(kills.timestamp);
+    const killXs = decodeColumn(kills.x);
+    const killYs = decodeColumn(kills.y);
+    const killers = decodeColumn(kills.killerId);
+    const victims = decodeColumn(kills.victimId);
+    const assists: number[][] = raw.kill_events?.assistingParticipantIds ?? [];
+
+    const wards = raw.ward_events?.columns ?? {};
+    const wardTypes: string[] = raw.ward_events?.wardTypes ?? [];
+    const wardTs = decodeColumn(wards.timestamp);
+    const wardXs = decodeColumn(wards.x);
+    const wardYs = decodeColumn(wards.y);
+    const creators = decodeColumn(wards.creatorId);
+    const wardTypeIdx = decodeColumn(wards.wardType);
+
+    return {
+        participants,
+        kill_events: killTs.map((timestamp, i) => ({
+            x: killXs[i], y: killYs[i], killerId: killers[i], victimId: victims[i],
+            assistingParticipantIds: assists[i] ?? [], timestamp,
+        })),
+        ward_events: wardTs.map((timestamp, i) => ({
+            x: wardXs[i], y: wardYs[i], wardType: wardTypes[wardTypeIdx[i]] ?? "UNDEFINED",
+            creatorId: creators[i], timestamp,
+        })),
+    };
+}
+
+export async function fetchMatchHeatmap(matchId: string): Promise<HeatmapData | null> {
+    const res = await fetch(`${API_URL}/matches/${encodeURIComponent(matchId)}/heatmap`);
+    if (!res.ok) return null;
+    return decodeColumnarHeatmap(await res.json());
+}
+
 export async function coachAnalysis(systemPrompt: string, userPrompt: string): Promise<string> {
     const res = await fetch(`${API_URL}/coach`, {
         method: "POST",